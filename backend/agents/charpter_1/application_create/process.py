@@ -1,45 +1,34 @@
-import time
-from http.client import HTTPException
 import asyncio
-import httpx
-from fastapi import FastAPI, Request
 import uvicorn
-from backend.baseagent import BaseAgent
+from functools import lru_cache
+from backend.baseagent import PromptAgent
+from backend.agents.runtime import AgentService
+from backend.logging_setup import configure_logging
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
-agent = BaseAgent(
-    name="Charpter1Agent",
-    role="assistant",
-    system_prompt="你是一个专业的医疗器械注册助手。",
-    model_type="qwen"
-)
+@lru_cache(maxsize=None)
+def get_agent() -> PromptAgent:
+    # 首次使用时才构建智能体，模块导入保持轻量
+    return PromptAgent(
+        name="Charpter1Agent",
+        role="assistant",
+        system_prompt="你是一个专业的医疗器械注册助手。",
+        model_type="qwen"
+    )
+
+async def run(data):
+    # 进程内入口：agent_url.json 配置为 "python:backend.agents.charpter_1.application_create.process:run" 时由后端直接调用
+    await asyncio.sleep(5)
+    return {"status": "completed", "file_url": "www.111.com"}
 
 async def background_task(data):
-    try:
-        async with httpx.AsyncClient(timeout=100.0) as client:
-            await asyncio.sleep(5)
-            logger.info(f"Connecting to {data}")
-            url = f"{data["callback_url"]}?token={data['token']}"
-            response = await client.post(url=url, json={"subtask_id":"1","status":"completed","file_url":"www.111.com"})
-            response.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        raise HTTPException()
-    except Exception as e:
-        raise HTTPException()
-
-
-@app.post("/agent")
-async def do_task(request: Request):
-    data = await request.json()
+    service.report(data, {"subtask_id": service.subtask_id, **await run(data)})
 
-    response = {"status": "accepted"}
-    asyncio.create_task(background_task(data))
-    return response
+service = AgentService("application_create", background_task, subtask_id="1", preload=lambda: get_agent().preload())
+app = service.app
 
 if __name__ == "__main__":
+    configure_logging()
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,334 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "10.0"))
+CALLBACK_BATCH_SIZE = int(os.getenv("CALLBACK_BATCH_SIZE", "32"))
+CALLBACK_BASE_DELAY = float(os.getenv("CALLBACK_BASE_DELAY", "0.5"))
+CALLBACK_MAX_DELAY = float(os.getenv("CALLBACK_MAX_DELAY", "60.0"))
+# 超过次数或自入队起超过时长仍未送达的回调放弃，避免接收方长期不可用时无限重试
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", "20"))
+CALLBACK_MAX_AGE_SECONDS = float(os.getenv("CALLBACK_MAX_AGE_SECONDS", "86400"))
+# journal 组提交间隔：期间的追加合并成一次写入 + fsync，在线程中完成
+CALLBACK_JOURNAL_FLUSH_INTERVAL = float(os.getenv("CALLBACK_JOURNAL_FLUSH_INTERVAL", "0.05"))
+
+logger = logging.getLogger(__name__)
+
+
+class CallbackOutbox:
+    """
+    agent 完成回调的可靠发件箱：
+    - 入队即追加写本地 journal（put/ack 记录），进程重启后重放未确认的回调；
+    - 同一子任务（回调 URL 去掉 query）的多次更新合并，只投递最新一条；
+    - 复用一个 keep-alive 客户端，按批并发投递，失败按带抖动的指数退避重试；
+    - 4xx（408/429 除外）以及非网络错误（URL 无效等）视为不可重试，记录后丢弃；
+    - 重试超过 max_attempts 次或入队超过 max_age 秒仍未送达的回调同样记录后丢弃。
+    生成流程只做一次内存写入，不等待网络也不等待磁盘：启动后 journal 由后台任务按
+    flush_interval 组提交，写入、fsync 与压缩都在线程中执行；未启动时同步追加。
+    """
+
+    def __init__(
+        self,
+        journal_path: str,
+        batch_size: int = CALLBACK_BATCH_SIZE,
+        timeout: float = CALLBACK_TIMEOUT,
+        base_delay: float = CALLBACK_BASE_DELAY,
+        max_delay: float = CALLBACK_MAX_DELAY,
+        client: Optional[httpx.AsyncClient] = None,
+        flush_interval: float = CALLBACK_JOURNAL_FLUSH_INTERVAL,
+        max_attempts: int = CALLBACK_MAX_ATTEMPTS,
+        max_age: float = CALLBACK_MAX_AGE_SECONDS,
+    ):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.max_age = max_age
+
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.client = client
+        self._owns_client = client is None
+        self._journal = None
+        self._seq = 0
+        self._acks_since_compact = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._journal_buffer: List[str] = []
+        self._journal_dirty: Optional[asyncio.Event] = None
+        self._journal_task: Optional[asyncio.Task] = None
+        self._compact_requested = False
+        self._closing = False
+        self.counters = {"enqueued": 0, "coalesced": 0, "delivered": 0, "retried": 0, "dropped": 0}
+
+    @staticmethod
+    def subtask_key(url: str) -> str:
+        return url.split("?", 1)[0]
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._replay()
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.batch_size, max_keepalive_connections=self.batch_size)
+            )
+        self._wakeup = asyncio.Event()
+        if self.pending:
+            logger.info("Replaying %s pending callbacks from %s", len(self.pending), self.journal_path)
+            self._wakeup.set()
+        self._closing = False
+        self._journal_dirty = asyncio.Event()
+        self._journal_task = asyncio.create_task(self._journal_writer())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        if self._task is None:
+            return
+        if self.pending:
+            try:
+                await asyncio.wait_for(self.flush(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("%s callbacks still pending at shutdown, kept in journal", len(self.pending))
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        # 写完缓冲中的记录再关闭 journal
+        self._closing = True
+        self._journal_dirty.set()
+        await asyncio.gather(self._journal_task, return_exceptions=True)
+        self._journal_task = None
+        if self._owns_client and self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def enqueue(self, url: str, payload: Dict[str, Any]):
+        key = self.subtask_key(url)
+        self._seq += 1
+        # created_at 用墙钟时间并写入 journal，重启重放后年龄仍然连续
+        created_at = time.time()
+        entry = {
+            "key": key, "url": url, "payload": payload, "seq": self._seq, "created_at": created_at,
+            "attempts": 0, "next_at": 0.0, "sending": False
+        }
+        if key in self.pending:
+            self.counters["coalesced"] += 1
+        self.pending[key] = entry
+        self.counters["enqueued"] += 1
+        self._append({"op": "put", "key": key, "url": url, "payload": payload, "seq": self._seq, "created_at": created_at})
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        while self.pending:
+            await self._deliver_due(force=True)
+            if self.pending:
+                await asyncio.sleep(self.base_delay)
+
+    async def _run(self):
+        while True:
+            try:
+                delay = self._next_delay()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        # asyncio.timeout 不会像 wait_for 那样在唤醒与取消同时发生时吞掉取消
+                        async with asyncio.timeout(delay):
+                            await self._wakeup.wait()
+                    except TimeoutError:
+                        pass
+                    continue
+                await self._deliver_due()
+            except Exception:
+                # 投递循环退出后回调会静默停止，任何意外都只记录并继续
+                logger.exception("Callback outbox loop failed, continuing")
+                await asyncio.sleep(self.base_delay)
+
+    def _next_delay(self) -> float:
+        waiting = [entry["next_at"] for entry in self.pending.values() if not entry["sending"]]
+        if not waiting:
+            return 3600.0
+        return max(0.0, min(waiting) - time.monotonic())
+
+    async def _deliver_due(self, force: bool = False):
+        now = time.monotonic()
+        due: List[Dict[str, Any]] = []
+        for entry in self.pending.values():
+            if entry["sending"]:
+                continue
+            if force or entry["next_at"] <= now:
+                entry["sending"] = True
+                due.append(entry)
+                if len(due) >= self.batch_size:
+                    break
+        if due:
+            await asyncio.gather(*(self._deliver(entry) for entry in due))
+
+    async def _deliver(self, entry: Dict[str, Any]):
+        status = None
+        try:
+            response = await self.client.post(entry["url"], json=entry["payload"])
+            status = response.status_code
+        except httpx.RequestError as e:
+            logger.warning("Callback to %s failed: %s", entry['key'], e)
+        except Exception:
+            # URL 无效、payload 无法编码等，重试也不会成功
+            logger.exception("Callback to %s cannot be sent, dropping", entry['key'])
+            self.counters["dropped"] += 1
+            self._ack(entry)
+            return
+        finally:
+            entry["sending"] = False
+
+        if status is not None and status < 400:
+            self.counters["delivered"] += 1
+            self._ack(entry)
+        elif status is not None and status < 500 and status not in (408, 429):
+            self.counters["dropped"] += 1
+            logger.error("Callback to %s rejected with %s, dropping", entry['key'], status)
+            self._ack(entry)
+        elif entry["attempts"] + 1 >= self.max_attempts or time.time() - entry["created_at"] >= self.max_age:
+            self.counters["dropped"] += 1
+            logger.error(
+                "Callback to %s gave up after %s attempts (last status %s), dropping payload %s",
+                entry['key'], entry["attempts"] + 1, status, entry["payload"]
+            )
+            self._ack(entry)
+        else:
+            self.counters["retried"] += 1
+            entry["attempts"] += 1
+            backoff = min(self.max_delay, self.base_delay * (2 ** entry["attempts"]))
+            entry["next_at"] = time.monotonic() + random.uniform(0, backoff)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _ack(self, entry: Dict[str, Any]):
+        current = self.pending.get(entry["key"])
+        # 投递期间被更新的子任务不确认，最新一条会在下一轮投递
+        if current is not entry:
+            return
+        del self.pending[entry["key"]]
+        self._append({"op": "ack", "key": entry["key"], "seq": entry["seq"]})
+        self._acks_since_compact += 1
+        if self._acks_since_compact >= 1000 and self._acks_since_compact > 2 * len(self.pending):
+            if self._journal_task is None:
+                self._compact()
+            else:
+                self._compact_requested = True
+                self._journal_dirty.set()
+
+    def _append(self, record: Dict[str, Any]):
+        # 在调用方序列化：payload 无法编码时立即报错，而不是在后台写入时
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if self._journal_task is None:
+            self._write_lines([line], fsync=False)
+            return
+        self._journal_buffer.append(line)
+        self._journal_dirty.set()
+
+    async def _journal_writer(self):
+        while True:
+            await self._journal_dirty.wait()
+            if not self._closing:
+                await asyncio.sleep(self.flush_interval)
+            self._journal_dirty.clear()
+            try:
+                await self._sync_journal()
+            except Exception:
+                logger.exception("Failed to write callback journal %s", self.journal_path)
+                await asyncio.sleep(self.base_delay)
+                self._journal_dirty.set()
+            if self._closing and not self._journal_dirty.is_set():
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                return
+
+    async def _sync_journal(self):
+        # 快照与缓冲在事件循环中取出，线程只负责磁盘 IO；同一时刻只有这一个写入者
+        if self._compact_requested:
+            self._compact_requested = False
+            self._journal_buffer.clear()
+            await asyncio.to_thread(self._rewrite, self._snapshot())
+        elif self._journal_buffer:
+            lines, self._journal_buffer = self._journal_buffer, []
+            await asyncio.to_thread(self._write_lines, lines)
+
+    def _write_lines(self, lines: List[str], fsync: bool = True):
+        if self._journal is None:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.writelines(lines)
+        self._journal.flush()
+        if fsync:
+            os.fsync(self._journal.fileno())
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时可能留下半行，忽略
+                    continue
+                self._seq = max(self._seq, record.get("seq", 0))
+                if record["op"] == "put":
+                    self.pending[record["key"]] = {
+                        "key": record["key"], "url": record["url"], "payload": record["payload"],
+                        "seq": record["seq"], "created_at": record.get("created_at", time.time()),
+                        "attempts": 0, "next_at": 0.0, "sending": False
+                    }
+                elif record["op"] == "ack":
+                    current = self.pending.get(record["key"])
+                    if current is not None and current["seq"] == record["seq"]:
+                        del self.pending[record["key"]]
+        self._compact()
+
+    def _snapshot(self) -> List[str]:
+        self._acks_since_compact = 0
+        return [
+            json.dumps(
+                {
+                    "op": "put", "key": entry["key"], "url": entry["url"], "payload": entry["payload"],
+                    "seq": entry["seq"], "created_at": entry["created_at"]
+                },
+                ensure_ascii=False
+            ) + "\n"
+            for entry in self.pending.values()
+        ]
+
+    def _compact(self):
+        self._rewrite(self._snapshot())
+
+    def _rewrite(self, lines: List[str]):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self.pending), **self.counters}
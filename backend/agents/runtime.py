@@ -0,0 +1,292 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import FastAPI, Request, Header, HTTPException
+from fastapi.responses import JSONResponse
+
+from backend.agents.outbox import CallbackOutbox
+from backend.artifact_store import artifact_store
+from backend.metrics import registry, metrics_endpoint
+from backend.tracing import tracer, with_traceparent
+from backend.deadline import deadline_scope
+from backend.logging_setup import configure_logging
+
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "100"))
+AGENT_PROCESS_WORKERS = int(os.getenv("AGENT_PROCESS_WORKERS", "0"))
+AGENT_PRELOAD = os.getenv("AGENT_PRELOAD", "0") == "1"
+CALLBACK_JOURNAL_DIR = os.getenv("CALLBACK_JOURNAL_DIR", "outbox")
+# 记住最近取消的 task_id，取消请求先于派发到达或任务仍在排队时据此跳过
+AGENT_CANCELLED_MEMORY = int(os.getenv("AGENT_CANCELLED_MEMORY", "4096"))
+
+logger = logging.getLogger(__name__)
+
+agent_jobs = registry.counter("agent_jobs_total", "Agent jobs by outcome", ("agent", "outcome"))
+agent_job_latency = registry.histogram("agent_job_duration_seconds", "Agent handler run time", ("agent",))
+agent_queue_wait = registry.histogram("agent_queue_wait_seconds", "Time jobs spend queued before a worker picks them up", ("agent",))
+agent_queue_depth = registry.gauge("agent_queue_depth", "Jobs waiting in the agent queue", ("agent",))
+agent_in_flight = registry.gauge("agent_in_flight", "Jobs currently running", ("agent",))
+
+
+class AgentService:
+    """
+    agent 服务的公共运行时：/agent 请求进入有界队列，由固定数量的 worker 执行 handler，
+    队列满时返回 429 和当前队列深度作为背压；CPU 密集的文档渲染可交给可选的进程池。
+    POST /cancel 取消某个任务排队中与执行中的 job；payload 带 deadline 时 handler 在截止时间被取消，
+    进行中的 LLM 请求与流随之中止。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        workers: int = AGENT_WORKERS,
+        queue_size: int = AGENT_QUEUE_SIZE,
+        process_workers: int = AGENT_PROCESS_WORKERS,
+        preload: Optional[Callable[[], Any]] = None,
+        outbox: Optional[CallbackOutbox] = None,
+        subtask_id: Optional[str] = None,
+    ):
+        self.name = name
+        # 回调中的子任务 id（后端的 agent 类型），成功与失败回调必须一致
+        self.subtask_id = subtask_id or name
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.process_workers = process_workers
+        self.preload = preload
+        self.outbox = outbox or CallbackOutbox(os.path.join(CALLBACK_JOURNAL_DIR, f"{name}.jsonl"))
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self.in_flight = 0
+        self.counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        self.running: Dict[str, Set[asyncio.Task]] = {}
+        self.cancelled: Dict[str, None] = {}
+
+        self.app = FastAPI(lifespan=self._lifespan)
+        self.app.state.agent_service = self
+        self.app.add_api_route("/agent", self.accept, methods=["POST"])
+        self.app.add_api_route("/cancel", self.cancel, methods=["POST"])
+        self.app.add_api_route("/health", self.health, methods=["GET"])
+        self.app.add_api_route("/stats", self.stats, methods=["GET"])
+        self.app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+        self.app.add_api_route("/traces", self.traces, methods=["GET"], include_in_schema=False)
+
+        self._jobs = {outcome: agent_jobs.labels(name, outcome) for outcome in ("accepted", "rejected", "completed", "failed", "cancelled")}
+        self._job_latency = agent_job_latency.labels(name)
+        self._queue_wait = agent_queue_wait.labels(name)
+        agent_queue_depth.labels(name).set_function(lambda: self.queue.qsize() if self.queue else 0)
+        agent_in_flight.labels(name).set_function(lambda: self.in_flight)
+
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        configure_logging()
+        self.start()
+        if self.preload and AGENT_PRELOAD:
+            await asyncio.to_thread(self.preload)
+        try:
+            yield
+        finally:
+            await self.stop()
+
+    def start(self):
+        if self.queue is not None:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.outbox.start()
+        if self.process_workers > 0:
+            self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Agent service %s started: %s workers, queue size %s", self.name, self.workers, self.queue_size)
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        await self.outbox.stop()
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+        self.queue = None
+
+    def submit(self, data: Dict[str, Any]) -> Optional[int]:
+        """
+        入队一个任务，返回入队后的排队位置；队列已满返回 None。
+        """
+        self.start()
+        try:
+            self.queue.put_nowait((time.perf_counter(), data))
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            self._jobs["rejected"].inc()
+            return None
+        self.counters["accepted"] += 1
+        self._jobs["accepted"].inc()
+        return self.queue.qsize()
+
+    async def _worker(self, index: int):
+        while True:
+            enqueued_at, data = await self.queue.get()
+            started = time.perf_counter()
+            self._queue_wait.observe(started - enqueued_at)
+            self.in_flight += 1
+            try:
+                with tracer.span("agent.job", parent=data.get("traceparent"), service=self.name,
+                                 task_id=data.get("task_id"), queue_wait_ms=round((started - enqueued_at) * 1000, 3)) as span:
+                    try:
+                        await self._execute(data)
+                        self.counters["completed"] += 1
+                        self._jobs["completed"].inc()
+                    except asyncio.CancelledError:
+                        if asyncio.current_task().cancelling():
+                            # worker 本身被停止
+                            raise
+                        span.set("cancelled", True)
+                        self._count_cancelled(data, "cancelled")
+                    except TimeoutError as e:
+                        if not self._past_deadline(data):
+                            # handler 自身的超时，按失败处理
+                            self._fail(data, span, e)
+                        else:
+                            span.set("deadline_exceeded", True)
+                            self._count_cancelled(data, "deadline exceeded")
+                    except Exception as e:
+                        self._fail(data, span, e)
+            finally:
+                self._job_latency.observe(time.perf_counter() - started)
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def _fail(self, data: Dict[str, Any], span, e: Exception):
+        span.error = f"{type(e).__name__}: {e}"
+        self.counters["failed"] += 1
+        self._jobs["failed"].inc()
+        logger.error("Agent service %s job for task %s failed: %s", self.name, data.get('task_id'), e)
+        # 让后端与 SSE 订阅方知道该子任务失败，而不是一直等待
+        if data.get("callback_url"):
+            self.report(data, {"subtask_id": self.subtask_id, "status": "failed"})
+
+    async def _execute(self, data: Dict[str, Any]):
+        """
+        handler 在独立的子任务中执行，/cancel 只取消这个 job 而不影响 worker；
+        排队期间已被取消或已过截止时间的 job 不再执行。
+        """
+        task_id = data.get("task_id")
+        deadline = data.get("deadline")
+        if task_id in self.cancelled:
+            raise asyncio.CancelledError()
+        if self._past_deadline(data):
+            raise TimeoutError()
+        job = asyncio.create_task(self._call(data, deadline))
+        self.running.setdefault(task_id, set()).add(job)
+        try:
+            await job
+        finally:
+            jobs = self.running.get(task_id)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    del self.running[task_id]
+
+    @staticmethod
+    def _past_deadline(data: Dict[str, Any]) -> bool:
+        deadline = data.get("deadline")
+        return deadline is not None and deadline <= time.time()
+
+    async def _call(self, data: Dict[str, Any], deadline: Optional[float]):
+        async with deadline_scope(deadline):
+            await self.handler(data)
+
+    def _count_cancelled(self, data: Dict[str, Any], reason: str):
+        self.counters["cancelled"] += 1
+        self._jobs["cancelled"].inc()
+        # 后端已把子任务标记为 cancelled，这里不再回调
+        logger.info("Agent service %s job for task %s stopped: %s", self.name, data.get('task_id'), reason)
+
+    def cancel_task(self, task_id: str) -> int:
+        """
+        取消该任务执行中的 job，并记住 task_id 让仍在排队或稍后才到达的 job 直接跳过；返回被中断的 job 数。
+        """
+        self.cancelled[task_id] = None
+        while len(self.cancelled) > AGENT_CANCELLED_MEMORY:
+            del self.cancelled[next(iter(self.cancelled))]
+        jobs = self.running.get(task_id, ())
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def report(self, data: Dict[str, Any], payload: Dict[str, Any]):
+        """
+        通过发件箱异步回调后端（立即返回，投递与重试在后台完成）。
+        """
+        url = data["callback_url"]
+        if data.get("token"):
+            url = f"{url}{'&' if '?' in url else '?'}token={data['token']}"
+        # 在 job 的 span 内调用时，回调挂到该 span 下
+        self.outbox.enqueue(with_traceparent(url), payload)
+
+    async def publish(self, chunks: Iterable[bytes], filename: str, content_type: Optional[str] = None) -> str:
+        """
+        把生成的文件写入内容寻址存储，返回可作为 file_url 回调的下载地址；重复生成相同内容不会重复落盘。
+        """
+        artifact = await asyncio.to_thread(artifact_store.put_chunks, chunks, filename, content_type)
+        return artifact_store.url(artifact.digest)
+
+    async def run_in_process(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在进程池中执行 CPU 密集函数（未配置进程池时退化为线程池），fn 及参数需可 pickle。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.process_pool, functools.partial(fn, *args, **kwargs))
+
+    async def accept(self, request: Request):
+        data = await request.json()
+        position = self.submit(data)
+        if position is None:
+            logger.warning("Agent service %s queue full, rejecting task %s", self.name, data.get('task_id'))
+            return JSONResponse(
+                status_code=429,
+                content={"status": "rejected", "detail": "Agent queue is full", "queue_depth": self.queue.qsize()},
+                headers={"Retry-After": "1"}
+            )
+        return {"status": "accepted", "queue_position": position}
+
+    async def cancel(self, request: Request):
+        data = await request.json()
+        task_id = data.get("task_id")
+        if not task_id:
+            raise HTTPException(status_code=400, detail="task_id is required")
+        interrupted = self.cancel_task(task_id)
+        logger.info("Agent service %s cancelled task %s (%s running jobs interrupted)", self.name, task_id, interrupted)
+        return {"status": "ok", "interrupted": interrupted}
+
+    async def traces(self, trace_id: Optional[str] = None, limit: int = 50, x_admin_token: Optional[str] = Header(None)):
+        admin_key = os.getenv("ADMIN_SECRET_KEY")
+        if not admin_key or x_admin_token != admin_key:
+            raise HTTPException(status_code=403, detail="Admin token required")
+        if trace_id:
+            return {"trace_id": trace_id, "spans": tracer.export(trace_id, limit)}
+        return {"traces": tracer.traces(limit), **tracer.counters}
+
+    async def health(self):
+        return {"status": "ok"}
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "agent": self.name,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_capacity": self.queue_size,
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            **self.counters,
+            "outbox": self.outbox.stats()
+        }
@@ -0,0 +1,211 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import logging
+import mimetypes
+import asyncio
+import tempfile
+from typing import AsyncIterable, Dict, Iterable, Optional
+
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", "artifacts")
+ARTIFACT_BASE_URL = os.getenv("ARTIFACT_BASE_URL", "http://localhost:8000")
+ARTIFACT_RETENTION_DAYS = float(os.getenv("ARTIFACT_RETENTION_DAYS", "30"))
+# HTTP 上传的大小上限（字节）
+ARTIFACT_MAX_UPLOAD_BYTES = int(os.getenv("ARTIFACT_MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/xml", "application/javascript")
+MIN_COMPRESS_SIZE = 1024
+# 异步写入时攒够这么多字节再交给线程写盘，避免每个小块一次线程切换
+WRITE_BUFFER_SIZE = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactTooLarge(ValueError):
+    pass
+
+
+class Artifact:
+    __slots__ = ("digest", "size", "filename", "content_type", "created")
+
+    def __init__(self, digest: str, size: int, filename: str, content_type: str, created: float):
+        self.digest = digest
+        self.size = size
+        self.filename = filename
+        self.content_type = content_type
+        self.created = created
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class ArtifactStore:
+    """
+    按内容哈希（sha256）存放生成产物：相同内容只存一份，重复写入只刷新保留时间；
+    所有写入先落临时文件再 rename，保证原子性；可压缩的类型额外保存 .gz 预压缩副本；
+    按最后写入时间做保留期回收。
+    """
+
+    def __init__(self, root: str = ARTIFACT_ROOT, base_url: str = ARTIFACT_BASE_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self._tmp_dir = os.path.join(root, "tmp")
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def url(self, digest: str) -> str:
+        return f"{self.base_url}/api/artifacts/{digest}"
+
+    @staticmethod
+    def valid_digest(digest: str) -> bool:
+        return bool(DIGEST_PATTERN.match(digest))
+
+    def meta(self, digest: str) -> Optional[Artifact]:
+        if not self.valid_digest(digest):
+            return None
+        try:
+            with open(self.path(digest) + ".json", "r", encoding="utf-8") as f:
+                return Artifact(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def compressed_path(self, digest: str) -> Optional[str]:
+        path = self.path(digest) + ".gz"
+        return path if os.path.exists(path) else None
+
+    def _open_tmp(self):
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def _commit(self, tmp_path: str, digest: str, size: int, filename: str, content_type: Optional[str], compress: Optional[bool]) -> Artifact:
+        target = self.path(digest)
+        existing = self.meta(digest)
+        if existing is not None and os.path.exists(target):
+            os.unlink(tmp_path)
+            now = time.time()
+            os.utime(target, (now, now))
+            return existing
+
+        content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+        if compress is None:
+            compress = size >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES)
+        if compress:
+            self._write_compressed(target)
+
+        artifact = Artifact(digest, size, filename, content_type, time.time())
+        handle, meta_tmp = self._open_tmp()
+        with handle:
+            handle.write(json.dumps(artifact.to_dict(), ensure_ascii=False).encode("utf-8"))
+        # 元数据最后落盘：有 .json 即代表对象完整可读
+        os.replace(meta_tmp, target + ".json")
+        return artifact
+
+    def _write_compressed(self, target: str):
+        handle, tmp_path = self._open_tmp()
+        with handle, open(target, "rb") as source, gzip.GzipFile(fileobj=handle, mode="wb", compresslevel=9, mtime=0) as gz:
+            for block in iter(lambda: source.read(1 << 16), b""):
+                gz.write(block)
+        os.replace(tmp_path, target + ".gz")
+
+    def put_chunks(self, chunks: Iterable[bytes], filename: str, content_type: Optional[str] = None, compress: Optional[bool] = None) -> Artifact:
+        """
+        边写临时文件边计算哈希，可直接接 DocxTemplate.iter_render() 的输出。
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        handle, tmp_path = self._open_tmp()
+        try:
+            with handle:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    handle.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return self._commit(tmp_path, hasher.hexdigest(), size, filename, content_type, compress)
+
+    async def aput_chunks(self, chunks: AsyncIterable[bytes], filename: str, content_type: Optional[str] = None,
+                          compress: Optional[bool] = None, max_size: Optional[int] = None) -> Artifact:
+        """
+        异步版本：读取在事件循环中进行，哈希、写盘与压缩都在线程中完成，不阻塞事件循环。
+        超过 max_size 字节时丢弃临时文件并抛出 ArtifactTooLarge。
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        handle, tmp_path = await asyncio.to_thread(self._open_tmp)
+
+        def write(blocks):
+            for block in blocks:
+                hasher.update(block)
+                handle.write(block)
+
+        try:
+            with handle:
+                buffered, buffered_size = [], 0
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise ArtifactTooLarge(f"artifact exceeds {max_size} bytes")
+                    buffered.append(chunk)
+                    buffered_size += len(chunk)
+                    if buffered_size >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(write, buffered)
+                        buffered, buffered_size = [], 0
+                await asyncio.to_thread(write, buffered)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return await asyncio.to_thread(self._commit, tmp_path, hasher.hexdigest(), size, filename, content_type, compress)
+
+    def put_bytes(self, data: bytes, filename: str, content_type: Optional[str] = None, compress: Optional[bool] = None) -> Artifact:
+        return self.put_chunks((data,), filename, content_type, compress)
+
+    def put_file(self, path: str, filename: Optional[str] = None, content_type: Optional[str] = None, compress: Optional[bool] = None) -> Artifact:
+        with open(path, "rb") as source:
+            return self.put_chunks(iter(lambda: source.read(1 << 16), b""), filename or os.path.basename(path), content_type, compress)
+
+    def gc(self, retention_seconds: float = ARTIFACT_RETENTION_DAYS * 86400) -> int:
+        """
+        删除超过保留期未被重新写入的产物及其元数据 / 预压缩副本，返回删除的对象数。
+        """
+        cutoff = time.time() - retention_seconds
+        removed = 0
+        objects = os.path.join(self.root, "objects")
+        if not os.path.isdir(objects):
+            return 0
+        for shard in os.scandir(objects):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not self.valid_digest(entry.name) or entry.stat().st_mtime >= cutoff:
+                    continue
+                # 先删元数据，使对象立即不可见
+                for suffix in (".json", ".gz", ""):
+                    try:
+                        os.unlink(entry.path + suffix)
+                    except FileNotFoundError:
+                        pass
+                removed += 1
+        if os.path.isdir(self._tmp_dir):
+            for entry in os.scandir(self._tmp_dir):
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+        if removed:
+            logger.info("Artifact GC removed %s objects older than %.0fs", removed, retention_seconds)
+        return removed
+
+
+artifact_store = ArtifactStore()
+
+if __name__ == "__main__":
+    print(f"removed {artifact_store.gc()} artifacts")
@@ -1,10 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional, Union, AsyncGenerator
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Union, AsyncGenerator
 from pydantic import BaseModel, Field
+import json
 import logging
 import asyncio
 
-from backend.llm import LLM
+from backend.llm import LLM, ChatStream
+from backend.llm_router import LLMRouter
+from backend.memory import ConversationMemory, MemoryPolicy, MemoryStore
+
+# 当前调用所属的会话（task_id 等），run/arun 期间设置，observe 中的 remember 据此写入对应记忆
+_current_session: ContextVar[Optional[str]] = ContextVar("agent_session", default=None)
+# 未指定会话的调用各自使用一份临时记忆，并发调用之间互不串话
+_current_memory: ContextVar[Optional[ConversationMemory]] = ContextVar("agent_memory", default=None)
 
 
 class BaseAgent(BaseModel, ABC):
@@ -18,23 +27,31 @@ class BaseAgent(BaseModel, ABC):
     stream: bool = False
     debug: bool = True
 
-    memory: List[Dict[str, str]] = Field(default_factory=list)
-    llm: Optional[LLM] = None
+    memory_budget: int = 4096
+    memory_policy: MemoryPolicy = MemoryPolicy.pin_system
+    memory_summarizer: Optional[Callable[[List[Dict[str, str]]], str]] = None
+    memory_exact_tokens: bool = False
+    max_sessions: int = 1024
+
+    sessions: Optional[MemoryStore] = None
+    llm: Optional[Union[LLM, LLMRouter]] = None
+    logger: Optional[logging.Logger] = None
 
     class Config:
         arbitrary_types_allowed = True
 
     def __init__(self, **data: Any):
         super().__init__(**data)
-        self.llm = LLM(model_type=self.model_type, config_path=self.config_path)
+        if self.model_type == "router":
+            self.llm = LLMRouter(config_path=self.config_path)
+        else:
+            self.llm = LLM(model_type=self.model_type, config_path=self.config_path)
         self.llm.stream = self.stream
         self.llm.debug = self.debug
 
+        self.sessions = MemoryStore(self._new_memory, max_sessions=self.max_sessions)
+
         self.logger = logging.getLogger(self.__class__.__name__)
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-            self.logger.addHandler(handler)
         self.logger.setLevel(logging.DEBUG if self.debug else logging.INFO)
 
     @abstractmethod
@@ -51,26 +68,58 @@ class BaseAgent(BaseModel, ABC):
     def enable_tools(self, tools: List[Dict], tool_choice: Optional[str] = None):
         self.llm.enable_function_calling(tools, tool_choice)
 
-    def remember(self, role: str, content: str):
-        self.memory.append({"role": role, "content": content})
-
-    def clear_memory(self):
-        self.memory.clear()
-
-    def run(self, input_data: Any, stream: Optional[bool] = None, **kwargs) -> Dict[str, Any]:
-        messages = self.build_prompt(input_data)
-        self.memory.extend(messages)
-        use_stream = stream if stream is not None else self.stream
-
-        if use_stream:
-            output = self._run_stream(messages)
-            return {"text": output}
+    def _new_memory(self) -> ConversationMemory:
+        return ConversationMemory(
+            token_budget=self.memory_budget,
+            policy=self.memory_policy,
+            count_tokens=self.llm.count_tokens if self.memory_exact_tokens else None,
+            summarizer=self.memory_summarizer,
+        )
+
+    def memory_for(self, session_id: Optional[str] = None) -> ConversationMemory:
+        """
+        记忆只按会话保存：指定会话时返回该会话的记忆；没有会话时为当前 run / arun 调用的临时记忆，调用结束即丢弃。
+        """
+        session_id = session_id if session_id is not None else _current_session.get()
+        if session_id is not None:
+            return self.sessions.get(session_id)
+        memory = _current_memory.get()
+        if memory is None:
+            raise ValueError("没有 session_id 时记忆只存在于单次 run / arun 调用内")
+        return memory
+
+    def _call_memory(self, session_id: Optional[str]) -> ConversationMemory:
+        return self.sessions.get(session_id) if session_id is not None else self._new_memory()
+
+    def remember(self, role: str, content: str, session_id: Optional[str] = None):
+        self.memory_for(session_id).append({"role": role, "content": content})
+
+    def clear_memory(self, session_id: Optional[str] = None):
+        if session_id is None:
+            self.sessions.clear()
         else:
-            response = self.llm.ask_sync(messages, **kwargs)
-            output = response.get("text", "")
-            output = self.postprocess(output)
-            self.observe(output, response)
-            return response
+            self.sessions.drop(session_id)
+
+    def run(self, input_data: Any, stream: Optional[bool] = None, session_id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        token = _current_session.set(session_id)
+        memory_token = _current_memory.set(self._call_memory(session_id))
+        try:
+            messages = self.build_prompt(input_data)
+            self.memory_for().extend(messages)
+            use_stream = stream if stream is not None else self.stream
+
+            if use_stream:
+                output = self._run_stream(messages)
+                return {"text": output}
+            else:
+                response = self.llm.ask_sync(messages, **kwargs)
+                output = response.get("text", "")
+                output = self.postprocess(output)
+                self.observe(output, response)
+                return response
+        finally:
+            _current_memory.reset(memory_token)
+            _current_session.reset(token)
 
     def _run_stream(self, messages: List[Dict[str, str]]) -> str:
         output = ""
@@ -81,21 +130,43 @@ class BaseAgent(BaseModel, ABC):
         self.observe(output, {"text": output})
         return output
 
-    async def arun(self, input_data: Any, **kwargs) -> Dict[str, Any]:
+    async def arun(self, input_data: Any, session_id: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        token = _current_session.set(session_id)
+        memory_token = _current_memory.set(self._call_memory(session_id))
+        try:
+            messages = self.build_prompt(input_data)
+            self.memory_for().extend(messages)
+            response = await self.llm.ask(messages, **kwargs)
+            output = response.get("text", "")
+            output = self.postprocess(output)
+            self.observe(output, response)
+            return response
+        finally:
+            _current_memory.reset(memory_token)
+            _current_session.reset(token)
+
+    def open_stream(self, input_data: Any, session_id: Optional[str] = None, **kwargs) -> ChatStream:
+        """
+        返回可 for / async for 迭代的 ChatStream，边生成边消费 StreamChunk；
+        完整结果通过 result()/aresult() 获取。
+        """
         messages = self.build_prompt(input_data)
-        self.memory.extend(messages)
-        response = await self.llm.ask(messages, **kwargs)
-        output = response.get("text", "")
-        output = self.postprocess(output)
-        self.observe(output, response)
-        return response
+        if session_id is not None:
+            # 没有会话时不保存：调用之外没有地方读取这份记忆
+            self.sessions.get(session_id).extend(messages)
+        return self.llm.open_stream(messages, **kwargs)
 
-    async def stream_async(self, input_data: Any) -> AsyncGenerator[str, None]:
+    async def stream_async(self, input_data: Any, session_id: Optional[str] = None) -> AsyncGenerator[str, None]:
         messages = self.build_prompt(input_data)
-        self.memory.extend(messages)
+        if session_id is not None:
+            self.sessions.get(session_id).extend(messages)
         async for chunk in self.llm.stream_async(messages):
             yield chunk
 
+    def preload(self) -> "BaseAgent":
+        self.llm.preload()
+        return self
+
     def render_prompt(self, template_str: str, variables: Dict[str, Any]) -> str:
 
         return self.llm.render_prompt(template_str, variables)
@@ -108,3 +179,22 @@ class BaseAgent(BaseModel, ABC):
         self.logger.debug("Agent context exited.")
         self.clear_memory()
 
+
+
+
+class PromptAgent(BaseAgent):
+    """
+    最简单的具体智能体：system_prompt 作为 system 消息，输入数据序列化为 user 消息。
+    """
+
+    system_prompt: str = ""
+
+    def build_prompt(self, input_data: Any) -> List[Dict[str, str]]:
+        content = input_data if isinstance(input_data, str) else json.dumps(input_data, ensure_ascii=False)
+        messages = [{"role": "user", "content": content}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        return messages
+
+    def observe(self, output: str, raw_response: Dict[str, Any]) -> None:
+        self.remember("assistant", output)
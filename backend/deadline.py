@@ -0,0 +1,44 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+# 当前子任务的截止时间（epoch 秒，来自派发 payload 的 deadline），LLM 调用据此收紧请求超时
+current_deadline: ContextVar[Optional[float]] = ContextVar("task_deadline", default=None)
+
+
+def remaining(deadline: Optional[float] = None) -> Optional[float]:
+    deadline = deadline if deadline is not None else current_deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+def clamp_timeout(timeout: Optional[float]) -> Optional[float]:
+    """
+    请求超时不超过剩余时间：截止后不再有 provider 请求挂着，线程中的同步调用也能按时返回。
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, 0.001)
+    return left if timeout is None else min(timeout, left)
+
+
+@asynccontextmanager
+async def deadline_scope(deadline: Optional[float]) -> AsyncIterator[None]:
+    """
+    在 deadline 之前未结束时取消内部正在 await 的操作（进行中的 LLM 请求与流随之关闭），并抛出 TimeoutError。
+    嵌套时取更早的截止时间；deadline 为 None 时不限时。
+    """
+    outer = current_deadline.get()
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    if deadline is None:
+        yield
+        return
+    token = current_deadline.set(deadline)
+    try:
+        async with asyncio.timeout_at(asyncio.get_running_loop().time() + remaining(deadline)):
+            yield
+    finally:
+        current_deadline.reset(token)
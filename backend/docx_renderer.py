@@ -0,0 +1,181 @@
+import os
+import re
+import zlib
+import struct
+import tempfile
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+# {{ 字段名 }}，Word 可能把花括号和字段名拆到多个 run 里，因此允许中间夹杂 XML 标签
+PLACEHOLDER = re.compile(rb"\{(?:<[^>]*>)*\{((?:<[^>]*>|[^<{}])+?)\}(?:<[^>]*>)*\}")
+TAG = re.compile(rb"<[^>]*>")
+TEMPLATED_PART = re.compile(r"^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$")
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL = struct.Struct("<IHHHHIIH")
+LINE_BREAK = b'</w:t><w:br/><w:t xml:space="preserve">'
+XML_ESCAPES = {ord("&"): "&amp;", ord("<"): "&lt;", ord(">"): "&gt;", ord('"'): "&quot;"}
+
+Segments = List[Union[bytes, str]]
+
+
+def _dos_datetime(date_time: Tuple[int, int, int, int, int, int]) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def _deflate(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def escape_value(value: Any) -> bytes:
+    text = "" if value is None else str(value)
+    return text.translate(XML_ESCAPES).encode("utf-8").replace(b"\n", LINE_BREAK)
+
+
+class _Entry:
+    __slots__ = ("name", "flags", "method", "dos_time", "dos_date", "external_attr",
+                 "segments", "crc", "compressed", "size")
+
+    def __init__(self, name: bytes, flags: int, method: int, dos_time: int, dos_date: int, external_attr: int):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.dos_time = dos_time
+        self.dos_date = dos_date
+        self.external_attr = external_attr
+        self.segments: Optional[Segments] = None
+        self.crc = 0
+        self.compressed = b""
+        self.size = 0
+
+
+class DocxTemplate:
+    """
+    预解析的 DOCX 模板：加载时一次性读出所有 zip 部件，静态部件预先压缩并缓存 CRC，
+    含 {{字段}} 的 XML 部件切分为“字节片段 + 字段名”列表。渲染时只拼接字段值并压缩这几个小部件，
+    再顺序写出 zip（不回写、不构建 DOM），可直接写到文件、内存或不可 seek 的响应流。
+    字段值中的换行会转成 Word 换行；占位符只应出现在正文文本中。
+    """
+
+    def __init__(self, path: str, compresslevel: int = 6):
+        import zipfile
+
+        self.path = path
+        self.compresslevel = compresslevel
+        self.entries: List[_Entry] = []
+        self.fields: Set[str] = set()
+
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                data = archive.read(info)
+                name = info.filename.encode("utf-8")
+                flags = 0x800 if not info.filename.isascii() else 0
+                method = zipfile.ZIP_STORED if info.compress_type == zipfile.ZIP_STORED else zipfile.ZIP_DEFLATED
+                entry = _Entry(name, flags, method, *_dos_datetime(info.date_time), info.external_attr)
+
+                if TEMPLATED_PART.match(info.filename) and b"{" in data:
+                    segments = self._compile(data)
+                    if len(segments) > 1:
+                        entry.segments = segments
+                        self.entries.append(entry)
+                        continue
+
+                entry.crc = zlib.crc32(data)
+                entry.size = len(data)
+                entry.compressed = data if method == zipfile.ZIP_STORED else _deflate(data, compresslevel)
+                self.entries.append(entry)
+
+    def _compile(self, data: bytes) -> Segments:
+        segments: Segments = []
+        position = 0
+        for match in PLACEHOLDER.finditer(data):
+            key = TAG.sub(b"", match.group(1)).strip().decode("utf-8")
+            segments.append(data[position:match.start()])
+            segments.append(key)
+            self.fields.add(key)
+            position = match.end()
+        segments.append(data[position:])
+        return segments
+
+    def _fill(self, segments: Segments, values: Mapping[str, Any], strict: bool) -> bytes:
+        parts = []
+        for segment in segments:
+            if segment.__class__ is bytes:
+                parts.append(segment)
+            elif segment in values:
+                parts.append(escape_value(values[segment]))
+            elif strict:
+                raise KeyError(f"模板 {self.path} 缺少字段: {segment}")
+        return b"".join(parts)
+
+    def iter_render(self, values: Mapping[str, Any], strict: bool = False) -> Iterator[bytes]:
+        """
+        按顺序产出输出 zip 的字节块，适合直接作为 StreamingResponse 的内容。
+        """
+        offset = 0
+        central = []
+        for entry in self.entries:
+            if entry.segments is None:
+                crc, size, compressed = entry.crc, entry.size, entry.compressed
+            else:
+                data = self._fill(entry.segments, values, strict)
+                crc, size = zlib.crc32(data), len(data)
+                compressed = data if entry.method == 0 else _deflate(data, self.compresslevel)
+
+            header = LOCAL_HEADER.pack(
+                0x04034B50, 20, entry.flags, entry.method, entry.dos_time, entry.dos_date,
+                crc, len(compressed), size, len(entry.name), 0
+            )
+            central.append(CENTRAL_HEADER.pack(
+                0x02014B50, 20, 20, entry.flags, entry.method, entry.dos_time, entry.dos_date,
+                crc, len(compressed), size, len(entry.name), 0, 0, 0, 0, entry.external_attr, offset
+            ) + entry.name)
+            yield header + entry.name
+            yield compressed
+            offset += len(header) + len(entry.name) + len(compressed)
+
+        directory = b"".join(central)
+        yield directory + END_OF_CENTRAL.pack(0x06054B50, 0, 0, len(central), len(central), len(directory), offset, 0)
+
+    def render_to(self, out: BinaryIO, values: Mapping[str, Any], strict: bool = False) -> int:
+        written = 0
+        for chunk in self.iter_render(values, strict):
+            out.write(chunk)
+            written += len(chunk)
+        return written
+
+    def render_bytes(self, values: Mapping[str, Any], strict: bool = False) -> bytes:
+        return b"".join(self.iter_render(values, strict))
+
+    def render_file(self, path: str, values: Mapping[str, Any], strict: bool = False) -> str:
+        """
+        原子写入：先写同目录临时文件再 rename，读者不会看到半个文件。
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                self.render_to(out, values, strict)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return path
+
+
+@lru_cache(maxsize=64)
+def _load_template(path: str, mtime_ns: int, compresslevel: int) -> DocxTemplate:
+    return DocxTemplate(path, compresslevel)
+
+
+def load_template(path: str, compresslevel: int = 6) -> DocxTemplate:
+    """
+    进程内缓存的模板加载，模板文件被修改后自动重新解析。
+    """
+    path = os.path.abspath(path)
+    return _load_template(path, os.stat(path).st_mtime_ns, compresslevel)
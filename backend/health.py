@@ -0,0 +1,111 @@
+import time
+from enum import Enum
+from typing import Optional
+
+
+class CircuitState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class EndpointHealth:
+    """
+    单个上游（LLM 供应商 / agent 实例）的被动健康统计：
+    EWMA 延迟与错误率 + 熔断器（closed -> open -> half_open -> closed）。
+    """
+
+    __slots__ = (
+        "alpha", "failure_threshold", "min_samples", "max_consecutive_failures", "cooldown",
+        "latency_ewma", "error_ewma", "samples", "consecutive_failures",
+        "state", "opened_at", "trial_in_flight",
+    )
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        failure_threshold: float = 0.5,
+        min_samples: int = 5,
+        max_consecutive_failures: int = 3,
+        cooldown: float = 30.0,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.min_samples = min_samples
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.state = CircuitState.closed
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def available(self, now: Optional[float] = None) -> bool:
+        if self.state is CircuitState.closed:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.state is CircuitState.open:
+            if now - self.opened_at < self.cooldown:
+                return False
+            self.state = CircuitState.half_open
+            self.trial_in_flight = False
+        # half_open: 只放行一个探测请求
+        return not self.trial_in_flight
+
+    def acquire(self, now: Optional[float] = None) -> bool:
+        if not self.available(now):
+            return False
+        if self.state is CircuitState.half_open:
+            self.trial_in_flight = True
+        return True
+
+    def release(self):
+        # 调用被取消等未产生结果的情况，归还 half_open 的探测名额
+        self.trial_in_flight = False
+
+    def _observe_latency(self, latency: Optional[float]):
+        if latency is None:
+            return
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.alpha * (latency - self.latency_ewma)
+
+    def record_success(self, latency: Optional[float] = None):
+        self.samples += 1
+        self._observe_latency(latency)
+        self.error_ewma -= self.alpha * self.error_ewma
+        self.consecutive_failures = 0
+        if self.state is not CircuitState.closed:
+            self.state = CircuitState.closed
+            self.trial_in_flight = False
+
+    def record_failure(self, latency: Optional[float] = None, now: Optional[float] = None):
+        self.samples += 1
+        self._observe_latency(latency)
+        self.error_ewma += self.alpha * (1.0 - self.error_ewma)
+        self.consecutive_failures += 1
+
+        if self.state is CircuitState.half_open:
+            self._trip(now)
+        elif self.consecutive_failures >= self.max_consecutive_failures:
+            self._trip(now)
+        elif self.samples >= self.min_samples and self.error_ewma >= self.failure_threshold:
+            self._trip(now)
+
+    def _trip(self, now: Optional[float] = None):
+        self.state = CircuitState.open
+        self.opened_at = time.monotonic() if now is None else now
+        self.trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state.value,
+            "latency_ewma": self.latency_ewma,
+            "error_rate": round(self.error_ewma, 4),
+            "consecutive_failures": self.consecutive_failures,
+            "samples": self.samples,
+        }
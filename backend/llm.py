@@ -1,17 +1,264 @@
 import os
+import sys
+import json
+import time
 import toml
 import asyncio
 import logging
-from typing import List, Dict, Optional, Union, Any, Generator, AsyncGenerator, Coroutine
-
-from openai import OpenAI, AsyncOpenAI, OpenAIError
-import tiktoken
-from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
-
-from jinja2 import Template
-from backend.types import ToolChoice
+import importlib.util
+from functools import lru_cache
+from typing import List, Dict, Optional, Union, Any, Generator, AsyncGenerator, Coroutine, Callable, Awaitable, Tuple
+
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception
+
+# openai / tiktoken / jinja2 均在首次使用时才导入，避免拖慢 agent 进程冷启动
+from backend.types import ToolChoice, ChunkType, StreamChunk
+from backend.usage import UsageAggregator, usage_aggregator
+from backend.ratelimit import RateLimiter, get_rate_limiter
+from backend.metrics import registry
+from backend.tracing import tracer
+from backend.deadline import clamp_timeout
+
+llm_requests = registry.counter("llm_requests_total", "LLM calls by outcome", ("model_type", "outcome"))
+llm_latency = registry.histogram("llm_request_duration_seconds", "LLM call latency", ("model_type",))
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens by direction", ("model_type", "direction"))
+llm_retries = registry.counter("llm_retries_total", "LLM call retries", ("model_type",))
+
+
+def _count_retry(retry_state):
+    llm_retries.labels(retry_state.args[0].model_type).inc()
+
+
+def is_retryable(e: BaseException) -> bool:
+    """
+    连接错误、限流（429）与服务端错误（5xx）可以重试；参数、鉴权等其余错误重试也不会成功。
+    """
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # openai 惰性导入：出现它的异常时模块必然已加载
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(e, openai.APIConnectionError)
 
 PROJECT_PATH = os.path.dirname(__file__)
+OPENAI_COMPATIBLE = ("openai", "deepseek", "mock")
+SUPPORTED_MODEL_TYPES = OPENAI_COMPATIBLE + ("qwen",)
+
+
+async def iter_as_completed(
+    ask: Callable[..., Awaitable[Dict[str, Any]]],
+    batch: List[List[Dict[str, str]]],
+    concurrency: int = 8,
+    **kwargs
+) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+    """
+    以固定数量的 worker 并发执行 batch，按完成顺序产出 (index, result)。
+    单条失败只体现在该条结果的 "error" 字段中，不影响整批。
+    """
+    if not batch:
+        return
+    queue: asyncio.Queue = asyncio.Queue()
+    items = iter(enumerate(batch))
+
+    async def worker():
+        for index, messages in items:
+            try:
+                result = await ask(list(messages), **kwargs)
+            except Exception as e:
+                result = {"text": "异步调用失败", "error": str(e)}
+            await queue.put((index, result))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(batch))))]
+    try:
+        for _ in range(len(batch)):
+            yield await queue.get()
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+@lru_cache(maxsize=256)
+def _compile_template(template_str: str):
+    from jinja2 import Template
+    return Template(template_str)
+
+
+class StreamAggregate:
+    """
+    流式响应的累积结果：文本、按 index 合并的工具调用、usage 与结束原因。
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.usage: Optional[Dict[str, int]] = None
+        self.finish_reason: Optional[str] = None
+
+    def add(self, chunk: StreamChunk):
+        if chunk.type is ChunkType.text:
+            if chunk.text:
+                self.parts.append(chunk.text)
+        elif chunk.type is ChunkType.tool_call:
+            delta = chunk.tool_call
+            call = self.tool_calls.setdefault(delta["index"], {"id": None, "name": "", "arguments": ""})
+            if delta.get("id"):
+                call["id"] = delta["id"]
+            if delta.get("name"):
+                call["name"] += delta["name"]
+            if delta.get("arguments"):
+                call["arguments"] += delta["arguments"]
+        elif chunk.type is ChunkType.usage:
+            self.usage = chunk.usage
+        if chunk.finish_reason:
+            self.finish_reason = chunk.finish_reason
+
+    @property
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+    def tool_call_list(self) -> List[Dict[str, Any]]:
+        return [self.tool_calls[index] for index in sorted(self.tool_calls)]
+
+
+class ChatStream:
+    """
+    统一的流式调用：同一实例可用 for 或 async for 迭代（二选一），逐块产出 StreamChunk
+    （文本增量 / 工具调用增量 / usage）。解析与聚合只有一份实现，sync/async 仅驱动方式不同；
+    最终聚合结果通过 result()/aresult() 惰性获取（未读完的部分会被自动读完）。
+    """
+
+    def __init__(self, llm: "LLM", messages: List[Dict[str, str]], request: Dict[str, Any]):
+        self.llm = llm
+        self.messages = messages
+        self.request = request
+        self.aggregate = StreamAggregate()
+        self.response = None
+        self.done = False
+        self.started = time.perf_counter()
+        self._result: Optional[Dict[str, Any]] = None
+        self._sync_iter = None
+        self._async_iter = None
+        self.span = None
+        self.first_chunk_at: Optional[float] = None
+
+    def _start_span(self):
+        self.span = tracer.start_span("llm.stream", model_type=self.llm.model_type, model=self.llm.model)
+
+    def _fail_span(self, e: BaseException):
+        if self.span is None:
+            return
+        if isinstance(e, GeneratorExit):
+            # 调用方提前停止读取，不算错误
+            self.span.set("closed_early", True)
+            self.span.end()
+        elif isinstance(e, asyncio.CancelledError):
+            self.span.set("cancelled", True)
+            self.span.end()
+        else:
+            self.span.end(error=f"{type(e).__name__}: {e}")
+
+    def _feed(self, raw) -> List[StreamChunk]:
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+            if self.span is not None:
+                self.span.set("ttft_ms", round((self.first_chunk_at - self.started) * 1000, 3))
+        chunks = self.llm._parse_stream_chunk(raw)
+        for chunk in chunks:
+            self.aggregate.add(chunk)
+        return chunks
+
+    def _feed_text(self, text: str) -> List[StreamChunk]:
+        chunk = StreamChunk(type=ChunkType.text, text=text or "", finish_reason="stop")
+        self.aggregate.add(chunk)
+        return [chunk]
+
+    def _finish(self):
+        self.done = True
+        self._result = self.llm._finalize(
+            self.messages, self.aggregate.text, self.aggregate.usage, self.started, self.response,
+            tool_calls=self.aggregate.tool_call_list(),
+            finish_reason=self.aggregate.finish_reason,
+        )
+        if self.span is not None:
+            self.span.set("input_tokens", self._result["input_tokens"])
+            self.span.set("output_tokens", self._result["output_tokens"])
+            self.span.end()
+
+    def __iter__(self):
+        if self._sync_iter is None:
+            self._sync_iter = self._iter_sync()
+        return self._sync_iter
+
+    def _iter_sync(self) -> Generator[StreamChunk, None, None]:
+        self._start_span()
+        try:
+            if self.llm.rate_limiter:
+                self.llm.rate_limiter.acquire_sync()
+            if self.llm.model_type in OPENAI_COMPATIBLE:
+                self.response = self.llm.client.chat.completions.create(**self.request)
+                for raw in self.response:
+                    yield from self._feed(raw)
+            else:
+                self.response = self.llm.client.chat(messages=self.messages, model=self.llm.model)
+                yield from self._feed_text(self.response["output"])
+        except BaseException as e:
+            self._fail_span(e)
+            if isinstance(e, GeneratorExit):
+                self.close()
+            raise
+        self._finish()
+
+    def __aiter__(self):
+        if self._async_iter is None:
+            self._async_iter = self._iter_async()
+        return self._async_iter
+
+    async def _iter_async(self) -> AsyncGenerator[StreamChunk, None]:
+        self._start_span()
+        try:
+            if self.llm.rate_limiter:
+                await self.llm.rate_limiter.acquire()
+            if self.llm.model_type in OPENAI_COMPATIBLE:
+                self.response = await self.llm.async_client.chat.completions.create(**self.request)
+                async for raw in self.response:
+                    for chunk in self._feed(raw):
+                        yield chunk
+            else:
+                self.response = await self.llm.async_client.chat(messages=self.messages, model=self.llm.model)
+                for chunk in self._feed_text(self.response["output"]):
+                    yield chunk
+        except BaseException as e:
+            self._fail_span(e)
+            if isinstance(e, asyncio.CancelledError):
+                llm_requests.labels(self.llm.model_type, "cancelled").inc()
+            if isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                # 任务取消或不再读取时立即断开连接，provider 停止生成，不再为无人读取的 token 计费
+                await self.aclose()
+            raise
+        self._finish()
+
+    def result(self) -> Dict[str, Any]:
+        for _ in self:
+            pass
+        return self._result
+
+    async def aresult(self) -> Dict[str, Any]:
+        async for _ in self:
+            pass
+        return self._result
+
+    def close(self):
+        if self.response is not None and hasattr(self.response, "close"):
+            self.response.close()
+
+    async def aclose(self):
+        if self.response is not None and hasattr(self.response, "close"):
+            await self.response.close()
+
 
 class LLM:
     def __init__(self, model_type: str = "openai", config_path: str = os.path.join(PROJECT_PATH, "config.toml")):
@@ -35,36 +282,92 @@ class LLM:
 
         if not self.api_key or not self.model:
             raise ValueError("[配置错误] 缺少 'api_key' 或 'model'")
+        if model_type not in SUPPORTED_MODEL_TYPES:
+            raise ValueError(f"[初始化错误] 不支持的模型类型: {self.model_type}")
 
-        self._init_client_by_model_type()
-
-        try:
-            self.tokenizer = tiktoken.encoding_for_model(self.model)
-        except Exception:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # tokenizer 与 sync/async 客户端均惰性创建，见对应 property 与 preload()
+        self._tokenizer = None
+        self._client = None
+        self._async_client = None
 
         self._init_logger()
+        self.usage_aggregator: UsageAggregator = usage_aggregator
+        self.rate_limiter: Optional[RateLimiter] = get_rate_limiter(
+            self.base_url, self.api_key,
+            self.config.get("requests_per_minute", self.global_config.get("requests_per_minute")),
+            self.config.get("burst", self.global_config.get("burst")),
+        )
         self.tools = None
         self.tool_choice = None
 
-    def _init_client_by_model_type(self):
-        if self.model_type in ["openai", "deepseek"]:
-            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-            self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+    def _create_client(self, is_async: bool):
+        if self.model_type in OPENAI_COMPATIBLE:
+            from openai import OpenAI, AsyncOpenAI
+            client_cls = AsyncOpenAI if is_async else OpenAI
         elif self.model_type == "qwen":
             from qwen_api import ChatQwen, AsyncChatQwen
-            self.client = ChatQwen(api_key=self.api_key, base_url=self.base_url)
-            self.async_client = AsyncChatQwen(api_key=self.api_key, base_url=self.base_url)
+            client_cls = AsyncChatQwen if is_async else ChatQwen
         else:
             raise ValueError(f"[初始化错误] 不支持的模型类型: {self.model_type}")
+        return client_cls(api_key=self.api_key, base_url=self.base_url)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._create_client(is_async=False)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = self._create_client(is_async=True)
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, value):
+        self._async_client = value
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            import tiktoken
+            try:
+                self._tokenizer = tiktoken.encoding_for_model(self.model)
+            except Exception:
+                self._tokenizer = tiktoken.get_encoding("cl100k_base")
+        return self._tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, value):
+        self._tokenizer = value
+
+    def preload(self, tokenizer: bool = True, sync_client: bool = True, async_client: bool = True) -> "LLM":
+        """
+        预热钩子：在 worker 启动阶段提前加载 tokenizer / 客户端，避免首个请求承担初始化开销。
+        """
+        if tokenizer:
+            self.tokenizer
+        if sync_client:
+            self.client
+        if async_client:
+            self.async_client
+        return self
+
+    def check_sdk(self):
+        """
+        客户端惰性创建，构造 LLM 时不会导入供应商 SDK；需要提前确认依赖已安装时调用（只查找模块，不导入）。
+        """
+        module = "openai" if self.model_type in OPENAI_COMPATIBLE else "qwen_api"
+        if importlib.util.find_spec(module) is None:
+            raise ImportError(f"[初始化错误] 模型类型 {self.model_type} 需要安装 {module}")
 
     def _init_logger(self):
+        # 日志统一经 root 上的异步队列输出，由所在进程的入口（应用 lifespan / __main__）调用 configure_logging
         self.logger = logging.getLogger(__name__)
-        if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('[%(levelname)s] %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
         self.logger.setLevel(logging.DEBUG if self.debug else logging.INFO)
 
     def _load_config(self, path: str) -> Dict[str, Any]:
@@ -75,17 +378,48 @@ class LLM:
     def count_tokens(self, text: str) -> int:
         return len(self.tokenizer.encode(text))
 
-    def _log_token_usage(self, messages: List[Dict[str, str]], output: Optional[str] = None):
-        input_tokens = sum(self.count_tokens(m["content"]) for m in messages)
-        self.logger.debug(f"[Token] 输入 tokens: {input_tokens}")
-        if output:
-            output_tokens = self.count_tokens(output)
-            self.logger.debug(f"[Token] 输出 tokens: {output_tokens}")
+    @staticmethod
+    def _provider_usage(response: Any) -> Optional[Dict[str, int]]:
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        if not usage:
+            return None
+        if isinstance(usage, dict):
+            input_tokens = usage.get("input_tokens", usage.get("prompt_tokens"))
+            output_tokens = usage.get("output_tokens", usage.get("completion_tokens"))
+        else:
+            input_tokens = usage.prompt_tokens
+            output_tokens = usage.completion_tokens
+        if input_tokens is None or output_tokens is None:
+            return None
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+    def _finalize(self, messages: List[Dict[str, str]], output: Optional[str], usage: Optional[Dict[str, int]],
+                  started: float, response: Any, **extra) -> Dict[str, Any]:
+        latency = time.perf_counter() - started
+        if usage:
+            input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+        else:
+            # 供应商未返回 usage 时才回退到本地 tokenizer 计数
+            input_tokens = sum(self.count_tokens(m.get("content") or "") for m in messages)
+            output_tokens = self.count_tokens(output or "")
+        self.usage_aggregator.record(self.model_type, self.model, input_tokens, output_tokens, latency, provider_reported=bool(usage))
+        llm_requests.labels(self.model_type, "ok").inc()
+        llm_latency.labels(self.model_type).observe(latency)
+        llm_tokens.labels(self.model_type, "input").inc(input_tokens)
+        llm_tokens.labels(self.model_type, "output").inc(output_tokens)
+        self.logger.debug("[Token] 输入 tokens: %d, 输出 tokens: %d, 耗时 %.3fs", input_tokens, output_tokens, latency)
+        return {
+            "text": output,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            **extra,
+            "raw": response
+        }
 
     def _check_token_limit(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         total_input = sum(self.count_tokens(m["content"]) for m in messages)
         if total_input + self.max_tokens > self.token_limit:
-            self.logger.warning(f"Token 超出限制，将自动截断: 输入 {total_input} + 输出 {self.max_tokens} > 限制 {self.token_limit}")
+            self.logger.warning("Token 超出限制，将自动截断: 输入 %s + 输出 %s > 限制 %s", total_input, self.max_tokens, self.token_limit)
             while messages and total_input + self.max_tokens > self.token_limit:
                 removed = messages.pop(0)
                 total_input -= self.count_tokens(removed["content"])
@@ -103,80 +437,242 @@ class LLM:
             self.tool_choice = {"function": {"name": tool_choice}}
         else:
             self.tool_choice = "auto"
-        self.logger.debug(f"[FunctionCalling] 工具数量: {len(tools)}, 选择策略: {self.tool_choice}")
+        self.logger.debug("[FunctionCalling] 工具数量: %s, 选择策略: %s", len(tools), self.tool_choice)
 
     def render_prompt(self, template_str: str, variables: Dict[str, Any]) -> str:
-        template = Template(template_str)
-        return template.render(**variables)
+        return _compile_template(template_str).render(**variables)
+
+    def _build_request(self, messages: List[Dict[str, str]], stream: bool, timeout: Optional[int], extra: Dict[str, Any]) -> Dict[str, Any]:
+        request = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+            "timeout": clamp_timeout(timeout),
+        }
+        if self.tools:
+            request["tools"] = self.tools
+            request["tool_choice"] = self.tool_choice
+        request.update(extra)
+        return request
+
+    @staticmethod
+    def _parse_stream_chunk(raw) -> List[StreamChunk]:
+        chunks = []
+        if raw.choices:
+            choice = raw.choices[0]
+            delta = choice.delta
+            if delta is not None:
+                if delta.content:
+                    chunks.append(StreamChunk(type=ChunkType.text, text=delta.content))
+                for call in delta.tool_calls or ():
+                    function = call.function
+                    chunks.append(StreamChunk(type=ChunkType.tool_call, tool_call={
+                        "index": call.index,
+                        "id": call.id,
+                        "name": function.name if function else None,
+                        "arguments": function.arguments if function else None,
+                    }))
+            if choice.finish_reason:
+                chunks.append(StreamChunk(type=ChunkType.text, finish_reason=choice.finish_reason))
+        usage = getattr(raw, "usage", None)
+        if usage:
+            chunks.append(StreamChunk(type=ChunkType.usage, usage={
+                "input_tokens": usage.prompt_tokens,
+                "output_tokens": usage.completion_tokens,
+            }))
+        return chunks
+
+    def open_stream(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> ChatStream:
+        messages = self._check_token_limit(messages)
+        request = self._build_request(messages, True, timeout, kwargs)
+        if self.model_type in OPENAI_COMPATIBLE:
+            request.setdefault("stream_options", {"include_usage": True})
+        return ChatStream(self, messages, request)
 
     def ask_sync(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
         try:
-            messages = self._check_token_limit(messages)
-            self._log_token_usage(messages)
-
-            if self.model_type in ["openai", "deepseek"]:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens,
-                    stream=self.stream,
-                    tools=self.tools,
-                    tool_choice=self.tool_choice,
-                    timeout=timeout,
-                    **kwargs
-                )
-                output = "".join(chunk.choices[0].delta.content or "" for chunk in response) if self.stream else response.choices[0].message.content
-            else:
-                response = self.client.chat(messages=messages, model=self.model)
-                output = response["output"]
-
-            self._log_token_usage(messages, output)
-            return {
-                "text": output,
-                "input_tokens": sum(self.count_tokens(m["content"]) for m in messages),
-                "output_tokens": self.count_tokens(output),
-                "raw": response
-            }
-
+            return self.ask_sync_once(messages, timeout, **kwargs)
         except Exception as e:
-            self.logger.error(f"[Sync ERROR] {e}")
+            self.logger.error("[Sync ERROR] %s", e)
+            llm_requests.labels(self.model_type, "error").inc()
             return {"text": "同步调用失败", "error": str(e)}
 
-    @retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=1, max=20), retry=retry_if_exception_type(Exception))
     async def ask(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
         try:
-            messages = self._check_token_limit(messages)
-            self._log_token_usage(messages)
-
-            if self.model_type in ["openai", "deepseek"]:
-                response = await self.async_client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens,
-                    stream=self.stream,
-                    tools=self.tools,
-                    tool_choice=self.tool_choice,
-                    timeout=timeout,
-                    **kwargs
-                )
-                output = "".join(chunk.choices[0].delta.content or "" async for chunk in response) if self.stream else response.choices[0].message.content
+            return await self._ask(messages, timeout, **kwargs)
+        except asyncio.CancelledError:
+            # 不重试也不吞掉：取消需要一路传到调用方（流式调用已由 ChatStream 计数）
+            if not self.stream:
+                llm_requests.labels(self.model_type, "cancelled").inc()
+            raise
+        except Exception as e:
+            self.logger.error("[Async ERROR] %s", e)
+            llm_requests.labels(self.model_type, "error").inc()
+            return {"text": "异步调用失败", "error": str(e)}
+
+    @retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=1, max=20), retry=retry_if_exception(is_retryable),
+           before_sleep=_count_retry, reraise=True)
+    async def _ask(self, messages: List[Dict[str, str]], timeout: Optional[int], **kwargs) -> Dict[str, Any]:
+        # 异常原样抛出交给 tenacity 判断是否重试，由 ask 统一转成错误结果
+        return await self.ask_once(messages, timeout, **kwargs)
+
+    def ask_sync_once(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+        """
+        单次同步调用：不重试，异常原样抛出。供需要自行处理失败的调用方（如 LLMRouter 的故障转移）使用。
+        """
+        if self.stream:
+            return self.open_stream(messages, timeout=timeout, **kwargs).result()
+
+        messages = self._check_token_limit(messages)
+        if self.rate_limiter:
+            self.rate_limiter.acquire_sync()
+        started = time.perf_counter()
+
+        with tracer.span("llm.ask", model_type=self.model_type, model=self.model) as span:
+            if self.model_type in OPENAI_COMPATIBLE:
+                response = self.client.chat.completions.create(**self._build_request(messages, False, timeout, kwargs))
+                output = response.choices[0].message.content
+            else:
+                response = self.client.chat(messages=messages, model=self.model)
+                output = response["output"]
+
+            result = self._finalize(messages, output, self._provider_usage(response), started, response)
+            span.set("input_tokens", result["input_tokens"])
+            span.set("output_tokens", result["output_tokens"])
+        return result
+
+    async def ask_once(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+        """
+        单次异步调用：不重试，异常原样抛出。
+        """
+        if self.stream:
+            return await self.open_stream(messages, timeout=timeout, **kwargs).aresult()
+
+        messages = self._check_token_limit(messages)
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        started = time.perf_counter()
+
+        with tracer.span("llm.ask", model_type=self.model_type, model=self.model) as span:
+            if self.model_type in OPENAI_COMPATIBLE:
+                response = await self.async_client.chat.completions.create(**self._build_request(messages, False, timeout, kwargs))
+                output = response.choices[0].message.content
             else:
                 response = await self.async_client.chat(messages=messages, model=self.model)
                 output = response["output"]
 
-            self._log_token_usage(messages, output)
-            return {
-                "text": output,
-                "input_tokens": sum(self.count_tokens(m["content"]) for m in messages),
-                "output_tokens": self.count_tokens(output),
-                "raw": response
+            result = self._finalize(messages, output, self._provider_usage(response), started, response)
+            span.set("input_tokens", result["input_tokens"])
+            span.set("output_tokens", result["output_tokens"])
+        return result
+
+    async def ask_many(
+        self,
+        batch: List[List[Dict[str, str]]],
+        concurrency: int = 8,
+        timeout: Optional[int] = None,
+        offline: bool = False,
+        poll_interval: float = 30.0,
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        """
+        批量生成：结果按输入顺序返回，单条失败以 {"error": ...} 形式体现而不影响整批。
+        在线模式共享限流器与连接池并发调用；offline=True 时走供应商 Batch API 并轮询直至完成。
+        需要边完成边处理时使用 ask_as_completed。
+        """
+        if offline:
+            started = time.perf_counter()
+            batch_id = await self.submit_batch(batch, **kwargs)
+            while True:
+                results = await self.fetch_batch(batch_id, batch, started)
+                if results is not None:
+                    return results
+                await asyncio.sleep(poll_interval)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+        async for index, result in self.ask_as_completed(batch, concurrency=concurrency, timeout=timeout, **kwargs):
+            results[index] = result
+        return results
+
+    def ask_as_completed(
+        self,
+        batch: List[List[Dict[str, str]]],
+        concurrency: int = 8,
+        timeout: Optional[int] = None,
+        **kwargs
+    ) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        return iter_as_completed(self.ask, batch, concurrency=concurrency, timeout=timeout, **kwargs)
+
+    async def submit_batch(self, batch: List[List[Dict[str, str]]], completion_window: str = "24h", **kwargs) -> str:
+        """
+        离线批处理：把整批请求写成 JSONL 上传到供应商 Batch API，返回 batch id。
+        """
+        if self.model_type not in OPENAI_COMPATIBLE:
+            raise ValueError(f"[批处理错误] 模型类型 {self.model_type} 不支持 Batch API")
+
+        lines = []
+        for index, messages in enumerate(batch):
+            body = {
+                "model": self.model,
+                "messages": self._check_token_limit(list(messages)),
+                "temperature": self.temperature,
+                "max_tokens": self.max_tokens,
+                **kwargs
             }
-
-        except Exception as e:
-            self.logger.error(f"[Async ERROR] {e}")
-            return {"text": "异步调用失败", "error": str(e)}
+            if self.tools:
+                body["tools"] = self.tools
+                body["tool_choice"] = self.tool_choice
+            lines.append(json.dumps(
+                {"custom_id": f"req-{index}", "method": "POST", "url": "/v1/chat/completions", "body": body},
+                ensure_ascii=False
+            ))
+
+        uploaded = await self.async_client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        job = await self.async_client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window=completion_window
+        )
+        self.logger.info("[Batch] 已提交 %s 条请求, batch id: %s", len(batch), job.id)
+        return job.id
+
+    async def fetch_batch(self, batch_id: str, batch: List[List[Dict[str, str]]], started: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        查询离线批处理结果：未完成返回 None，完成后按输入顺序返回结果。
+        started 为提交时的 perf_counter，用于记录整批耗时；未提供时从本次查询开始计。
+        """
+        if started is None:
+            started = time.perf_counter()
+        job = await self.async_client.batches.retrieve(batch_id)
+        if job.status in ("failed", "expired", "cancelled"):
+            error = f"batch {batch_id} {job.status}"
+            return [{"text": "异步调用失败", "error": error} for _ in batch]
+        if job.status != "completed":
+            return None
+
+        results: List[Dict[str, Any]] = [{"text": "异步调用失败", "error": "missing from batch output"} for _ in batch]
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            content = await self.async_client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                index = int(item["custom_id"].rsplit("-", 1)[1])
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code", 200) >= 400:
+                    results[index] = {"text": "异步调用失败", "error": str(item.get("error") or response.get("body"))}
+                    continue
+                body = response["body"]
+                output = body["choices"][0]["message"]["content"]
+                results[index] = self._finalize(batch[index], output, self._provider_usage(body), started, body)
+        return results
 
     def call(self, *args, **kwargs) -> Union[Dict[str, Any], Coroutine[Any, Any, Dict[str, Any]]]:
         try:
@@ -185,36 +681,22 @@ class LLM:
         except RuntimeError:
             return self.ask_sync(*args, **kwargs)
 
-    def stream_sync(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+    def stream_sync(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                stream=True
-            )
-            for chunk in response:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    yield delta
+            for chunk in self.open_stream(messages, **kwargs):
+                if chunk.type is ChunkType.text and chunk.text:
+                    yield chunk.text
         except Exception as e:
+            llm_requests.labels(self.model_type, "error").inc()
             yield f"[Stream ERROR] {e}"
 
-    async def stream_async(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+    async def stream_async(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[str, None]:
         try:
-            response = await self.async_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                stream=True
-            )
-            async for chunk in response:
-                delta = chunk.choices[0].delta.content
-                if delta:
-                    yield delta
+            async for chunk in self.open_stream(messages, **kwargs):
+                if chunk.type is ChunkType.text and chunk.text:
+                    yield chunk.text
         except Exception as e:
+            llm_requests.labels(self.model_type, "error").inc()
             yield f"[Async Stream ERROR] {e}"
 
     def test_prompt(self, prompt: str, role: str = "user", max_tokens: Optional[int] = None, template: Optional[str] = None, **kwargs) -> Dict[str, Any]:
@@ -0,0 +1,334 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import List, Dict, Optional, Union, Any, Generator, AsyncGenerator, Coroutine, Iterator, Tuple
+
+import toml
+
+from backend.llm import LLM, ChatStream, PROJECT_PATH, iter_as_completed, is_retryable, llm_requests
+from backend.types import ChunkType, StreamChunk
+from backend.health import EndpointHealth
+
+logger = logging.getLogger(__name__)
+
+HEALTH_OPTIONS = ("alpha", "failure_threshold", "min_samples", "max_consecutive_failures", "cooldown")
+
+
+class Provider:
+    __slots__ = ("name", "llm", "weight", "health")
+
+    def __init__(self, name: str, llm: LLM, weight: float, health: EndpointHealth):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+        self.health = health
+
+
+class RoutedStream:
+    """
+    路由版 ChatStream：首个分块产出前失败时切换到下一个供应商；已经开始产出的流无法透明切换，
+    出错即抛出。可重试的失败计入对应供应商的健康统计。
+    """
+
+    def __init__(self, router: "LLMRouter", messages: List[Dict[str, str]], timeout: Optional[int], kwargs: Dict[str, Any]):
+        self.router = router
+        self.messages = messages
+        self.timeout = timeout
+        self.kwargs = kwargs
+        self.provider: Optional[Provider] = None
+        self.stream: Optional[ChatStream] = None
+        self._sync_iter = None
+        self._async_iter = None
+
+    def _open(self, provider: Provider) -> ChatStream:
+        self.provider = provider
+        self.stream = provider.llm.open_stream(list(self.messages), timeout=self.timeout, **self.kwargs)
+        return self.stream
+
+    def _failed(self, provider: Provider, started: float, produced: bool, e: Exception) -> bool:
+        # 已经产出过分块的流无法切换供应商
+        return self.router._failed(provider, started, e) and not produced
+
+    def __iter__(self):
+        if self._sync_iter is None:
+            self._sync_iter = self._iter_sync()
+        return self._sync_iter
+
+    def _iter_sync(self) -> Generator[StreamChunk, None, None]:
+        error: Optional[Exception] = None
+        for provider in self.router._attempts():
+            started, produced = time.perf_counter(), False
+            try:
+                for chunk in self._open(provider):
+                    produced = True
+                    yield chunk
+            except Exception as e:
+                if not self._failed(provider, started, produced, e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                provider.health.release()
+                raise
+            provider.health.record_success(time.perf_counter() - started)
+            return
+        raise error or RuntimeError("no available provider")
+
+    def __aiter__(self):
+        if self._async_iter is None:
+            self._async_iter = self._iter_async()
+        return self._async_iter
+
+    async def _iter_async(self) -> AsyncGenerator[StreamChunk, None]:
+        error: Optional[Exception] = None
+        for provider in self.router._attempts():
+            started, produced = time.perf_counter(), False
+            try:
+                async for chunk in self._open(provider):
+                    produced = True
+                    yield chunk
+            except Exception as e:
+                if not self._failed(provider, started, produced, e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                provider.health.release()
+                raise
+            provider.health.record_success(time.perf_counter() - started)
+            return
+        raise error or RuntimeError("no available provider")
+
+    def _named(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        result["provider"] = self.provider.name
+        return result
+
+    def result(self) -> Dict[str, Any]:
+        for _ in self:
+            pass
+        return self._named(self.stream._result)
+
+    async def aresult(self) -> Dict[str, Any]:
+        async for _ in self:
+            pass
+        return self._named(self.stream._result)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    async def aclose(self):
+        if self.stream is not None:
+            await self.stream.aclose()
+
+
+class LLMRouter:
+    """
+    多供应商路由 LLM：按权重在 config.toml 中配置的供应商之间分摊请求，
+    以 EWMA 跟踪各供应商的延迟与错误率，熔断不健康的供应商并自动故障转移。
+    对外接口与 LLM 保持一致，可直接替换使用。
+    """
+
+    def __init__(self, providers: Optional[List[str]] = None, config_path: str = os.path.join(PROJECT_PATH, "config.toml")):
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(f"配置文件不存在: {config_path}")
+        config = toml.load(config_path)
+
+        router_config = config.get("router", {})
+        names = providers or router_config.get("providers") or [
+            name for name, section in config.items()
+            if isinstance(section, dict) and name not in ("global", "router")
+        ]
+        weights = router_config.get("weights", {})
+        health_options = {key: router_config[key] for key in HEALTH_OPTIONS if key in router_config}
+
+        self.providers: List[Provider] = []
+        for name in names:
+            weight = float(weights.get(name, 1.0))
+            if weight <= 0:
+                continue
+            try:
+                llm = LLM(model_type=name, config_path=config_path)
+                # 客户端惰性创建，构造 LLM 不会发现 SDK 缺失，这里提前确认，避免缺依赖的供应商留在轮转中
+                llm.check_sdk()
+            except (ValueError, ImportError) as e:
+                logger.warning("[Router] 跳过供应商 %s: %s", name, e)
+                continue
+            self.providers.append(Provider(name, llm, weight, EndpointHealth(**health_options)))
+
+        if not self.providers:
+            raise ValueError("[配置错误] 路由器没有可用的供应商")
+
+    def _candidates(self) -> List[Provider]:
+        """
+        加权随机排序（Efraimidis-Spirakis），首位即本次选中的供应商，其余依次作为故障转移顺序。
+        只包含当前可用（未熔断）的供应商，全部熔断时为空列表。
+        """
+        now = time.monotonic()
+        keyed = []
+        for provider in self.providers:
+            if not provider.health.available(now):
+                continue
+            weight = provider.weight * max(1.0 - provider.health.error_ewma, 0.05)
+            keyed.append((random.random() ** (1.0 / weight), provider))
+        keyed.sort(key=lambda kv: kv[0], reverse=True)
+        return [provider for _, provider in keyed]
+
+    def _attempts(self) -> Iterator[Provider]:
+        """
+        依次产出已占用（acquire）的供应商。全部熔断时按熔断时间先后兜底尝试，不受冷却期限制，
+        而不是直接失败；兜底成功会让该供应商恢复 closed。
+        """
+        candidates = self._candidates()
+        if not candidates:
+            yield from sorted(self.providers, key=lambda p: p.health.opened_at)
+            return
+        for provider in candidates:
+            if provider.health.acquire():
+                yield provider
+
+    def _failed(self, provider: Provider, started: float, e: Exception) -> bool:
+        """
+        处理一次失败的尝试，返回是否切换到下一个供应商。只有可重试的错误（连接、超时、429、5xx）计入健康统计；
+        请求本身的错误（如 400）换供应商也不会成功，直接交给调用方，不影响熔断。
+        """
+        if not is_retryable(e):
+            provider.health.release()
+            logger.warning("[Router] 供应商 %s 拒绝了请求，不做故障转移: %s", provider.name, e)
+            return False
+        provider.health.record_failure(time.perf_counter() - started)
+        logger.warning("[Router] 供应商 %s 调用失败，尝试故障转移: %s", provider.name, e)
+        return True
+
+    def _succeeded(self, provider: Provider, result: Dict[str, Any], started: float) -> Dict[str, Any]:
+        provider.health.record_success(time.perf_counter() - started)
+        result["provider"] = provider.name
+        return result
+
+    def ask_sync(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+        # 直接走单次调用：LLM.ask 的重试会让故障供应商拖住请求，故障转移本身就是重试
+        error: Optional[Exception] = None
+        for provider in self._attempts():
+            started = time.perf_counter()
+            try:
+                result = provider.llm.ask_sync_once(list(messages), timeout=timeout, **kwargs)
+            except Exception as e:
+                llm_requests.labels(provider.llm.model_type, "error").inc()
+                error = e
+                if self._failed(provider, started, e):
+                    continue
+                return {"text": "同步调用失败", "error": str(e), "provider": provider.name}
+            except BaseException:
+                provider.health.release()
+                raise
+            return self._succeeded(provider, result, started)
+        return {"text": "同步调用失败", "error": str(error) if error else "no available provider"}
+
+    async def ask(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+        error: Optional[Exception] = None
+        for provider in self._attempts():
+            started = time.perf_counter()
+            try:
+                result = await provider.llm.ask_once(list(messages), timeout=timeout, **kwargs)
+            except Exception as e:
+                llm_requests.labels(provider.llm.model_type, "error").inc()
+                error = e
+                if self._failed(provider, started, e):
+                    continue
+                return {"text": "异步调用失败", "error": str(e), "provider": provider.name}
+            except BaseException as e:
+                provider.health.release()
+                if isinstance(e, asyncio.CancelledError) and not provider.llm.stream:
+                    # 流式调用已由 ChatStream 计数
+                    llm_requests.labels(provider.llm.model_type, "cancelled").inc()
+                raise
+            return self._succeeded(provider, result, started)
+        return {"text": "异步调用失败", "error": str(error) if error else "no available provider"}
+
+    async def ask_many(self, batch: List[List[Dict[str, str]]], concurrency: int = 8, timeout: Optional[int] = None, **kwargs) -> List[Dict[str, Any]]:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+        async for index, result in self.ask_as_completed(batch, concurrency=concurrency, timeout=timeout, **kwargs):
+            results[index] = result
+        return results
+
+    def ask_as_completed(self, batch: List[List[Dict[str, str]]], concurrency: int = 8, timeout: Optional[int] = None, **kwargs) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        # 每条请求独立选路与故障转移
+        return iter_as_completed(self.ask, batch, concurrency=concurrency, timeout=timeout, **kwargs)
+
+    def call(self, *args, **kwargs) -> Union[Dict[str, Any], Coroutine[Any, Any, Dict[str, Any]]]:
+        try:
+            asyncio.get_running_loop()
+            return self.ask(*args, **kwargs)
+        except RuntimeError:
+            return self.ask_sync(*args, **kwargs)
+
+    def open_stream(self, messages: List[Dict[str, str]], timeout: Optional[int] = None, **kwargs) -> RoutedStream:
+        return RoutedStream(self, messages, timeout, kwargs)
+
+    def stream_sync(self, messages: List[Dict[str, str]], **kwargs) -> Generator[str, None, None]:
+        try:
+            for chunk in self.open_stream(messages, **kwargs):
+                if chunk.type is ChunkType.text and chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            yield f"[Stream ERROR] {e}"
+
+    async def stream_async(self, messages: List[Dict[str, str]], **kwargs) -> AsyncGenerator[str, None]:
+        try:
+            async for chunk in self.open_stream(messages, **kwargs):
+                if chunk.type is ChunkType.text and chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            yield f"[Async Stream ERROR] {e}"
+
+    @property
+    def stream(self) -> bool:
+        return self.providers[0].llm.stream
+
+    @stream.setter
+    def stream(self, value: bool):
+        for provider in self.providers:
+            provider.llm.stream = value
+
+    @property
+    def debug(self) -> bool:
+        return self.providers[0].llm.debug
+
+    @debug.setter
+    def debug(self, value: bool):
+        for provider in self.providers:
+            provider.llm.debug = value
+
+    def set_temperature(self, temperature: float):
+        for provider in self.providers:
+            provider.llm.set_temperature(temperature)
+
+    def set_max_tokens(self, max_tokens: int):
+        for provider in self.providers:
+            provider.llm.set_max_tokens(max_tokens)
+
+    def enable_function_calling(self, tools: List[Dict], tool_choice: Optional[str] = None):
+        for provider in self.providers:
+            provider.llm.enable_function_calling(tools, tool_choice)
+
+    def count_tokens(self, text: str) -> int:
+        return self.providers[0].llm.count_tokens(text)
+
+    def render_prompt(self, template_str: str, variables: Dict[str, Any]) -> str:
+        return self.providers[0].llm.render_prompt(template_str, variables)
+
+    def preload(self, **kwargs) -> "LLMRouter":
+        for provider in self.providers:
+            try:
+                provider.llm.preload(**kwargs)
+            except Exception as e:
+                logger.warning("[Router] 预热供应商 %s 失败: %s", provider.name, e)
+        return self
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            provider.name: {"weight": provider.weight, **provider.health.snapshot()}
+            for provider in self.providers
+        }
@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from backend.tracing import current_span
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+# 每个调用点（文件 + 行号）每秒最多输出的 INFO 及以下日志条数，0 表示不限
+LOG_RATE_PER_SITE = float(os.getenv("LOG_RATE_PER_SITE", "20"))
+LOG_BURST_PER_SITE = float(os.getenv("LOG_BURST_PER_SITE", "50"))
+
+PLAIN_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id", "span_id", "suppressed"}
+
+# 可以安全地留到后台线程再格式化的参数类型；其余参数在调用线程上立即渲染
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志一行 JSON：时间、级别、logger、消息、trace/span id、被限流丢弃的条数以及 extra 字段。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("trace_id", "span_id", "suppressed"):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class PlainFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" (+{record.suppressed} suppressed)"
+        return text
+
+
+class SiteRateLimitFilter(logging.Filter):
+    """
+    按调用点限流的令牌桶：热路径上的 INFO/DEBUG 日志超过速率后直接丢弃，
+    被丢弃的条数记在该调用点下一条放行日志的 suppressed 字段里。WARNING 及以上不受限。
+    """
+
+    def __init__(self, rate: float = LOG_RATE_PER_SITE, burst: float = LOG_BURST_PER_SITE):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        # (pathname, lineno) -> [tokens, last_refill, suppressed]
+        self._sites: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = [self.burst, now, 0]
+        site[0] = min(self.burst, site[0] + (now - site[1]) * self.rate)
+        site[1] = now
+        if site[0] < 1.0:
+            site[2] += 1
+            return False
+        site[0] -= 1.0
+        if site[2]:
+            record.suppressed = site[2]
+            site[2] = 0
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    只把 LogRecord 放进队列，消息格式化与写出都在后台线程完成；
+    调用线程上只记录当前 trace/span id（contextvar 只能在这里读到）并提前渲染异常堆栈。
+    参数里有 dict、列表或其他对象时在调用线程上格式化：它们可能在写出前被修改，迭代时还会出错。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def configure_logging(level: str = LOG_LEVEL, json_output: bool = LOG_JSON, stream=None, force: bool = False) -> QueueListener:
+    """
+    进程级日志配置（幂等）：root 只挂一个非阻塞的 QueueHandler，真正的写出由 QueueListener 线程完成。
+    各模块只需 logging.getLogger(__name__)，不要再调用 logging.basicConfig。
+    """
+    global _listener
+    with _lock:
+        if _listener is not None and not force:
+            return _listener
+        if _listener is not None:
+            _listener.stop()
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if json_output else PlainFormatter(PLAIN_FORMAT))
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        handler = LazyQueueHandler(log_queue)
+        handler.addFilter(SiteRateLimitFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def shutdown_logging():
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
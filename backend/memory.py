@@ -0,0 +1,132 @@
+from collections import OrderedDict, deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+Message = Dict[str, str]
+
+
+class MemoryPolicy(str, Enum):
+    sliding_window = "sliding_window"   # 超出预算时淘汰最早的消息
+    pin_system = "pin_system"           # 同上，但优先淘汰普通消息，system 消息只在其本身超预算时淘汰最早的
+    summarize = "summarize"             # 淘汰的消息交给 summarizer 压缩成一条摘要
+
+
+def estimate_tokens(text: str) -> int:
+    # 未提供 tokenizer 时的粗略估计：中文约 1 字 1 token，英文约 4 字符 1 token
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+class ConversationMemory:
+    """
+    有硬性 token 预算的对话记忆：每条消息只在写入时计数一次并缓存，
+    超出预算按策略淘汰（滑动窗口 / 固定 system / 摘要压缩），总量始终不超过预算。
+    固定的 system 消息同样计入预算：单条超过预算时拒绝写入（ValueError），
+    普通消息淘汰完仍超出时淘汰最早的 system 消息。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 4096,
+        policy: MemoryPolicy = MemoryPolicy.pin_system,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        summarizer: Optional[Callable[[List[Message]], str]] = None,
+    ):
+        self.token_budget = token_budget
+        self.policy = MemoryPolicy(policy)
+        self.count_tokens = count_tokens or estimate_tokens
+        self.summarizer = summarizer
+
+        self._pinned: List[Tuple[Message, int]] = []
+        self._messages: Deque[Tuple[Message, int]] = deque()
+        self.total_tokens = 0
+
+    def append(self, message: Message):
+        tokens = self.count_tokens(message.get("content") or "")
+        if self.policy is not MemoryPolicy.sliding_window and message.get("role") == "system":
+            if any(pinned is message or pinned == message for pinned, _ in self._pinned):
+                return
+            if tokens > self.token_budget:
+                raise ValueError(f"system message needs {tokens} tokens, more than the memory budget of {self.token_budget}")
+            self._pinned.append((message, tokens))
+        else:
+            self._messages.append((message, tokens))
+        self.total_tokens += tokens
+        self._enforce_budget()
+
+    def extend(self, messages: List[Message]):
+        for message in messages:
+            self.append(message)
+
+    def _evict_oldest(self) -> Tuple[Message, int]:
+        message, tokens = self._messages.popleft()
+        self.total_tokens -= tokens
+        return message, tokens
+
+    def _enforce_budget(self):
+        if self.total_tokens <= self.token_budget:
+            return
+
+        if self.policy is MemoryPolicy.summarize and self.summarizer and len(self._messages) > 1:
+            evicted: List[Message] = []
+            # 至少腾出一半预算，避免每追加一条就触发一次摘要
+            target = self.token_budget // 2
+            while len(self._messages) > 1 and self.total_tokens > target:
+                evicted.append(self._evict_oldest()[0])
+            summary = {"role": "system", "content": f"[对话摘要] {self.summarizer(evicted)}"}
+            tokens = self.count_tokens(summary["content"])
+            self._messages.appendleft((summary, tokens))
+            self.total_tokens += tokens
+
+        while self._messages and self.total_tokens > self.token_budget:
+            self._evict_oldest()
+        while len(self._pinned) > 1 and self.total_tokens > self.token_budget:
+            self.total_tokens -= self._pinned.pop(0)[1]
+
+    @property
+    def messages(self) -> List[Message]:
+        return [message for message, _ in self._pinned] + [message for message, _ in self._messages]
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self.messages)
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._messages)
+
+    def clear(self):
+        self._pinned.clear()
+        self._messages.clear()
+        self.total_tokens = 0
+
+
+class MemoryStore:
+    """
+    按任务 / 会话隔离的记忆：并发请求各用各的 ConversationMemory，
+    会话数超过上限时淘汰最久未使用的会话。
+    """
+
+    def __init__(self, factory: Callable[[], ConversationMemory], max_sessions: int = 1024):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+
+    def get(self, session_id: str) -> ConversationMemory:
+        memory = self._sessions.get(session_id)
+        if memory is None:
+            memory = self._sessions[session_id] = self.factory()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return memory
+
+    def drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,265 @@
+"""
+本地 OpenAI 兼容的替身 LLM 服务，用于离线压测与测试：
+
+    python -m backend.mock_llm_server --port 8900 --latency-ms 300 --latency-jitter 0.5 --tokens-per-second 50
+
+config.toml 中 [mock] 段的 base_url 指向本服务即可让 LLM(model_type="mock") 的
+ask / ask_sync / stream_sync / stream_async / 工具调用全部走本地。
+响应内容确定（echo 最后一条 user 消息或固定文本），延迟与错误注入由带种子的随机数生成，可复现。
+单个请求可用请求头覆盖：X-Mock-Status（强制返回该状态码）、X-Mock-Latency-Ms。
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LLM_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+MOCK_LLM_LATENCY_JITTER = float(os.getenv("MOCK_LLM_LATENCY_JITTER", "0"))
+MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "0"))
+MOCK_LLM_ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+MOCK_LLM_RATE_LIMIT_RATE = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+MOCK_LLM_RETRY_AFTER = float(os.getenv("MOCK_LLM_RETRY_AFTER", "1"))
+MOCK_LLM_RESPONSE = os.getenv("MOCK_LLM_RESPONSE", "echo")
+MOCK_LLM_CANNED_TEXT = os.getenv("MOCK_LLM_CANNED_TEXT", "这是一段用于压测的固定回复。 This is a canned mock response.")
+MOCK_LLM_SEED = int(os.getenv("MOCK_LLM_SEED", "0"))
+
+# 中日韩字符逐字计为一个 token，其余按空白切分（前导空白归入后一个 token，拼接后与原文一致）
+CJK = r"\u3000-\u30ff\u3400-\u9fff\uac00-\ud7af\uff00-\uffef"
+TOKEN_PATTERN = re.compile(rf"\s*[{CJK}]|\s*[^\s{CJK}]+|\s+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text or "")
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class MockSettings:
+    """
+    延迟模型：首 token 前等待 latency_ms（jitter > 0 时为以 latency_ms 为中位数、sigma = jitter 的对数正态分布），
+    之后每个 token 间隔 1 / tokens_per_second 秒（0 表示瞬时）。
+    """
+
+    __slots__ = ("latency_ms", "latency_jitter", "tokens_per_second", "error_rate", "rate_limit_rate", "retry_after",
+                 "response", "canned_text", "seed")
+
+    def __init__(self, latency_ms: float = MOCK_LLM_LATENCY_MS, latency_jitter: float = MOCK_LLM_LATENCY_JITTER,
+                 tokens_per_second: float = MOCK_LLM_TOKENS_PER_SECOND, error_rate: float = MOCK_LLM_ERROR_RATE,
+                 rate_limit_rate: float = MOCK_LLM_RATE_LIMIT_RATE, retry_after: float = MOCK_LLM_RETRY_AFTER,
+                 response: str = MOCK_LLM_RESPONSE, canned_text: str = MOCK_LLM_CANNED_TEXT, seed: int = MOCK_LLM_SEED):
+        if response not in ("echo", "canned"):
+            raise ValueError(f"Unknown mock response mode: {response}")
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.response = response
+        self.canned_text = canned_text
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class MockLLM:
+    def __init__(self, settings: Optional[MockSettings] = None):
+        self.settings = settings or MockSettings()
+        self.random = random.Random(self.settings.seed)
+        self.counters = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "tool_calls": 0}
+        self._seq = 0
+
+    def sample_latency(self) -> float:
+        settings = self.settings
+        if settings.latency_ms <= 0:
+            return 0.0
+        if settings.latency_jitter <= 0:
+            return settings.latency_ms / 1000
+        return self.random.lognormvariate(0.0, settings.latency_jitter) * settings.latency_ms / 1000
+
+    def token_delay(self) -> float:
+        return 1.0 / self.settings.tokens_per_second if self.settings.tokens_per_second > 0 else 0.0
+
+    def injected_status(self, request: Request) -> Optional[int]:
+        # 每个请求都抽取两次随机数，同一种子下后续请求的抽样不受注入概率和请求头覆盖的影响
+        error_draw, limit_draw = self.random.random(), self.random.random()
+        forced = request.headers.get("x-mock-status")
+        if forced:
+            return int(forced)
+        if limit_draw < self.settings.rate_limit_rate:
+            return 429
+        if error_draw < self.settings.error_rate:
+            return 500
+        return None
+
+    def reply_text(self, body: Dict[str, Any]) -> str:
+        if self.settings.response == "canned":
+            return self.settings.canned_text
+        messages = body.get("messages") or []
+        last_user = next((m for m in reversed(messages) if m.get("role") == "user"), None)
+        return "echo: " + _content_text(last_user.get("content")) if last_user else "echo:"
+
+    def tool_call(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        请求带 tools 且最后一条消息不是工具结果时，调用 tool_choice 指定的（或第一个）函数，
+        参数按 JSON Schema 的 required 字段生成占位值；收到工具结果后返回文本，工具循环可以正常结束。
+        """
+        tools = body.get("tools") or []
+        choice = body.get("tool_choice", "auto")
+        messages = body.get("messages") or []
+        if not tools or choice == "none" or (messages and messages[-1].get("role") == "tool"):
+            return None
+        name = choice.get("function", {}).get("name") if isinstance(choice, dict) else None
+        function = next((t["function"] for t in tools if t.get("function", {}).get("name") == name), None) or tools[0]["function"]
+        schema = function.get("parameters") or {}
+        properties = schema.get("properties") or {}
+        placeholders = {"string": "mock", "integer": 1, "number": 1.0, "boolean": True, "array": [], "object": {}}
+        arguments = {key: placeholders.get(properties.get(key, {}).get("type"), "mock") for key in schema.get("required", [])}
+        self._seq += 1
+        return {"id": f"call_mock_{self._seq}", "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+    @staticmethod
+    def error_response(status: int, retry_after: float) -> JSONResponse:
+        if status == 429:
+            error = {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}
+            return JSONResponse({"error": error}, status_code=429, headers={"Retry-After": f"{retry_after:g}"})
+        error = {"message": f"Injected error {status} (mock)", "type": "server_error", "code": None}
+        return JSONResponse({"error": error}, status_code=status)
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        self.counters["requests"] += 1
+        status = self.injected_status(request)
+        latency = float(request.headers["x-mock-latency-ms"]) / 1000 if "x-mock-latency-ms" in request.headers else self.sample_latency()
+        if status is not None:
+            self.counters["rate_limited" if status == 429 else "errors"] += 1
+            await asyncio.sleep(latency)
+            return self.error_response(status, self.settings.retry_after)
+
+        completion_id = f"chatcmpl-mock-{self.counters['requests']}"
+        created = int(time.time())
+        model = body.get("model", "mock")
+        prompt_tokens = sum(len(tokenize(_content_text(m.get("content")))) for m in body.get("messages") or [])
+        call = self.tool_call(body)
+        if call:
+            self.counters["tool_calls"] += 1
+            tokens, finish_reason = [], "tool_calls"
+            completion_tokens = len(tokenize(call["function"]["arguments"]))
+        else:
+            full = tokenize(self.reply_text(body))
+            limit = body.get("max_tokens")
+            tokens = full[:limit] if limit else full
+            finish_reason = "length" if len(tokens) < len(full) else "stop"
+            completion_tokens = len(tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        if body.get("stream"):
+            self.counters["streams"] += 1
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self._stream(completion_id, created, model, latency, tokens, call, finish_reason, usage if include_usage else None),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(latency + completion_tokens * self.token_delay())
+        message: Dict[str, Any] = {"role": "assistant", "content": None if call else "".join(tokens)}
+        if call:
+            message["tool_calls"] = [call]
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": usage,
+        }
+
+    async def _stream(self, completion_id: str, created: int, model: str, latency: float, tokens: List[str],
+                      call: Optional[Dict[str, Any]], finish_reason: str, usage: Optional[Dict[str, int]]) -> AsyncGenerator[bytes, None]:
+        def event(choices: List[Dict[str, Any]], **extra) -> bytes:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": choices, **extra}
+            return b"data: " + json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+        delay = self.token_delay()
+        await asyncio.sleep(latency)
+        yield event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        if call:
+            header = {"index": 0, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}
+            yield event([{"index": 0, "delta": {"tool_calls": [header]}, "finish_reason": None}])
+            for piece in tokenize(call["function"]["arguments"]):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield event([{"index": 0, "delta": {"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}, "finish_reason": None}])
+        else:
+            for token in tokens:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+        yield event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if usage:
+            yield event([], usage=usage)
+        yield b"data: [DONE]\n\n"
+
+
+def create_app(settings: Optional[MockSettings] = None) -> FastAPI:
+    mock = MockLLM(settings)
+    app = FastAPI()
+    app.state.mock = mock
+    app.add_api_route("/v1/chat/completions", mock.chat_completions, methods=["POST"])
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return {"settings": mock.settings.to_dict(), **mock.counters}
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Deterministic OpenAI-compatible mock LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_LLM_LATENCY_MS, help="median time to first token")
+    parser.add_argument("--latency-jitter", type=float, default=MOCK_LLM_LATENCY_JITTER, help="lognormal sigma, 0 = fixed")
+    parser.add_argument("--tokens-per-second", type=float, default=MOCK_LLM_TOKENS_PER_SECOND, help="0 = instant")
+    parser.add_argument("--error-rate", type=float, default=MOCK_LLM_ERROR_RATE, help="fraction answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=MOCK_LLM_RATE_LIMIT_RATE, help="fraction answered with 429")
+    parser.add_argument("--retry-after", type=float, default=MOCK_LLM_RETRY_AFTER)
+    parser.add_argument("--response", choices=("echo", "canned"), default=MOCK_LLM_RESPONSE)
+    parser.add_argument("--canned-text", default=MOCK_LLM_CANNED_TEXT)
+    parser.add_argument("--seed", type=int, default=MOCK_LLM_SEED)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from backend.logging_setup import configure_logging
+
+    settings = MockSettings(args.latency_ms, args.latency_jitter, args.tokens_per_second, args.error_rate,
+                            args.rate_limit_rate, args.retry_after, args.response, args.canned_text, args.seed)
+    configure_logging()
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
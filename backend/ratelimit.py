@@ -0,0 +1,54 @@
+import time
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class RateLimiter:
+    """
+    预约式令牌桶：每次调用先扣一个令牌，余额为负则睡眠到对应的“欠款”还清。
+    同一限流器可能同时被线程中的同步调用与事件循环中的异步调用使用，余额计算两条路径都加锁；
+    锁只保护几次算术运算，不会阻塞事件循环。
+    """
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self):
+        with self._lock:
+            delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        with self._lock:
+            delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+
+
+def get_rate_limiter(base_url: str, api_key: str, requests_per_minute: Optional[float], burst: Optional[int] = None) -> Optional[RateLimiter]:
+    """
+    同一供应商账号（base_url + api_key）在进程内共用一个限流器，多个 LLM 实例不会叠加配额。
+    """
+    if not requests_per_minute:
+        return None
+    key = (base_url or "", api_key or "")
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = RateLimiter(requests_per_minute, burst)
+    return limiter
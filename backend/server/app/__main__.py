@@ -1,9 +1,23 @@
 # main.py
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from backend.server.app.router import register_routes
+from backend.server.app.router import register_routes, shutdown
+from backend.logging_setup import configure_logging
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 无论由 __main__ 还是 uvicorn 命令行启动，都在应用启动时配置日志
+    configure_logging()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 register_routes(app)
 
@@ -1,6 +1,10 @@
 import os
+import json
+import hashlib
 import logging
 import sys
+import uuid
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException, Depends, Security
 from fastapi.security import APIKeyHeader
@@ -8,9 +12,11 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type, before_sleep_log
+from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception, before_sleep_log
 import httpx
-from backend.types import StartTaskRequest, CallbackData
+from backend.types import StartTaskRequest, CallbackData, Priority
+from backend.tracing import tracer
+from backend.logging_setup import configure_logging
 
 BACKEND_API_URL = os.getenv("BACKEND_API_URL", "http://localhost:8000/api/start-task")
 MAX_TIMEOUT = float(os.getenv("FORWARD_TIMEOUT", "30.0"))
@@ -25,8 +31,17 @@ def verify_api_key(api_key: str = Security(API_KEY_HEADER)):
         raise HTTPException(status_code=403, detail="Invalid or missing API Key")
     return api_key
 
+def tenant_id(api_key: str) -> str:
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 与后端一致，在应用启动时配置日志，而不是在 import 时
+    configure_logging()
+    yield
+
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -36,24 +51,44 @@ app.add_middleware(
     allowed_hosts=["*"]
 )
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def retryable(exc: BaseException) -> bool:
+    # 网络错误与后端 5xx 可以重试；4xx 是请求本身的问题，重试也不会成功
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.RequestError)
+
 retry_decorator = retry(
     stop=stop_after_attempt(RETRY_MAX_ATTEMPTS),
     wait=wait_fixed(RETRY_WAIT_SECONDS),
-    retry=retry_if_exception_type((httpx.RequestError,)),
-    # before_sleep=before_sleep_log(logger, logging.WARNING)
+    retry=retry_if_exception(retryable),
+    reraise=True,
+    before_sleep=before_sleep_log(logger, logging.WARNING)
 )
 
+@retry_decorator
+async def forward(client: httpx.AsyncClient, payload: StartTaskRequest, headers: dict) -> httpx.Response:
+    """
+    把任务转发给后端，网络错误与 5xx 原样抛出交给 tenacity 重试；每次重试都带同一个 Idempotency-Key。
+    """
+    with tracer.span("accept.send_task", service="accept", user_id=payload.user_id) as span:
+        response = await client.post(
+            BACKEND_API_URL,
+            json=payload.model_dump(),
+            headers={**headers, "traceparent": span.traceparent}
+        )
+        span.set("status_code", response.status_code)
+        response.raise_for_status()
+    return response
+
 @app.post("/accept")
 @limiter.limit("100/minute")
-@retry_decorator
 async def send_task(
     request: Request,
     api_key: str = Depends(verify_api_key)
 ):
-    logger.info(f"Received request from {request.client.host} with API Key: {api_key}")
+    logger.info("Received request from %s for tenant %s", request.client.host, tenant_id(api_key))
 
     try:
         # 尝试解析 JSON 数据并使用 Pydantic 验证
@@ -61,73 +96,80 @@ async def send_task(
         payload = StartTaskRequest(
             user_id=data["user_id"],
             input_data=data["input_data"],
-            agent_types=data["agent_types"]
+            agent_types=data["agent_types"],
+            dependencies=data.get("dependencies"),
+            priority=data.get("priority", Priority.standard),
+            deadline_seconds=data.get("deadline_seconds"),
+            # 按 API key 公平排队；只转发摘要，不把 key 本身写进任务
+            tenant_id=tenant_id(api_key)
         )
 
-        logger.info(f"Validated task for user_id: {payload.user_id}")
+        logger.info("Validated task for user_id: %s", payload.user_id)
 
     except KeyError as e:
 
-        logger.error(f"Missing expected field: {str(e)}")
+        logger.error("Missing expected field: %s", e)
         raise HTTPException(
             status_code=400,
             detail=f"Missing expected field: {str(e)}"
         )
     except json.JSONDecodeError as e:
 
-        logger.error(f"Failed to decode JSON: {str(e)}")
+        logger.error("Failed to decode JSON: %s", e)
         raise HTTPException(
             status_code=400,
             detail=f"Invalid JSON format: {str(e)}"
         )
     except Exception as e:
 
-        logger.error(f"Failed to parse request data: {str(e)}")
+        logger.error("Failed to parse request data: %s", e)
         raise HTTPException(
             status_code=400,
             detail=f"Invalid request data: {str(e)}"
         )
 
-    headers = {"Content-Type": "application/json"}
-
+    # 转发重试（forward 由 tenacity 重新执行）与客户端重试都带同一个 Idempotency-Key，
+    # 后端据此返回首次创建的任务；客户端未提供时为本次请求生成一个，至少让转发重试不重复创建
+    idempotency_key = request.headers.get("idempotency-key") or str(uuid.uuid4())
+    headers = {"Content-Type": "application/json", "Idempotency-Key": idempotency_key}
 
     async with httpx.AsyncClient(timeout=MAX_TIMEOUT) as client:
         try:
-            logger.info(f"Forwarding task to {BACKEND_API_URL}")
-            response = await client.post(
-                BACKEND_API_URL,
-                json=payload.model_dump(),
-                headers=headers
-            )
-            response.raise_for_status()
-            logger.info(f"Successfully forwarded task. Status code: {response.status_code}")
+            logger.info("Forwarding task to %s", BACKEND_API_URL)
+            response = await forward(client, payload, headers)
+            logger.info("Successfully forwarded task. Status code: %s", response.status_code)
 
         except httpx.HTTPStatusError as exc:
             if 500 <= exc.response.status_code < 600:
-                logger.warning(f"Server error: {exc}, will retry...")
-                raise
+                logger.error("Server error after %s attempts: %s", RETRY_MAX_ATTEMPTS, exc)
+                raise HTTPException(
+                    status_code=502,
+                    detail=f"Remote service failed: {exc}"
+                )
             else:
-                logger.error(f"Remote service error: {exc.response.status_code} - {exc.response.text}")
+                logger.error("Remote service error: %s - %s", exc.response.status_code, exc.response.text)
                 raise HTTPException(
                     status_code=exc.response.status_code,
                     detail=f"Remote service returned error: {exc}"
                 )
 
         except httpx.RequestError as exc:
-            logger.error(f"Network error: Failed to reach remote service: {exc}")
+            logger.error("Network error: Failed to reach remote service after %s attempts: %s", RETRY_MAX_ATTEMPTS, exc)
             raise HTTPException(
                 status_code=503,
                 detail=f"Failed to reach remote service: {exc}"
             )
 
     data = response.json()
-    logger.info(f"Received response from backend, task_id: {data.get('task_id')}, token: {data.get('token')}")
+    logger.info("Received response from backend, task_id: %s, token: %s", data.get('task_id'), data.get('token'))
 
     return {
         "status_code": response.status_code,
+        "replayed": response.headers.get("idempotent-replayed") == "true",
         "user_id": data.get('user_id'),
         "task_id": data.get("task_id"),
-        "token": data.get("token")
+        "token": data.get("token"),
+        "stream_token": data.get("stream_token")
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import os
+import asyncio
+import logging
+import importlib
+import inspect
+import functools
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from backend.tracing import tracer
+from backend.deadline import deadline_scope
+
+LOCAL_PREFIX = "python:"
+LOCAL_AGENT_CONCURRENCY = int(os.getenv("LOCAL_AGENT_CONCURRENCY", "32"))
+
+logger = logging.getLogger(__name__)
+
+# (status, file_url, result) -> None，由路由层提供：更新 TaskManager 并派发下游
+CompletionHandler = Callable[[str, Optional[str], Optional[Dict[str, Any]]], Awaitable[None]]
+
+
+def is_local(target: str) -> bool:
+    return isinstance(target, str) and target.startswith(LOCAL_PREFIX)
+
+
+class AgentRegistry:
+    """
+    进程内 agent：agent_url.json 中形如 "python:package.module:function" 的条目不走 HTTP，
+    直接在后端事件循环上调用入口函数（同步函数放到线程池），返回值即回调内容，
+    省去一次 POST 派发和一次 HTTP 回调。入口函数签名为 fn(payload) -> {"status", "file_url", "result"}。
+    """
+
+    def __init__(self, concurrency: int = LOCAL_AGENT_CONCURRENCY):
+        self.concurrency = concurrency
+        self._entrypoints: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running: Set[asyncio.Task] = set()
+        self._by_task: Dict[str, Set[asyncio.Task]] = {}
+
+    def resolve(self, target: str) -> Callable[[Dict[str, Any]], Any]:
+        entrypoint = self._entrypoints.get(target)
+        if entrypoint is None:
+            module_name, _, attr = target[len(LOCAL_PREFIX):].partition(":")
+            if not module_name or not attr:
+                raise ValueError(f"Invalid local agent entry point: {target}")
+            entrypoint = getattr(importlib.import_module(module_name), attr)
+            if not callable(entrypoint):
+                raise ValueError(f"Local agent entry point is not callable: {target}")
+            self._entrypoints[target] = entrypoint
+        return entrypoint
+
+    def submit(self, target: str, payload: Dict[str, Any], on_complete: CompletionHandler) -> asyncio.Task:
+        """
+        解析入口并在后台执行；入口无法解析时直接抛出，由调用方按派发失败处理。
+        """
+        entrypoint = self.resolve(target)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        task = asyncio.create_task(self._run(entrypoint, payload, on_complete))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        task_id = payload.get("task_id")
+        self._by_task.setdefault(task_id, set()).add(task)
+        task.add_done_callback(functools.partial(self._forget, task_id))
+        return task
+
+    def _forget(self, task_id: Optional[str], task: asyncio.Task):
+        tasks = self._by_task.get(task_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._by_task[task_id]
+
+    def cancel(self, task_id: str) -> int:
+        """
+        取消该任务在本进程中运行的 agent；同步入口在线程中执行无法中断，只是不再等待其结果。
+        """
+        tasks = self._by_task.get(task_id, ())
+        for task in tasks:
+            task.cancel()
+        return len(tasks)
+
+    async def _run(self, entrypoint: Callable[[Dict[str, Any]], Any], payload: Dict[str, Any], on_complete: CompletionHandler):
+        async with self._semaphore:
+            with tracer.span("agent.local", parent=payload.get("traceparent"), task_id=payload.get("task_id"),
+                             entrypoint=getattr(entrypoint, "__qualname__", str(entrypoint))) as span:
+                try:
+                    async with deadline_scope(payload.get("deadline")):
+                        if inspect.iscoroutinefunction(entrypoint):
+                            output = await entrypoint(payload)
+                        else:
+                            output = await asyncio.to_thread(entrypoint, payload)
+                    output = output or {}
+                    status = output.get("status", "completed")
+                except TimeoutError:
+                    span.set("deadline_exceeded", True)
+                    logger.warning("Local agent for task %s exceeded its deadline", payload.get('task_id'))
+                    output, status = {}, "cancelled"
+                except Exception as e:
+                    span.error = f"{type(e).__name__}: {e}"
+                    logger.error("Local agent failed for task %s: %s", payload.get('task_id'), e)
+                    output, status = {}, "failed"
+                # 在 span 内完成回调，下游派发挂在本 agent 的 span 下
+                await on_complete(status, output.get("file_url"), output.get("result"))
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+
+agent_registry = AgentRegistry()
@@ -0,0 +1,258 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from backend.health import CircuitState, EndpointHealth
+
+AGENT_BALANCER = os.getenv("AGENT_BALANCER", "least_outstanding")  # least_outstanding | p2c
+AGENT_PROBE_INTERVAL = float(os.getenv("AGENT_PROBE_INTERVAL", "10"))
+AGENT_DISPATCH_TIMEOUT = float(os.getenv("AGENT_DISPATCH_TIMEOUT", "100"))
+AGENT_EJECT_COOLDOWN = float(os.getenv("AGENT_EJECT_COOLDOWN", "15"))
+
+logger = logging.getLogger(__name__)
+
+
+def sibling_url(url: str, name: str) -> str:
+    parts = urlsplit(url)
+    path = parts.path.rsplit("/", 1)[0] + "/" + name
+    return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+
+def health_url(url: str) -> str:
+    # http://host:8001/agent -> http://host:8001/health（AgentService 提供的健康检查）
+    return sibling_url(url, "health")
+
+
+class Endpoint:
+    __slots__ = ("url", "health_url", "cancel_url", "health", "outstanding")
+
+    def __init__(self, url: str, cooldown: float = AGENT_EJECT_COOLDOWN):
+        self.url = url
+        self.health_url = health_url(url)
+        self.cancel_url = sibling_url(url, "cancel")
+        self.health = EndpointHealth(cooldown=cooldown)
+        self.outstanding = 0
+
+    def score(self) -> float:
+        # 在途请求数优先；近期出错的实例降权，延迟 EWMA 用于打破平局
+        return self.outstanding + self.health.error_ewma + (self.health.latency_ewma or 0.0) / 1000.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"url": self.url, "outstanding": self.outstanding, **self.health.snapshot()}
+
+
+class EndpointPool:
+    """
+    同一 agent 类型的一组副本：least_outstanding 选在途请求最少的实例，
+    p2c 随机取两个选较空闲的一个；连续失败或错误率过高的实例被熔断摘除，冷却后放行一个探测请求。
+    """
+
+    def __init__(self, agent_type: str, urls: Sequence[str], strategy: str = AGENT_BALANCER, rng: Optional[random.Random] = None):
+        self.agent_type = agent_type
+        self.strategy = strategy
+        self.rng = rng or random.Random()
+        self.endpoints: List[Endpoint] = [Endpoint(url) for url in dict.fromkeys(urls)]
+
+    def sync(self, urls: Sequence[str]):
+        """
+        配置重载后保留仍存在实例的健康状态与在途计数，只增删变化的实例。
+        """
+        existing = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self.endpoints = [existing.get(url) or Endpoint(url) for url in dict.fromkeys(urls)]
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def choose(self, exclude: Sequence[Endpoint] = ()) -> Optional[Endpoint]:
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude and e.health.available(now)]
+        if not candidates:
+            return None
+        if self.strategy == "p2c" and len(candidates) > 2:
+            first, second = self.rng.sample(candidates, 2)
+            chosen = first if first.score() <= second.score() else second
+        else:
+            chosen = min(candidates, key=Endpoint.score)
+        if not chosen.health.acquire(now):
+            return None
+        return chosen
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [endpoint.snapshot() for endpoint in self.endpoints]
+
+
+class AgentEndpoints:
+    """
+    按 agent 类型管理副本池与共享的 keep-alive 客户端：派发失败（网络错误 / 5xx）记入被动健康统计并切换到下一个副本，
+    429（agent 队列已满）只换副本不计失败；后台定期探测各实例的 /health，让被摘除的实例及时恢复。
+    agent 接受子任务后，该副本的在途计数保持到 release（回调、取消或调度租约超时）为止。
+    """
+
+    def __init__(self, strategy: str = AGENT_BALANCER, probe_interval: float = AGENT_PROBE_INTERVAL,
+                 timeout: float = AGENT_DISPATCH_TIMEOUT, client: Optional[httpx.AsyncClient] = None):
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        self.timeout = timeout
+        self.pools: Dict[str, EndpointPool] = {}
+        self.client = client
+        self._probe_task: Optional[asyncio.Task] = None
+        # (task_id, agent_type) -> 接受该子任务的副本
+        self.assignments: Dict[Tuple[str, str], Endpoint] = {}
+
+    def pool_for(self, agent_type: str, target: Union[str, Sequence[str]]) -> EndpointPool:
+        urls = [target] if isinstance(target, str) else list(target)
+        pool = self.pools.get(agent_type)
+        if pool is None:
+            pool = self.pools[agent_type] = EndpointPool(agent_type, urls, self.strategy)
+        elif pool.urls != urls:
+            pool.sync(urls)
+        return pool
+
+    def _ensure_started(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=self.timeout)
+        if self._probe_task is None and self.probe_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def post(self, agent_type: str, target: Union[str, Sequence[str]], payload: Dict[str, Any]) -> httpx.Response:
+        """
+        把 payload 发给该类型的一个健康副本，失败时依次尝试其余副本；全部失败时抛出最后一个错误。
+        payload 带 task_id 时，接受它的副本保持在途直到 release(task_id, agent_type)。
+        """
+        self._ensure_started()
+        pool = self.pool_for(agent_type, target)
+        key = (payload["task_id"], agent_type) if payload.get("task_id") is not None else None
+        if key is not None:
+            # 同一子任务重新派发时，先归还上一次的副本
+            self.release(*key)
+        tried: List[Endpoint] = []
+        last_error: Optional[Exception] = None
+
+        while True:
+            endpoint = pool.choose(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            # 在请求发出前登记：回调可能先于派发响应到达并调用 release
+            endpoint.outstanding += 1
+            if key is not None:
+                self.assignments[key] = endpoint
+            accepted = False
+            started = time.monotonic()
+            try:
+                response = await self.client.post(endpoint.url, json=payload)
+                accepted = response.status_code < 400
+            except httpx.RequestError as e:
+                endpoint.health.record_failure(time.monotonic() - started)
+                logger.warning("Agent %s endpoint %s unreachable: %s", agent_type, endpoint.url, e)
+                last_error = e
+                continue
+            except BaseException:
+                endpoint.health.release()
+                raise
+            finally:
+                if key is None or not accepted:
+                    self._unassign(key, endpoint)
+
+            latency = time.monotonic() - started
+            if response.status_code == 429:
+                endpoint.health.release()
+                logger.info("Agent %s endpoint %s is saturated, trying another replica", agent_type, endpoint.url)
+            elif response.status_code >= 500:
+                endpoint.health.record_failure(latency)
+                logger.warning("Agent %s endpoint %s returned %s", agent_type, endpoint.url, response.status_code)
+            else:
+                endpoint.health.record_success(latency)
+                response.raise_for_status()
+                return response
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                last_error = e
+
+        if last_error is None:
+            last_error = httpx.ConnectError(f"No healthy endpoint for agent {agent_type}")
+        raise last_error
+
+    def _unassign(self, key: Optional[Tuple[str, str]], endpoint: Endpoint):
+        if key is None:
+            endpoint.outstanding -= 1
+        elif self.assignments.get(key) is endpoint:
+            del self.assignments[key]
+            endpoint.outstanding -= 1
+
+    def release(self, task_id: str, agent_type: str) -> bool:
+        """
+        子任务结束（回调、取消或租约超时）：归还接受它的副本的在途计数。
+        """
+        endpoint = self.assignments.pop((task_id, agent_type), None)
+        if endpoint is None:
+            return False
+        endpoint.outstanding -= 1
+        return True
+
+    async def cancel(self, agent_type: str, target: Union[str, Sequence[str]], task_id: str) -> int:
+        """
+        通知该类型的所有副本停止 task_id 的子任务（不记录具体派发到了哪个副本），尽力而为，返回确认的副本数。
+        """
+        self._ensure_started()
+        pool = self.pool_for(agent_type, target)
+
+        async def notify(endpoint: Endpoint) -> bool:
+            try:
+                response = await self.client.post(endpoint.cancel_url, json={"task_id": task_id}, timeout=min(self.timeout, 5.0))
+            except httpx.RequestError as e:
+                logger.warning("Failed to cancel task %s on agent %s endpoint %s: %s", task_id, agent_type, endpoint.url, e)
+                return False
+            return response.status_code < 400
+
+        return sum(await asyncio.gather(*(notify(endpoint) for endpoint in pool.endpoints)))
+
+    async def probe(self):
+        async def check(endpoint: Endpoint):
+            started = time.monotonic()
+            try:
+                response = await self.client.get(endpoint.health_url, timeout=min(self.timeout, 5.0))
+                healthy = response.status_code < 500
+            except httpx.RequestError:
+                healthy = False
+            latency = time.monotonic() - started
+            if healthy:
+                if endpoint.health.state is not CircuitState.closed:
+                    logger.info("Agent endpoint %s passed health probe, restoring", endpoint.url)
+                endpoint.health.record_success(latency)
+            else:
+                endpoint.health.record_failure(latency)
+
+        endpoints = [endpoint for pool in self.pools.values() for endpoint in pool.endpoints]
+        await asyncio.gather(*(check(endpoint) for endpoint in endpoints))
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.error("Agent health probe failed: %s", e)
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {agent_type: pool.snapshot() for agent_type, pool in self.pools.items()}
+
+
+agent_endpoints = AgentEndpoints()
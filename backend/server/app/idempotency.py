@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+import orjson
+
+from backend.metrics import registry
+
+# 同一 Idempotency-Key 在此时间内重复提交都返回首次结果
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# 保留的 key 数上限，超出时淘汰最早的
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+logger = logging.getLogger(__name__)
+
+idempotency_requests = registry.counter("idempotency_requests_total", "Requests carrying an Idempotency-Key by outcome", ("outcome",))
+idempotency_keys = registry.gauge("idempotency_keys", "Idempotency keys currently remembered")
+
+
+class IdempotencyConflict(Exception):
+    """同一个 key 被用于内容不同的请求。"""
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "future")
+
+    def __init__(self, fingerprint: str, expires_at: float, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.future = future
+
+
+class IdempotencyStore:
+    """
+    有上限、带 TTL 的幂等记录。进行中的请求也登记其 future：并发的重复请求等待同一个结果，
+    而不是再执行一次。执行失败的 key 被移除，之后可以重试。
+    """
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl_seconds
+        self.max_keys = max_keys
+        # 按登记顺序排列，TTL 相同，因此最前面的最先过期
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+
+    def _evict(self, now: float):
+        # 进行中的记录不淘汰：首次请求完成时还要写入结果，并发的重复请求也在等它；
+        # 暂时取出，淘汰结束后按原顺序放回最前面（进行中的记录数受并发量限制）
+        in_flight = []
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) + len(in_flight) <= self.max_keys:
+                break
+            del self._entries[key]
+            if not entry.future.done():
+                in_flight.append((key, entry))
+        for key, entry in reversed(in_flight):
+            self._entries[key] = entry
+            self._entries.move_to_end(key, last=False)
+
+    async def run(self, key: Hashable, fingerprint: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        返回 (结果, 是否为重放)。同一 key 携带不同 fingerprint 时抛出 IdempotencyConflict。
+        """
+        now = time.monotonic()
+        self._evict(now)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                idempotency_requests.labels("conflict").inc()
+                raise IdempotencyConflict(key)
+            idempotency_requests.labels("replayed").inc()
+            try:
+                # shield：重复请求断开不影响首次请求的执行
+                return await asyncio.shield(entry.future), True
+            except asyncio.CancelledError:
+                if not entry.future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # 首次请求被取消（客户端断开），key 已移除：由本请求重新执行
+            logger.info("First request for idempotency key %s was cancelled, running it again", key)
+            return await self.run(key, fingerprint, factory)
+
+        idempotency_requests.labels("new").inc()
+        future = asyncio.get_running_loop().create_future()
+        entry = self._entries[key] = _Entry(fingerprint, now + self.ttl, future)
+        self._evict(now)
+        try:
+            result = await factory()
+        except BaseException as e:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有并发等待者时也标记为已读取，避免 "exception was never retrieved"
+                future.exception()
+            raise
+        future.set_result(result)
+        return result, False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+idempotency_store = IdempotencyStore()
+idempotency_keys.set_function(lambda: len(idempotency_store))
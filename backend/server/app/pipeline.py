@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional, Tuple
+
+
+class PipelineError(ValueError):
+    pass
+
+
+def build_graph(agent_types: List[str], dependencies: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """
+    校验并规范化依赖图 {agent_type: [上游 agent_type, ...]}：
+    所有节点必须在 agent_types 中、不能依赖自身、不能成环。未声明依赖的节点为根节点。
+    """
+    if len(set(agent_types)) != len(agent_types):
+        raise PipelineError("agent_types contains duplicates")
+
+    graph = {agent_type: [] for agent_type in agent_types}
+    for agent_type, upstream in (dependencies or {}).items():
+        if agent_type not in graph:
+            raise PipelineError(f"Dependency declared for unknown agent type: {agent_type}")
+        for dep in upstream:
+            if dep not in graph:
+                raise PipelineError(f"Agent type {agent_type} depends on unknown agent type: {dep}")
+            if dep == agent_type:
+                raise PipelineError(f"Agent type {agent_type} depends on itself")
+        graph[agent_type] = list(dict.fromkeys(upstream))
+
+    topological_order(graph)
+    return graph
+
+
+def topological_order(graph: Dict[str, List[str]]) -> List[str]:
+    indegree = {node: len(upstream) for node, upstream in graph.items()}
+    downstream = downstream_map(graph)
+    ready = [node for node, degree in indegree.items() if degree == 0]
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for child in downstream[node]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+    if len(order) != len(graph):
+        cycle = sorted(node for node, degree in indegree.items() if degree > 0)
+        raise PipelineError(f"Dependency cycle among agent types: {cycle}")
+    return order
+
+
+def downstream_map(graph: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    downstream: Dict[str, List[str]] = {node: [] for node in graph}
+    for node, upstream in graph.items():
+        for dep in upstream:
+            downstream[dep].append(node)
+    return downstream
+
+
+def descendants(graph: Dict[str, List[str]], node: str) -> List[str]:
+    downstream = downstream_map(graph)
+    seen: List[str] = []
+    stack = list(downstream[node])
+    while stack:
+        child = stack.pop()
+        if child not in seen:
+            seen.append(child)
+            stack.extend(downstream[child])
+    return seen
+
+
+def critical_path(graph: Dict[str, List[str]], durations: Dict[str, float]) -> Tuple[float, List[str]]:
+    """
+    按各节点实际耗时求最长路径，返回 (总耗时, 路径)。这是理想调度下端到端耗时的下界。
+    """
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for node in topological_order(graph):
+        best = max(graph[node], key=lambda dep: finish[dep], default=None)
+        finish[node] = (finish[best] if best else 0.0) + durations.get(node, 0.0)
+        previous[node] = best
+
+    if not finish:
+        return 0.0, []
+    node = max(finish, key=finish.get)
+    length = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return length, path[::-1]
@@ -189,25 +189,38 @@
 #
 
 import os
+import time
 import asyncio
-from fastapi import APIRouter, FastAPI, HTTPException, Query, Header, Depends
-from fastapi.responses import StreamingResponse
+import functools
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Header, Depends, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, FileResponse, Response
 import httpx
 import uuid
 from backend.types import StartTaskRequest, CallbackData
-from .task_manager import task_manager
-from typing import AsyncGenerator, Optional
+from backend.artifact_store import artifact_store, ArtifactTooLarge, ARTIFACT_MAX_UPLOAD_BYTES
+from backend.metrics import MetricsMiddleware, metrics_endpoint
+from backend.tracing import tracer, current_traceparent, with_traceparent
+from .task_manager import task_manager, UserStream
+from typing import AsyncGenerator, Dict, List, Optional, Set
 import orjson
 import json
 import logging
-from .token_manager import create_access_token, verify_token
+from .token_manager import create_access_token, verify_token, create_stream_token, verify_stream_token
+from .pipeline import PipelineError
+from .agent_registry import agent_registry, is_local
+from .endpoint_pool import agent_endpoints
+from .scheduler import scheduler
+from .idempotency import idempotency_store, fingerprint, IdempotencyConflict
 from jose.exceptions import ExpiredSignatureError
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, "agent_url.json")
 CALLBACK_PATH = "http://localhost:8000/api/callback"
+# 未指定 deadline_seconds 的任务的默认时限，0 表示不限
+TASK_DEADLINE_SECONDS = float(os.getenv("TASK_DEADLINE_SECONDS", "0"))
+# 长轮询 ?wait= 的上限（秒）
+TASK_POLL_MAX_WAIT = float(os.getenv("TASK_POLL_MAX_WAIT", "60"))
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 with open(CONFIG_PATH, "r", encoding="utf-8") as f:
@@ -217,11 +230,38 @@ router = APIRouter(prefix="/api")
 
 semaphore = asyncio.Semaphore(5)
 
+# task_id -> 截止时间到达时取消任务的计时器
+deadline_timers: Dict[str, asyncio.TimerHandle] = {}
+
+# 子任务结束（回调、取消、租约超时）时归还接受它的 agent 副本的在途计数
+scheduler.on_release = agent_endpoints.release
+
+# 回调之外的后台任务（派发下游、取消、通知 agent），持有引用避免被回收，异常记录日志
+background_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s failed", task.get_coro().__qualname__, exc_info=task.exception())
+
+
+def encode_sse(event: dict, name: Optional[str] = None) -> bytes:
+    frame = b'data: ' + orjson.dumps(event) + b'\n\n'
+    return b'event: ' + name.encode() + b'\n' + frame if name else frame
+
 
 def token_verification_dependency(token: str = Query(...), expected_user_id: str = None, expected_task_id: str = None):
     if expected_user_id and expected_task_id:
         if not verify_token(token, expected_user_id, expected_task_id):
-            logger.warning(f"Token verification failed for TaskID: {expected_task_id} and UserID: {expected_user_id}")
+            logger.warning("Token verification failed for TaskID: %s and UserID: %s", expected_task_id, expected_user_id)
             raise HTTPException(status_code=403, detail="Invalid or expired token")
     return token
 
@@ -231,9 +271,9 @@ def get_agent_urls_dependency():
     try:
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
             AGENT_URLS = json.load(f)
-        logger.info("Agent URLs loaded successfully.")
+        logger.debug("Agent URLs loaded successfully.")
     except Exception as e:
-        logger.error(f"Failed to load Agent URLs: {e}")
+        logger.error("Failed to load Agent URLs: %s", e)
         raise HTTPException(status_code=500, detail="Failed to load agent URLs.")
     return AGENT_URLS
 
@@ -248,98 +288,431 @@ async def sse_endpoint(
     user_id: str,
     task_id: str,
     token: str = Depends(token_verification_dependency),  # 普通用户 token 校验
-    x_admin_token: Optional[str] = Header(None)  # 管理员密钥
+    x_admin_token: Optional[str] = Header(None),  # 管理员密钥
+    cancel_on_disconnect: bool = Query(False)  # 最后一个订阅方断开时取消未完成的任务
 ):
     if x_admin_token == os.getenv("ADMIN_SECRET_KEY"):
-        logger.info(f"Admin accessed task {task_id}")
+        logger.info("Admin accessed task %s", task_id)
 
         async def stream() -> AsyncGenerator[bytes, None]:
             async for event in task_manager.listen_for_events(task_id):
-                yield b'data: ' + orjson.dumps(event) + b'\n\n'
-                logger.info(json.dumps(event))
+                yield encode_sse(event)
+                logger.debug("SSE event for task %s: %s", task_id, event)
 
         return StreamingResponse(stream(), media_type="text/event-stream")
 
-    logger.info(f"User {user_id} accessed task {task_id}")
+    logger.info("User %s accessed task %s", user_id, task_id)
 
     initial_state = await task_manager.get_initial_state(task_id)
     if not initial_state:
-        logger.error(f"Task {task_id} not found for user {user_id}")
+        logger.error("Task %s not found for user %s", task_id, user_id)
         raise HTTPException(status_code=404, detail="Task not found")
 
     async def stream() -> AsyncGenerator[bytes, None]:
-        async for event in task_manager.listen_for_events(task_id):
-            yield b'data: ' + orjson.dumps(event) + b'\n\n'
-            logger.info(json.dumps(event))
+        try:
+            async for event in task_manager.listen_for_events(task_id):
+                yield encode_sse(event)
+                logger.debug("SSE event for task %s: %s", task_id, event)
+        finally:
+            if cancel_on_disconnect:
+                cancel_if_abandoned(task_id)
 
     return StreamingResponse(stream(), media_type="text/event-stream")
 
 
+def etag_matches(request: Request, *etags: str) -> Optional[str]:
+    """
+    If-None-Match 命中任一 etag 时返回命中的那个（"*" 视为命中第一个），否则返回 None。
+    """
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*":
+        return etags[0]
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return next((etag for etag in etags if etag in candidates), None)
+
+
+async def versioned_response(request: Request, key, view: str, wait: float, since: Optional[int], render):
+    """
+    条件 GET 与长轮询：版本未变化（since 或 If-None-Match 命中）时返回 304；
+    带 wait 时先挂在变化通知上，直到版本前进或超时。
+    """
+    current = task_manager.task_version if key[0] == "task" else task_manager.user_version
+    if wait > 0 and since is not None and current(*key[1:]) == since:
+        await task_manager.wait_for_change(key, since, min(wait, TASK_POLL_MAX_WAIT))
+
+    version = current(*key[1:])
+    body = render()
+    if body is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    etag = f'"v{version}-{view}"'
+    headers = {"ETag": etag, "X-Version": str(version), "Cache-Control": "no-cache"}
+    if version == since or etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(orjson.dumps(body), media_type="application/json", headers=headers)
+
+
+def split_task_ids(tasks: Optional[str]) -> Optional[List[str]]:
+    if tasks is None:
+        return None
+    return [task_id for task_id in (part.strip() for part in tasks.split(",")) if task_id]
+
+
+def require_stream_token(user_id: str, token: Optional[str]) -> str:
+    """
+    校验用户级令牌，返回其绑定的租户。
+    """
+    tenant_id = verify_stream_token(token, user_id) if token else None
+    if tenant_id is None:
+        logger.warning("Stream token verification failed for UserID: %s", user_id)
+        raise HTTPException(status_code=403, detail="Invalid or expired token")
+    return tenant_id
+
+
+def owned_stream(user_id: str, tenant_id: str, stream_id: str) -> UserStream:
+    stream = task_manager.streams.get(stream_id)
+    if stream is None or stream.user_id != user_id or stream.tenant_id != tenant_id:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return stream
+
+
+@router.get("/stream/{user_id}")
+async def user_stream_endpoint(
+    user_id: str,
+    token: Optional[str] = Query(None),
+    tasks: Optional[str] = Query(None)  # 逗号分隔的 task_id；不填则跟随该用户的全部任务
+):
+    """
+    一个 SSE 连接复用该用户所有任务的事件。第一帧为 event: stream，携带 stream_id，
+    之后可通过 subscribe / unsubscribe 动态增减订阅；每条事件都带 task_id。
+    """
+    tenant_id = require_stream_token(user_id, token)
+    stream = task_manager.open_stream(user_id, split_task_ids(tasks), tenant_id)
+    logger.info("User %s opened stream %s", user_id, stream.stream_id)
+
+    async def events() -> AsyncGenerator[bytes, None]:
+        yield encode_sse({"stream_id": stream.stream_id}, "stream")
+        async for event in task_manager.listen_for_user(stream):
+            yield encode_sse(event)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.post("/stream/{user_id}/{stream_id}/subscribe")
+async def subscribe_stream(user_id: str, stream_id: str, body: dict, token: Optional[str] = Query(None)):
+    tenant_id = require_stream_token(user_id, token)
+    subscribed, rejected = task_manager.subscribe(owned_stream(user_id, tenant_id, stream_id), body.get("task_ids", []))
+    return {"subscribed": subscribed, "rejected": rejected}
+
+
+@router.post("/stream/{user_id}/{stream_id}/unsubscribe")
+async def unsubscribe_stream(user_id: str, stream_id: str, body: dict, token: Optional[str] = Query(None)):
+    tenant_id = require_stream_token(user_id, token)
+    return {"unsubscribed": task_manager.unsubscribe(owned_stream(user_id, tenant_id, stream_id), body.get("task_ids", []))}
+
+
+@router.websocket("/ws/{user_id}")
+async def user_websocket(websocket: WebSocket, user_id: str, token: Optional[str] = Query(None),
+                         tasks: Optional[str] = Query(None)):
+    """
+    WebSocket 版本的用户级事件流：服务端推送任务事件，客户端随时发送
+    {"action": "subscribe" | "unsubscribe", "task_ids": [...]} 调整订阅。
+    """
+    tenant_id = verify_stream_token(token, user_id) if token else None
+    if tenant_id is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    stream = task_manager.open_stream(user_id, split_task_ids(tasks), tenant_id)
+    send_lock = asyncio.Lock()
+
+    async def send(message: dict):
+        # 事件与订阅应答来自两个协程，串行发送
+        async with send_lock:
+            await websocket.send_text(orjson.dumps(message).decode())
+
+    await send({"type": "stream", "stream_id": stream.stream_id})
+
+    async def receive():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                task_ids = message.get("task_ids", [])
+                if message.get("action") == "subscribe":
+                    subscribed, rejected = task_manager.subscribe(stream, task_ids)
+                    reply = {"type": "subscribed", "task_ids": subscribed, "rejected": rejected}
+                elif message.get("action") == "unsubscribe":
+                    reply = {"type": "unsubscribed", "task_ids": task_manager.unsubscribe(stream, task_ids)}
+                else:
+                    reply = {"type": "error", "detail": f"Unknown action: {message.get('action')}"}
+                await send(reply)
+        except (WebSocketDisconnect, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        async for event in task_manager.listen_for_user(stream):
+            await send(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        task_manager.close_stream(stream)
+        logger.info("User %s closed websocket stream %s", user_id, stream.stream_id)
+
+
+def cancel_if_abandoned(task_id: str):
+    task = task_manager.tasks.get(task_id)
+    if task and not task.finished and not task_manager.sse_queues.get(task_id) and not task_manager.followers(task_id, task):
+        logger.info("Last subscriber of task %s disconnected, cancelling", task_id)
+        spawn(cancel_task(task_id, "client_disconnected"))
+
+
 
 @router.post("/reload-config")
 async def reload_config(agent_urls: dict = Depends(get_agent_urls_dependency)):
     return {"status": "ok"}
 
-@router.post("/start-task")
-async def start_task(
-        req: StartTaskRequest,
-        agent_urls: dict = Depends(get_agent_urls_dependency),
-        _=Depends(concurrency_control_dependency)
-):
-    task_id = str(uuid.uuid4())
+async def dispatch_subtask(task_id: str, user_id: str, agent_type: str, token: str, agent_urls: dict,
+                           traceparent: Optional[str] = None):
+    """
+    把一个子任务发送给对应 agent，payload 中附带所有上游节点的 file_url 与 result。
+    """
+    with tracer.span("router.dispatch", parent=traceparent, task_id=task_id, agent_type=agent_type):
+        await _send_subtask(task_id, user_id, agent_type, token, agent_urls)
+
+
+async def _send_subtask(task_id: str, user_id: str, agent_type: str, token: str, agent_urls: dict):
+    logger.info("User %s is sending task %s to agent %s", user_id, task_id, agent_type)
+    url = agent_urls.get(agent_type)
+    if not url:
+        logger.error("Agent type %s is missing for user %s", agent_type, user_id)
+        raise HTTPException(status_code=400, detail=f"Missing agent URL for type: {agent_type}")
+
+    # trace 上下文同时放进 payload 和回调地址，agent 与回调都能接上同一条 trace
+    callback_url = with_traceparent(f"{CALLBACK_PATH}/{user_id}/{task_id}/{agent_type}")
+    payload = {
+        "task_id": task_id,
+        "user_id": user_id,
+        "input": task_manager.input_data(task_id),
+        "upstream": task_manager.upstream_outputs(task_id, agent_type),
+        "callback_url": callback_url,
+        "token": token,
+        "traceparent": current_traceparent(),
+        # epoch 秒；agent 在截止时间取消 handler 与其中进行中的 LLM 调用
+        "deadline": task_manager.tasks[task_id].deadline
+    }
 
-    await task_manager.create_task(
+    if is_local(url):
+        # 进程内 agent：直接在本进程执行，完成后由 complete_subtask 更新状态，不经过 HTTP 回调
+        try:
+            agent_registry.submit(url, payload, functools.partial(complete_subtask, task_id, agent_type))
+        except (ImportError, AttributeError, ValueError) as e:
+            logger.error("Failed to load local agent %s (%s): %s", agent_type, url, e)
+            raise HTTPException(status_code=500, detail=f"Failed to load local agent: {agent_type}")
+        logger.info("User %s started task %s on local agent %s", user_id, task_id, agent_type)
+        return
+
+    try:
+        # url 可以是单个地址或副本地址列表，由副本池负责选择实例与失败切换
+        await agent_endpoints.post(agent_type, url, payload)
+        logger.info("User %s successfully sent task %s to agent %s", user_id, task_id, agent_type)
+
+    except httpx.HTTPStatusError as e:
+        logger.error("User %s failed to send task %s to agent %s: %s", user_id, task_id, agent_type, e)
+        raise HTTPException(status_code=e.response.status_code, detail=f"Agent {agent_type} error: {e}")
+    except httpx.RequestError as e:
+        logger.error("Network error for user %s while sending task %s to agent %s: %s", user_id, task_id, agent_type, e)
+        raise HTTPException(status_code=503, detail="Failed to reach agent")
+
+
+async def complete_subtask(task_id: str, agent_type: str, status: str, file_url: Optional[str] = None,
+                           result: Optional[dict] = None) -> bool:
+    """
+    HTTP 回调与进程内 agent 共用的完成处理：更新任务状态，completed 时派发新就绪的下游节点。
+    """
+    success = await task_manager.update_subtask_status(
         task_id=task_id,
-        user_id=req.user_id,
-        input_data=req.input_data,
-        agent_types=req.agent_types
+        agent_type=agent_type,
+        status=status,
+        file_url=file_url,
+        result=result
     )
-    token = create_access_token(task_id, req.user_id)
+    if status in ("completed", "failed", "cancelled"):
+        # 归还调度名额，排队中的子任务随即派发
+        scheduler.release(task_id, agent_type)
+        # agent 在截止时间自行上报的 cancelled 留给截止计时器记录原因
+        if success and status != "cancelled" and task_manager.is_task_finished(task_id):
+            clear_deadline(task_id)
+    if success and status == "completed":
+        logger.info("Task %s completed by agent %s", task_id, agent_type)
+        spawn(dispatch_ready(task_id))
+    return success
+
+
+async def cancel_task(task_id: str, reason: str = "cancelled") -> Optional[List[str]]:
+    """
+    取消任务：未结束的子任务标记为 cancelled，排队中的直接丢弃，已派发的归还调度名额并通知 agent 停止。
+    返回被取消的子任务，任务不存在时返回 None。
+    """
+    clear_deadline(task_id)
+    cancelled = await task_manager.cancel_task(task_id, reason)
+    if not cancelled:
+        return cancelled
+    released = scheduler.cancel_task(task_id)
+    notify_agents(task_id, released)
+    logger.info("Task %s cancelled (%s): %s, %s agents notified", task_id, reason, cancelled, len(released))
+    return cancelled
+
+
+def notify_agents(task_id: str, agent_types: List[str]):
+    local_notified = False
+    for agent_type in agent_types:
+        url = AGENT_URLS.get(agent_type)
+        if not url:
+            continue
+        if is_local(url):
+            if not local_notified:
+                agent_registry.cancel(task_id)
+                local_notified = True
+        else:
+            spawn(agent_endpoints.cancel(agent_type, url, task_id))
+
+
+def arm_deadline(task_id: str, seconds: float):
+    loop = asyncio.get_running_loop()
+    deadline_timers[task_id] = loop.call_later(seconds, expire_task, task_id)
+
+
+def expire_task(task_id: str):
+    deadline_timers.pop(task_id, None)
+    logger.warning("Task %s exceeded its deadline", task_id)
+    spawn(cancel_task(task_id, "deadline_exceeded"))
+
 
-    logger.info(f"User: {req.user_id} created task {task_id}")
+def clear_deadline(task_id: str):
+    timer = deadline_timers.pop(task_id, None)
+    if timer is not None:
+        timer.cancel()
 
-    async def send_to_agent(agent_type: str):
-        logger.info(f"User {req.user_id} is sending task {task_id} to agent {agent_type}")
+
+def schedule_subtasks(task_id: str, agent_types: List[str], token: str):
+    """
+    把就绪的子任务交给调度器，按任务的优先级与租户公平排队，名额空出时再真正派发。
+    """
+    task = task_manager.tasks[task_id]
+    traceparent = current_traceparent()
+    for agent_type in agent_types:
+        scheduler.submit(task_id, agent_type, task.tenant_id, task.priority,
+                         functools.partial(run_subtask, task_id, task.user_id, agent_type, token, traceparent))
+
+
+async def run_subtask(task_id: str, user_id: str, agent_type: str, token: str, traceparent: Optional[str] = None):
+    task = task_manager.tasks.get(task_id)
+    if not task or task.cancelled:
+        # 排队期间任务已取消，名额已由 cancel_task 归还
+        return
+    try:
+        await dispatch_subtask(task_id, user_id, agent_type, token, AGENT_URLS, traceparent)
+    except HTTPException as e:
+        logger.error("Dispatch of %s for task %s failed: %s", agent_type, task_id, e.detail)
+        await complete_subtask(task_id, agent_type, "failed")
+
+
+async def dispatch_ready(task_id: str):
+    """
+    上游完成后把新就绪的下游节点交给调度器（在回调之外的后台执行）。
+    """
+    task = task_manager.tasks.get(task_id)
+    if not task:
+        return
+    ready = await task_manager.claim_ready(task_id)
+    if ready:
+        schedule_subtasks(task_id, ready, create_access_token(task_id, task.user_id))
+
+
+def validate_agents(agent_types: List[str], agent_urls: dict):
+    """
+    派发改为异步排队后，缺失的 agent 地址与无法加载的进程内入口在创建任务前就拒绝。
+    """
+    for agent_type in agent_types:
         url = agent_urls.get(agent_type)
         if not url:
-            logger.error(f"Agent type {agent_type} is missing for user {req.user_id}")
             raise HTTPException(status_code=400, detail=f"Missing agent URL for type: {agent_type}")
+        if is_local(url):
+            try:
+                agent_registry.resolve(url)
+            except (ImportError, AttributeError, ValueError) as e:
+                logger.error("Failed to load local agent %s (%s): %s", agent_type, url, e)
+                raise HTTPException(status_code=500, detail=f"Failed to load local agent: {agent_type}")
 
-        callback_url = f"{CALLBACK_PATH}/{req.user_id}/{task_id}/{agent_type}"
-        payload = {
-            "task_id": task_id,
-            "user_id": req.user_id,
-            "input": req.input_data,
-            "callback_url": callback_url,
-            "token": token
-        }
 
-        try:
-            async with httpx.AsyncClient(timeout=100.0) as client:
-                response = await client.post(url, json=payload)
-                response.raise_for_status()
-            logger.info(f"User {req.user_id} successfully sent task {task_id} to agent {agent_type}")
-
-        except httpx.HTTPStatusError as e:
-            logger.error(f"User {req.user_id} failed to send task {task_id} to agent {agent_type}: {e}")
-            raise HTTPException(status_code=e.response.status_code, detail=f"Agent {agent_type} error: {e}")
-        except httpx.RequestError as e:
-            logger.error(
-                f"Network error for user {req.user_id} while sending task {task_id} to agent {agent_type}: {e}")
-            raise HTTPException(status_code=503, detail="Failed to reach agent")
-
-    tasks = [send_to_agent(agent_type) for agent_type in req.agent_types]
-    try:
-        await asyncio.gather(*tasks)
-    except HTTPException as e:
-        raise e
+@router.post("/start-task")
+async def start_task(
+        req: StartTaskRequest,
+        response: Response,
+        agent_urls: dict = Depends(get_agent_urls_dependency),
+        _=Depends(concurrency_control_dependency),
+        traceparent: Optional[str] = Header(None),
+        idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    if not idempotency_key:
+        return await create_task_for(req, agent_urls, traceparent)
 
-    logger.info(f"Task {task_id} created and distributed to agents: {req.agent_types}")
+    # key 按租户（没有租户时按用户）隔离；重复提交返回首次的 task_id 与令牌，不再创建任务
+    scope = (req.tenant_id or req.user_id, idempotency_key)
+    try:
+        result, replayed = await idempotency_store.run(
+            scope, fingerprint(req.model_dump(mode="json")), lambda: create_task_for(req, agent_urls, traceparent))
+    except IdempotencyConflict:
+        logger.warning("Idempotency-Key %s reused by user %s with a different request", idempotency_key, req.user_id)
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if replayed:
+        logger.info("Replayed task %s for Idempotency-Key %s", result["task_id"], idempotency_key)
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def create_task_for(req: StartTaskRequest, agent_urls: dict, traceparent: Optional[str]) -> dict:
+    with tracer.span("router.start_task", parent=traceparent, user_id=req.user_id, priority=req.priority.value) as span:
+        validate_agents(req.agent_types, agent_urls)
+        task_id = str(uuid.uuid4())
+        deadline_seconds = req.deadline_seconds or TASK_DEADLINE_SECONDS
 
-    return {
-        "task_id": task_id,
-        "token": token
-    }
+        try:
+            await task_manager.create_task(
+                task_id=task_id,
+                user_id=req.user_id,
+                input_data=req.input_data,
+                agent_types=req.agent_types,
+                dependencies=req.dependencies,
+                tenant_id=req.tenant_id,
+                priority=req.priority.value,
+                deadline=time.time() + deadline_seconds if deadline_seconds else None
+            )
+        except PipelineError as e:
+            logger.warning("User %s submitted an invalid pipeline: %s", req.user_id, e)
+            raise HTTPException(status_code=400, detail=str(e))
+        token = create_access_token(task_id, req.user_id)
+
+        span.set("task_id", task_id)
+        logger.info("User: %s created task %s", req.user_id, task_id)
+        if deadline_seconds:
+            arm_deadline(task_id, deadline_seconds)
+
+        # 只调度根节点，下游节点在上游回调 completed 时调度
+        roots = await task_manager.claim_ready(task_id)
+        schedule_subtasks(task_id, roots, token)
+
+        logger.info("Task %s created and scheduled for agents: %s", task_id, roots)
+
+        return {
+            "task_id": task_id,
+            "token": token,
+            # 用户级事件流 /api/stream/{user_id} 与 /api/ws/{user_id} 的令牌，只能看到同一租户下的任务
+            "stream_token": create_stream_token(req.user_id, req.tenant_id or req.user_id)
+        }
 
 
 @router.post("/callback/{user_id}/{task_id}/{agent_type}")
@@ -349,49 +722,196 @@ async def handle_callback(
         agent_type: str,
         data: CallbackData,
         token: str = Depends(token_verification_dependency),
-        _=Depends(concurrency_control_dependency)
+        _=Depends(concurrency_control_dependency),
+        traceparent: Optional[str] = Query(None)
 ):
     if not token_verification_dependency(token, user_id, task_id):
         return None
 
-    logger.info(f"Received callback for task {task_id}, agent {agent_type}, status={data.status}")
-    logger.debug(f"Full callback data: {data}")
+    logger.info("Received callback for task %s, agent %s, status=%s", task_id, agent_type, data.status)
+    logger.debug("Full callback data: %s", data)
 
-    valid_statuses = ["pending", "running", "completed", "failed"]
+    valid_statuses = ["pending", "running", "completed", "failed", "cancelled"]
     if data.status not in valid_statuses:
-        logger.warning(f"Invalid status received: {data.status}")
+        logger.warning("Invalid status received: %s", data.status)
         raise HTTPException(status_code=400, detail=f"Invalid status: {data.status}")
 
     try:
-        success = await task_manager.update_subtask_status(
-            task_id=task_id,
-            agent_type=agent_type,
-            status=data.status,
-            file_url=data.file_url
-        )
+        with tracer.span("router.callback", parent=traceparent, task_id=task_id, agent_type=agent_type,
+                         status=str(data.status.value)):
+            success = await complete_subtask(task_id, agent_type, data.status, data.file_url, data.result)
 
         if not success:
-            logger.warning(f"Callback failed: Task {task_id} or agent {agent_type} not found")
+            logger.warning("Callback failed: Task %s or agent %s not found", task_id, agent_type)
             raise HTTPException(status_code=404, detail="Task or agent type not found")
 
-        if data.status == "completed":
-            logger.info(f"Task {task_id} completed by agent {agent_type}")
-
-        logger.info(f"Callback processed for task {task_id}. Current status: {data.status}")
+        logger.info("Callback processed for task %s. Current status: %s", task_id, data.status)
         return {"status": "ok"}
 
+    except HTTPException:
+        # 404 必须原样返回：发件箱把 4xx 视为不可重试并丢弃，500 则会被无限重试
+        raise
     except Exception as e:
-        logger.error(f"Error processing callback for task {task_id}: {str(e)}")
+        logger.error("Error processing callback for task %s: %s", task_id, e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.post("/tasks/{user_id}/{task_id}/cancel")
+async def cancel_task_endpoint(
+        user_id: str,
+        task_id: str,
+        token: Optional[str] = Query(None),
+        x_admin_token: Optional[str] = Header(None)
+):
+    admin_key = os.getenv("ADMIN_SECRET_KEY")
+    if not (admin_key and x_admin_token == admin_key) and not (token and verify_token(token, user_id, task_id)):
+        raise HTTPException(status_code=403, detail="Invalid or expired token")
+
+    cancelled = await cancel_task(task_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"task_id": task_id, "cancelled": cancelled}
+
+
+@router.get("/scheduler")
+async def get_scheduler():
+    return scheduler.snapshot()
+
+
+@router.get("/agent-endpoints")
+async def get_agent_endpoints():
+    return agent_endpoints.snapshot()
+
+
+@router.get("/admin/traces")
+async def get_traces(
+        trace_id: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=5000),
+        x_admin_token: Optional[str] = Header(None)
+):
+    admin_key = os.getenv("ADMIN_SECRET_KEY")
+    if not admin_key or x_admin_token != admin_key:
+        raise HTTPException(status_code=403, detail="Admin token required")
+    if trace_id:
+        return {"trace_id": trace_id, "spans": tracer.export(trace_id, limit)}
+    return {"traces": tracer.traces(limit), **tracer.counters}
+
+
 @router.get("/tasks/{user_id}")
-async def get_tasks(user_id: str):
-    return task_manager.get_user_tasks(user_id)
+async def get_tasks(
+        user_id: str,
+        request: Request,
+        token: Optional[str] = Query(None),
+        view: str = Query("full", pattern="^(full|summary)$"),
+        wait: float = Query(0, ge=0),
+        since: Optional[int] = Query(None, ge=0)
+):
+    # 列表带 input_data 且支持长轮询挂起，先校验用户级令牌，只返回其租户下的任务
+    tenant_id = require_stream_token(user_id, token)
+    summary = view == "summary"
+    # 版本、ETag 与长轮询都按 (user_id, tenant_id)：同名用户在其他租户下的变化不会唤醒或失效本租户的列表
+    return await versioned_response(request, ("user", user_id, tenant_id), view, wait, since,
+                                    lambda: task_manager.get_user_tasks(user_id, summary, tenant_id))
+
+
+@router.get("/tasks/{user_id}/{task_id}")
+async def get_task(
+        user_id: str,
+        task_id: str,
+        request: Request,
+        token: Optional[str] = Query(None),
+        view: str = Query("full", pattern="^(full|summary)$"),
+        wait: float = Query(0, ge=0),
+        since: Optional[int] = Query(None, ge=0)
+):
+    # 任务令牌只对应这一个任务；用户级令牌只能查看其租户下的任务
+    task_token = bool(token) and verify_token(token, user_id, task_id)
+    tenant_id = verify_stream_token(token, user_id) if token and not task_token else None
+    if not task_token and tenant_id is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired token")
+    task = task_manager.tasks.get(task_id)
+    if task is None or task.user_id != user_id or (tenant_id is not None and task.tenant_id != tenant_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    summary = view == "summary"
+    return await versioned_response(request, ("task", task_id), view, wait, since,
+                                    lambda: task_manager.task_view(task_id, summary))
+
+
+@router.api_route("/artifacts/{digest}", methods=["GET", "HEAD"])
+async def get_artifact(digest: str, request: Request, filename: Optional[str] = None):
+    artifact = artifact_store.meta(digest)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    # 内容寻址：摘要即强 ETag，内容永不变化，可长期缓存；gzip 副本是另一份字节，使用不同的强 ETag
+    etag, gzip_etag = f'"{digest}"', f'"{digest}-gzip"'
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept-Encoding"}
+
+    path = artifact_store.path(digest)
+    compressed = artifact_store.compressed_path(digest)
+    # Range 请求按原始字节计算偏移，只对完整下载返回预压缩副本
+    use_gzip = compressed and "range" not in request.headers and "gzip" in request.headers.get("accept-encoding", "")
+
+    matched = etag_matches(request, etag, gzip_etag)
+    if matched:
+        return Response(status_code=304, headers={**headers, "ETag": matched})
+
+    if use_gzip:
+        path = compressed
+        headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = gzip_etag if use_gzip else etag
+
+    # FileResponse 自带 Range 支持；ASGI 服务器支持 pathsend 扩展时由服务器零拷贝发送
+    return FileResponse(
+        path,
+        media_type=artifact.content_type,
+        filename=filename or artifact.filename,
+        headers=headers
+    )
+
+
+@router.post("/artifacts/{user_id}/{task_id}")
+async def upload_artifact(
+        user_id: str,
+        task_id: str,
+        request: Request,
+        filename: str = Query(...),
+        token: str = Query(...)
+):
+    """
+    供不与后端共享磁盘的 agent 上传产物，返回可直接作为 file_url 回调的地址。
+    """
+    if not verify_token(token, user_id, task_id):
+        raise HTTPException(status_code=403, detail="Invalid or expired token")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > ARTIFACT_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Artifact too large")
+
+    try:
+        artifact = await artifact_store.aput_chunks(
+            request.stream(),
+            filename=filename,
+            content_type=request.headers.get("content-type"),
+            max_size=ARTIFACT_MAX_UPLOAD_BYTES
+        )
+    except ArtifactTooLarge:
+        logger.warning("Rejected artifact upload over %s bytes for task %s", ARTIFACT_MAX_UPLOAD_BYTES, task_id)
+        raise HTTPException(status_code=413, detail="Artifact too large")
+    logger.info("Stored artifact %s (%s bytes) for task %s", artifact.digest, artifact.size, task_id)
+    return {**artifact.to_dict(), "url": artifact_store.url(artifact.digest)}
 
 
 def register_routes(app: FastAPI):
     app.include_router(router)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+async def shutdown():
+    """
+    应用关闭时调用（见 __main__ 的 lifespan）：停止副本健康探测并关闭派发用的 keep-alive 客户端。
+    """
+    await agent_endpoints.close()
 
 
 @router.get("/health")
@@ -0,0 +1,288 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.metrics import registry
+
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "64"))
+SCHEDULER_TENANT_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_TENANT_MAX_IN_FLIGHT", "8"))
+SCHEDULER_QUANTUM = float(os.getenv("SCHEDULER_QUANTUM", "1"))
+# 子任务占用名额的最长时间，超时未收到完成回调时自动归还，避免 agent 失联导致名额泄漏
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "900"))
+# 形如 "tenant-a=4,tenant-b=2"
+SCHEDULER_TENANT_WEIGHTS = os.getenv("SCHEDULER_TENANT_WEIGHTS", "")
+SCHEDULER_TENANT_LIMITS = os.getenv("SCHEDULER_TENANT_LIMITS", "")
+
+# 优先级从高到低；高优先级有排队的子任务时总是先派发，低优先级使用剩余容量
+PRIORITIES = ("interactive", "standard", "batch")
+DEFAULT_PRIORITY = "standard"
+
+logger = logging.getLogger(__name__)
+
+scheduler_queued = registry.gauge("scheduler_queued", "Subtasks waiting for dispatch by priority", ("priority",))
+scheduler_in_flight = registry.gauge("scheduler_in_flight", "Dispatched subtasks holding a scheduler slot")
+scheduler_dispatched = registry.counter("scheduler_dispatched_total", "Subtasks dispatched by priority", ("priority",))
+scheduler_queue_wait = registry.histogram("scheduler_queue_wait_seconds", "Time subtasks wait in the scheduler by priority", ("priority",))
+scheduler_lease_expired = registry.counter("scheduler_lease_expired_total", "Slots reclaimed after the lease expired")
+scheduler_cancelled = registry.counter("scheduler_cancelled_total", "Queued subtasks dropped because their task was cancelled")
+
+Dispatch = Callable[[], Awaitable[Any]]
+
+
+def _parse_overrides(value: str, cast=float) -> Dict[str, Any]:
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        tenant, _, number = item.partition("=")
+        overrides[tenant.strip()] = _positive(f"tenant {tenant.strip()}", cast(number))
+    return overrides
+
+
+def _positive(name: str, value):
+    # 权重 / quantum 不为正时租户永远攒不够额度，上限不为正时永远无法派发
+    if not value > 0:
+        raise ValueError(f"Scheduler {name} must be positive, got {value}")
+    return value
+
+
+class Job:
+    __slots__ = ("task_id", "agent_type", "tenant", "priority", "cost", "dispatch", "enqueued_at")
+
+    def __init__(self, task_id: str, agent_type: str, tenant: str, priority: str, dispatch: Dispatch, cost: float = 1.0):
+        self.task_id = task_id
+        self.agent_type = agent_type
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.dispatch = dispatch
+        self.enqueued_at = time.perf_counter()
+
+
+class PriorityClass:
+    """
+    一个优先级内按租户做 deficit round robin：每轮给排在队首的租户 quantum × weight 的额度，
+    额度够付队首子任务的 cost 就派发，否则轮到下一个租户。大批量提交的租户每轮也只能拿到自己的份额。
+    """
+
+    __slots__ = ("queues", "active", "deficit", "size")
+
+    def __init__(self):
+        self.queues: Dict[str, Deque[Job]] = {}
+        self.active: Deque[str] = deque()
+        self.deficit: Dict[str, float] = {}
+        self.size = 0
+
+    def push(self, job: Job):
+        queue = self.queues.get(job.tenant)
+        if queue is None:
+            queue = self.queues[job.tenant] = deque()
+            self.active.append(job.tenant)
+            self.deficit[job.tenant] = 0.0
+        queue.append(job)
+        self.size += 1
+
+    def pop(self, quantum: float, weight: Callable[[str], float], eligible: Callable[[str], bool]) -> Optional[Job]:
+        # 不逐个租户空转：算出每个可派发租户还要几轮额度才够付队首的 cost，
+        # 按 (轮数, 轮转位置) 最先够额度的租户就是逐步轮转会派发的那个，再一次性补上途经各租户的额度
+        winner = None
+        for position, tenant in enumerate(self.active):
+            if not eligible(tenant):
+                # 达到在途上限的租户不累积额度
+                continue
+            shortfall = self.queues[tenant][0].cost - self.deficit[tenant]
+            rounds = max(0, math.ceil(shortfall / (quantum * weight(tenant))))
+            if winner is None or rounds < winner[0]:
+                winner = (rounds, position)
+                if not rounds:
+                    break
+        if winner is None:
+            return None
+        rounds, position = winner
+        for index, tenant in enumerate(self.active):
+            if eligible(tenant) and (rounds or index < position):
+                # 排在赢家之前的租户在最后一轮也被经过一次
+                self.deficit[tenant] += quantum * weight(tenant) * (rounds + 1 if index < position else rounds)
+        self.active.rotate(-position)
+        tenant = self.active[0]
+        queue = self.queues[tenant]
+        job = queue.popleft()
+        self.deficit[tenant] -= job.cost
+        self.size -= 1
+        if not queue:
+            # 队列空了就退出轮转，额度清零（DRR 不允许空闲租户攒额度）
+            del self.queues[tenant], self.deficit[tenant]
+            self.active.popleft()
+        return job
+
+    def remove_task(self, task_id: str) -> int:
+        """
+        丢弃某个任务排队中的全部子任务，返回丢弃的数量。
+        """
+        removed = 0
+        for tenant in list(self.queues):
+            queue = self.queues[tenant]
+            kept = deque(job for job in queue if job.task_id != task_id)
+            if len(kept) == len(queue):
+                continue
+            removed += len(queue) - len(kept)
+            if kept:
+                self.queues[tenant] = kept
+            else:
+                del self.queues[tenant], self.deficit[tenant]
+                self.active.remove(tenant)
+        self.size -= removed
+        return removed
+
+
+class Scheduler:
+    """
+    位于任务创建与 agent 派发之间：子任务按优先级 + 租户（API key 或用户）排队，
+    全局在途数不超过 max_in_flight，单个租户在途数不超过其上限。
+    子任务派发后占用一个名额，直到 release（完成 / 失败回调）或租约超时。
+    """
+
+    def __init__(self, max_in_flight: int = SCHEDULER_MAX_IN_FLIGHT, tenant_max_in_flight: int = SCHEDULER_TENANT_MAX_IN_FLIGHT,
+                 quantum: float = SCHEDULER_QUANTUM, lease_seconds: float = SCHEDULER_LEASE_SECONDS,
+                 weights: Optional[Dict[str, float]] = None, tenant_limits: Optional[Dict[str, int]] = None):
+        self.max_in_flight = max_in_flight
+        self.tenant_max_in_flight = tenant_max_in_flight
+        self.quantum = _positive("quantum", quantum)
+        self.lease_seconds = lease_seconds
+        self.weights = dict(weights if weights is not None else _parse_overrides(SCHEDULER_TENANT_WEIGHTS))
+        self.tenant_limits = dict(tenant_limits if tenant_limits is not None else _parse_overrides(SCHEDULER_TENANT_LIMITS, int))
+        for overrides in (self.weights, self.tenant_limits):
+            for tenant, value in overrides.items():
+                _positive(f"tenant {tenant}", value)
+        self.classes = {priority: PriorityClass() for priority in PRIORITIES}
+        self.in_flight = 0
+        self.tenant_in_flight: Dict[str, int] = {}
+        # (task_id, agent_type) -> (tenant, 租约计时器)
+        self.leases: Dict[Tuple[str, str], Tuple[str, Optional[asyncio.TimerHandle]]] = {}
+        self._running: set = set()
+        # 名额归还时的通知（回调、取消或租约超时），例如归还 agent 副本的在途计数
+        self.on_release: Optional[Callable[[str, str], Any]] = None
+        self._dispatched = {priority: scheduler_dispatched.labels(priority) for priority in PRIORITIES}
+        self._queue_wait = {priority: scheduler_queue_wait.labels(priority) for priority in PRIORITIES}
+        for priority, priority_class in self.classes.items():
+            scheduler_queued.labels(priority).set_function(lambda priority_class=priority_class: priority_class.size)
+        scheduler_in_flight.set_function(lambda: self.in_flight)
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, 1.0)
+
+    def limit(self, tenant: str) -> int:
+        return self.tenant_limits.get(tenant, self.tenant_max_in_flight)
+
+    def configure_tenant(self, tenant: str, weight: Optional[float] = None, max_in_flight: Optional[int] = None):
+        if weight is not None:
+            self.weights[tenant] = _positive(f"tenant {tenant} weight", weight)
+        if max_in_flight is not None:
+            self.tenant_limits[tenant] = _positive(f"tenant {tenant} max_in_flight", max_in_flight)
+        self._pump()
+
+    def _eligible(self, tenant: str) -> bool:
+        return self.tenant_in_flight.get(tenant, 0) < self.limit(tenant)
+
+    def submit(self, task_id: str, agent_type: str, tenant: str, priority: str, dispatch: Dispatch, cost: float = 1.0) -> Job:
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority: {priority}")
+        job = Job(task_id, agent_type, tenant, priority, dispatch, cost)
+        self.classes[priority].push(job)
+        self._pump()
+        return job
+
+    def _next(self) -> Optional[Job]:
+        for priority in PRIORITIES:
+            priority_class = self.classes[priority]
+            if priority_class.size:
+                job = priority_class.pop(self.quantum, self.weight, self._eligible)
+                if job is not None:
+                    return job
+        return None
+
+    def _pump(self):
+        while self.in_flight < self.max_in_flight:
+            job = self._next()
+            if job is None:
+                return
+            self._start(job)
+
+    def _start(self, job: Job):
+        self.in_flight += 1
+        self.tenant_in_flight[job.tenant] = self.tenant_in_flight.get(job.tenant, 0) + 1
+        loop = asyncio.get_running_loop()
+        key = (job.task_id, job.agent_type)
+        timer = loop.call_later(self.lease_seconds, self._expire, key) if self.lease_seconds > 0 else None
+        self.leases[key] = (job.tenant, timer)
+        self._queue_wait[job.priority].observe(time.perf_counter() - job.enqueued_at)
+        self._dispatched[job.priority].inc()
+        # 在空白上下文中派发：_pump 可能由其他任务的回调触发，不能继承调用方当前的 span
+        task = loop.create_task(self._run(job), context=contextvars.Context())
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, job: Job):
+        try:
+            await job.dispatch()
+        except Exception as e:
+            # 派发函数自身应处理失败并调用 release；这里兜底，避免名额泄漏
+            logger.error("Dispatch of %s for task %s raised: %s", job.agent_type, job.task_id, e)
+            self.release(job.task_id, job.agent_type)
+
+    def release(self, task_id: str, agent_type: str) -> bool:
+        lease = self.leases.pop((task_id, agent_type), None)
+        if lease is None:
+            return False
+        tenant, timer = lease
+        if timer is not None:
+            timer.cancel()
+        if self.on_release is not None:
+            self.on_release(task_id, agent_type)
+        self.in_flight -= 1
+        remaining = self.tenant_in_flight[tenant] - 1
+        if remaining:
+            self.tenant_in_flight[tenant] = remaining
+        else:
+            del self.tenant_in_flight[tenant]
+        self._pump()
+        return True
+
+    def cancel_task(self, task_id: str) -> List[str]:
+        """
+        任务取消或超过截止时间：排队中的子任务直接丢弃，已派发的立即归还名额。
+        返回归还名额的 agent_type，调用方据此通知 agent 停止执行。
+        """
+        dropped = sum(priority_class.remove_task(task_id) for priority_class in self.classes.values())
+        if dropped:
+            scheduler_cancelled.inc(dropped)
+        released = [agent_type for lease_task_id, agent_type in list(self.leases) if lease_task_id == task_id]
+        for agent_type in released:
+            self.release(task_id, agent_type)
+        if dropped or released:
+            logger.info("Cancelled task %s: dropped %s queued subtasks, released %s slots", task_id, dropped, len(released))
+        return released
+
+    def _expire(self, key: Tuple[str, str]):
+        if key in self.leases:
+            logger.warning("Scheduler lease expired for task %s agent %s, reclaiming slot", *key)
+            scheduler_lease_expired.inc()
+            self.leases[key] = (self.leases[key][0], None)
+            self.release(*key)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {priority: priority_class.size for priority, priority_class in self.classes.items()},
+            "tenants": {
+                tenant: {"in_flight": count, "max_in_flight": self.limit(tenant), "weight": self.weight(tenant)}
+                for tenant, count in self.tenant_in_flight.items()
+            },
+        }
+
+
+scheduler = Scheduler()
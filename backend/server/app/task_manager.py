@@ -185,103 +185,429 @@
 #
 #
 # task_manager = TaskManager()
+import uuid
 import asyncio
-from typing import Dict, List, Optional, AsyncGenerator
+import time
+from enum import IntEnum
+from typing import Any, Dict, Iterable, List, Optional, AsyncGenerator, Set, Tuple
 from collections import defaultdict
 import logging
-logging.basicConfig(level=logging.INFO)
+from .pipeline import build_graph, critical_path, descendants
+from backend.metrics import registry, LATENCY_BUCKETS
 logger = logging.getLogger(__name__)
 
+tasks_live = registry.gauge("tasks_live", "Tasks currently held by the TaskManager")
+tasks_created = registry.counter("tasks_created_total", "Tasks created")
+subtask_updates = registry.counter("subtask_updates_total", "Subtask status updates by status", ("status",))
+tasks_cancelled = registry.counter("tasks_cancelled_total", "Tasks cancelled before completion by reason", ("reason",))
+sse_subscribers = registry.gauge("sse_subscribers", "Open SSE subscriber queues")
+user_streams_open = registry.gauge("user_streams", "Open multiplexed per-user event streams")
+broadcast_latency = registry.histogram("task_broadcast_duration_seconds", "Time to fan one event out to all subscribers",
+                                       buckets=(0.00001, 0.0001,) + LATENCY_BUCKETS[:6])
+
+
+class Status(IntEnum):
+    pending = 0
+    running = 1
+    completed = 2
+    failed = 3
+    cancelled = 4
+
+    @classmethod
+    def parse(cls, status) -> "Status":
+        # 回调传入的可能是 AgentState（processing 的值为 "running"）或普通字符串
+        return cls[str(getattr(status, "value", status))]
+
+
+FINISHED = (Status.completed, Status.failed, Status.cancelled)
+_update_counters = {status: subtask_updates.labels(status.name) for status in Status}
+
+
+class SubtaskRecord:
+    __slots__ = ("status", "file_url", "result", "upstream", "dispatched_at", "finished_at")
+
+    def __init__(self, upstream: Tuple[str, ...]):
+        self.status = Status.pending
+        self.file_url = ""
+        self.result: Optional[Dict[str, Any]] = None
+        self.upstream = upstream  # 上游 agent_type，全部 completed 后才派发
+        self.dispatched_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"status": self.status.name, "file_url": self.file_url}
+
+
+class TaskRecord:
+    """
+    常驻内存的任务状态，只保存调度与推送需要的字段；input_data 放在 TaskManager.inputs，
+    只在派发与查询时取用。completed_count / terminal_count 随状态变化增减，完成与结束判断均为 O(1)。
+    """
+
+    __slots__ = ("user_id", "tenant_id", "priority", "agents", "completed_count", "terminal_count", "created_at", "deadline", "cancelled",
+                 "version")
+
+    def __init__(self, user_id: str, graph: Dict[str, List[str]], tenant_id: str, priority: str,
+                 deadline: Optional[float]):
+        self.user_id = user_id
+        self.tenant_id = tenant_id
+        self.priority = priority
+        self.agents: Dict[str, SubtaskRecord] = {agent_type: SubtaskRecord(tuple(upstream)) for agent_type, upstream in graph.items()}
+        self.completed_count = 0
+        self.terminal_count = 0  # 处于 completed / failed / cancelled 的子任务数
+        self.created_at = time.time()
+        self.deadline = deadline  # epoch 秒，随 payload 下发给 agent
+        self.cancelled: Optional[str] = None  # 取消原因：cancelled / deadline_exceeded / client_disconnected
+        self.version = 0  # 最近一次变化时 TaskManager.clock 的值
+
+    @property
+    def completed(self) -> bool:
+        return self.completed_count == len(self.agents)
+
+    @property
+    def finished(self) -> bool:
+        # 全部子任务都已结束（含失败）或任务被取消后，不会再有新的事件
+        return self.terminal_count == len(self.agents) or self.cancelled is not None
+
+    def graph(self) -> Dict[str, List[str]]:
+        return {agent_type: list(subtask.upstream) for agent_type, subtask in self.agents.items()}
+
+    def set_status(self, subtask: SubtaskRecord, status: Status):
+        if subtask.status is Status.completed:
+            self.completed_count -= 1
+        if status is Status.completed:
+            self.completed_count += 1
+        if subtask.status in FINISHED:
+            self.terminal_count -= 1
+        if status in FINISHED:
+            self.terminal_count += 1
+        subtask.status = status
+        _update_counters[status].inc()
+
+    def status_dict(self) -> Dict[str, Dict[str, str]]:
+        return {agent_type: subtask.to_dict() for agent_type, subtask in self.agents.items()}
+
+
+class UserStream:
+    """
+    一个连接上复用某个用户的多个任务的事件。每个任务只保留最新一次快照（事件本身就是完整状态），
+    消费方慢时中间状态被合并，占用的内存不超过订阅的任务数。
+    follow_all 时自动订阅该用户之后创建的任务（excluded 中为已退订的任务）。
+    只能看到 tenant_id（来自令牌）下的任务：user_id 由调用方提交，不同租户可能同名。
+    """
+
+    __slots__ = ("stream_id", "user_id", "tenant_id", "task_ids", "excluded", "follow_all", "pending", "wakeup", "closed")
+
+    def __init__(self, user_id: str, follow_all: bool, tenant_id: Optional[str] = None):
+        self.stream_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.tenant_id = tenant_id or user_id
+        self.task_ids: Set[str] = set()
+        self.excluded: Set[str] = set()
+        self.follow_all = follow_all
+        self.pending: Dict[str, dict] = {}
+        self.wakeup = asyncio.Event()
+        self.closed = False
+
+    def owns(self, task: "TaskRecord") -> bool:
+        return task.user_id == self.user_id and task.tenant_id == self.tenant_id
+
+    def follows(self, task_id: str) -> bool:
+        if self.follow_all:
+            return task_id not in self.excluded
+        return task_id in self.task_ids
+
+    def push(self, task_id: str, event: dict):
+        self.pending[task_id] = event
+        self.wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+    async def next_batch(self) -> List[dict]:
+        """
+        等待并取出所有待推送的事件；流已关闭时返回空列表。
+        """
+        while not self.pending and not self.closed:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+        batch = list(self.pending.values())
+        self.pending.clear()
+        return batch
+
 
 class TaskManager:
     def __init__(self):
         self.lock = asyncio.Lock()
-        self.tasks: Dict[str, dict] = {}
+        self.tasks: Dict[str, TaskRecord] = {}
+        # input_data 只在派发和查询时用到，不放进常驻的 TaskRecord
+        self.inputs: Dict[str, dict] = {}
         self.sse_queues: Dict[str, List[asyncio.Queue]] = defaultdict(list)
-        self.last_event_per_task: Dict[str, dict] = {}
-        self.completed_flags: Dict[str, bool] = {}  # 记录任务是否完成，避免重复计算
-
-    async def create_task(self, task_id: str, user_id: str, input_data: dict, agent_types: list):
+        # user_id -> 该用户打开的复用流；stream_id -> 流，供动态订阅查找
+        self.user_streams: Dict[str, List[UserStream]] = defaultdict(list)
+        self.streams: Dict[str, UserStream] = {}
+        # 版本号取自全局递增的 clock：任务版本为其最近一次变化的 clock，
+        # 用户版本按 (user_id, tenant_id) 记录，为该租户下其任一任务最近一次变化的 clock
+        self.clock = 0
+        self.user_versions: Dict[Tuple[str, str], int] = {}
+        self.by_user: Dict[str, Dict[str, None]] = defaultdict(dict)
+        # 长轮询等待的变化通知，("task", task_id) | ("user", user_id, tenant_id) -> [Event, 等待者数]，变化时唤醒并移除
+        self.waiters: Dict[Tuple[str, ...], list] = {}
+        # 进行中的广播任务，持有引用避免被回收
+        self.broadcasts: Set[asyncio.Task] = set()
+        tasks_live.set_function(lambda: len(self.tasks))
+        user_streams_open.set_function(lambda: len(self.streams))
+
+    async def create_task(self, task_id: str, user_id: str, input_data: dict, agent_types: list,
+                          dependencies: Optional[Dict[str, List[str]]] = None, tenant_id: Optional[str] = None,
+                          priority: str = "standard", deadline: Optional[float] = None):
+        graph = build_graph(agent_types, dependencies)
         async with self.lock:
-            self.tasks[task_id] = {
-                "user_id": user_id,
-                "input_data": input_data,
-                "agents": {agent_type: {"status": "pending", "file_url": ""} for agent_type in agent_types},
-                "completed": False  # 初始状态为未完成
-            }
-            self.completed_flags[task_id] = False  # 初始化完成标志
-
-    async def update_subtask_status(self, task_id: str, agent_type: str, status: str, file_url: str = None):
+            task = self.tasks[task_id] = TaskRecord(user_id, graph, tenant_id or user_id, priority, deadline)
+            self.inputs[task_id] = input_data
+            self.by_user[user_id][task_id] = None
+            self._touch(task_id, task)
+            tasks_created.inc()
+            for stream in self.user_streams.get(user_id, ()):
+                if stream.follow_all and stream.owns(task):
+                    stream.push(task_id, self.event(task_id))
+
+    def _touch(self, task_id: str, task: TaskRecord):
+        self.clock += 1
+        task.version = self.clock
+        self.user_versions[(task.user_id, task.tenant_id)] = self.clock
+        self._notify(("task", task_id))
+        self._notify(("user", task.user_id, task.tenant_id))
+
+    def _notify(self, key: Tuple[str, ...]):
+        waiter = self.waiters.pop(key, None)
+        if waiter is not None:
+            waiter[0].set()
+
+    def task_version(self, task_id: str) -> Optional[int]:
+        task = self.tasks.get(task_id)
+        return task.version if task else None
+
+    def user_version(self, user_id: str, tenant_id: Optional[str] = None) -> int:
+        # tenant_id 缺省为 user_id，与 create_task 一致
+        return self.user_versions.get((user_id, tenant_id or user_id), 0)
+
+    async def wait_for_change(self, key: Tuple[str, ...], since: int, timeout: float) -> bool:
+        """
+        长轮询：版本仍等于 since 时挂起，直到对应任务 / 用户发生变化或超时，不做轮询。返回是否已变化。
+        """
+        kind, *ids = key
+        current = self.task_version if kind == "task" else self.user_version
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while current(*ids) == since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            waiter = self.waiters.get(key)
+            if waiter is None:
+                waiter = self.waiters[key] = [asyncio.Event(), 0]
+            waiter[1] += 1
+            try:
+                await asyncio.wait_for(waiter[0].wait(), remaining)
+            except TimeoutError:
+                return False
+            finally:
+                # 超时或断开的最后一个等待者负责移除，避免不再变化的 key 留在表里
+                waiter[1] -= 1
+                if not waiter[1] and self.waiters.get(key) is waiter:
+                    del self.waiters[key]
+        return True
+
+    def input_data(self, task_id: str) -> Optional[dict]:
+        return self.inputs.get(task_id)
+
+    async def claim_ready(self, task_id: str) -> List[str]:
+        """
+        取出上游已全部完成、尚未派发的子任务并标记为已派发，保证每个节点只派发一次。
+        """
         async with self.lock:
             task = self.tasks.get(task_id)
             if not task:
-                logger.error(f"Task {task_id} not found during status update.")
-                return False
-
-
-            task["agents"][agent_type]["status"] = status
-            if file_url:
-                task["agents"][agent_type]["file_url"] = file_url
+                return []
+            ready = []
+            agents = task.agents
+            for agent_type, subtask in agents.items():
+                if subtask.dispatched_at is not None or subtask.status is not Status.pending:
+                    continue
+                if all(agents[dep].status is Status.completed for dep in subtask.upstream):
+                    subtask.dispatched_at = time.time()
+                    ready.append(agent_type)
+            return ready
+
+    def upstream_outputs(self, task_id: str, agent_type: str) -> Dict[str, Dict[str, Any]]:
+        agents = self.tasks[task_id].agents
+        return {
+            dep: {"file_url": agents[dep].file_url, "result": agents[dep].result}
+            for dep in agents[agent_type].upstream
+        }
 
+    def pipeline_report(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        各节点耗时（派发到完成）、关键路径及其长度，以及任务实际的端到端耗时。
+        """
+        task = self.tasks.get(task_id)
+        if not task:
+            return None
+        durations = {}
+        nodes = {}
+        finished = []
+        for agent_type, subtask in task.agents.items():
+            node = {"status": subtask.status.name}
+            if subtask.dispatched_at is not None:
+                node["queued_seconds"] = round(subtask.dispatched_at - task.created_at, 3)
+                if subtask.finished_at is not None:
+                    durations[agent_type] = subtask.finished_at - subtask.dispatched_at
+                    node["duration_seconds"] = round(durations[agent_type], 3)
+            if subtask.finished_at is not None:
+                finished.append(subtask.finished_at)
+            nodes[agent_type] = node
+        length, path = critical_path(task.graph(), durations)
+        return {
+            "nodes": nodes,
+            "critical_path": path,
+            "critical_path_seconds": round(length, 3),
+            "elapsed_seconds": round((max(finished) if finished else time.time()) - task.created_at, 3)
+        }
 
-            if status == "completed" and self.is_task_completed(task_id):
-                task["completed"] = True
-                self.completed_flags[task_id] = True
+    def event(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按当前状态生成推送给 SSE 订阅方的事件；任务结束（完成或取消）时附带 pipeline 报告。
+        """
+        task = self.tasks.get(task_id)
+        if not task:
+            return None
+        event_data = {
+            "task_id": task_id,
+            "status": task.status_dict(),
+            "completed": task.completed,
+            "version": task.version
+        }
+        if task.cancelled:
+            event_data["cancelled"] = task.cancelled
+        if task.finished:
+            event_data["pipeline"] = self.pipeline_report(task_id)
+        return event_data
+
+    async def update_subtask_status(self, task_id: str, agent_type: str, status: str, file_url: str = None,
+                                    result: Optional[Dict[str, Any]] = None):
+        async with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                logger.error("Task %s not found during status update.", task_id)
+                return False
+            subtask = task.agents.get(agent_type)
+            if subtask is None:
+                logger.error("Agent type %s not found in task %s.", agent_type, task_id)
+                return False
+            if task.cancelled:
+                # 取消后迟到的回调不再改变状态
+                logger.debug("Ignoring %s update for %s of cancelled task %s.", status, agent_type, task_id)
+                return True
 
+            status = Status.parse(status)
+            task.set_status(subtask, status)
+            if file_url:
+                subtask.file_url = file_url
+            if result is not None:
+                subtask.result = result
 
-            event_data = {
-                "task_id": task_id,
-                "status": task["agents"],
-                "completed": task["completed"]
-            }
-            self.last_event_per_task[task_id] = event_data
+            if status in FINISHED and subtask.finished_at is None:
+                subtask.finished_at = time.time()
 
+            if status is Status.failed or status is Status.cancelled:
+                # 上游失败（或被 agent 自行取消）的下游节点永远无法满足依赖，直接标记失败
+                for child in descendants(task.graph(), agent_type):
+                    if task.agents[child].status is Status.pending:
+                        task.set_status(task.agents[child], Status.failed)
+                        logger.warning("Subtask %s of task %s failed because upstream %s failed.", child, task_id, agent_type)
 
-            asyncio.create_task(self.broadcast_event(task_id))
+            self._touch(task_id, task)
+            self._spawn_broadcast(task_id)
 
             return True
 
-    async def broadcast_event(self, task_id: str):
-
-        queues = self.sse_queues.get(task_id, [])
-        if not queues:
+    async def cancel_task(self, task_id: str, reason: str = "cancelled") -> Optional[List[str]]:
+        """
+        把尚未结束的子任务标记为 cancelled，推送最终事件并关闭 SSE 订阅。
+        返回被取消的子任务；任务不存在返回 None，已全部结束时返回空列表。
+        """
+        async with self.lock:
+            task = self.tasks.get(task_id)
+            if not task:
+                return None
+            # 子任务全部完成或失败的任务无需取消；agent 自行上报的 cancelled 仍需记录原因
+            if task.cancelled is not None or all(subtask.status in (Status.completed, Status.failed)
+                                                 for subtask in task.agents.values()):
+                return []
+            cancelled = []
+            now = time.time()
+            for agent_type, subtask in task.agents.items():
+                if subtask.status in FINISHED:
+                    continue
+                task.set_status(subtask, Status.cancelled)
+                if subtask.dispatched_at is not None:
+                    subtask.finished_at = now
+                cancelled.append(agent_type)
+            # agent 可能已在截止时间自行上报 cancelled，此时同样记录原因并结束任务
+            task.cancelled = reason
+            tasks_cancelled.labels(reason).inc()
+            self._touch(task_id, task)
+
+            self._spawn_broadcast(task_id)
+            return cancelled
+
+    def _spawn_broadcast(self, task_id: str):
+        broadcast = asyncio.create_task(self.broadcast_event(task_id))
+        self.broadcasts.add(broadcast)
+        broadcast.add_done_callback(self.broadcasts.discard)
 
-            return
+    async def broadcast_event(self, task_id: str):
 
         task = self.tasks.get(task_id)
         if not task:
             return
+        queues = self.sse_queues.get(task_id, [])
+        streams = self.followers(task_id, task)
+        if not queues and not streams:
 
-        event_data = self.last_event_per_task.get(task_id) or {
-            "task_id": task_id,
-            "status": task["agents"],
-            "completed": task["completed"]
-        }
+            return
+
+        started = time.perf_counter()
+        event_data = self.event(task_id)
 
+        for stream in streams:
+            stream.push(task_id, event_data)
+            if task.finished:
+                # 结束的任务不会再有事件，显式订阅随之移除
+                stream.task_ids.discard(task_id)
+                stream.excluded.discard(task_id)
 
         for queue in queues:
             await queue.put(event_data)
 
 
-        if task["completed"]:
+        if task.finished:
             for queue in queues:
                 await queue.put(None)
+        broadcast_latency.observe(time.perf_counter() - started)
 
     def is_task_completed(self, task_id: str) -> bool:
         task = self.tasks.get(task_id)
-        if not task:
-            return False
-        return all(agent["status"] == "completed" for agent in task["agents"].values())
+        return task is not None and task.completed
 
-    async def get_initial_state(self, task_id: str):
+    def is_task_finished(self, task_id: str) -> bool:
         task = self.tasks.get(task_id)
-        if not task:
-            return None
-        return self.last_event_per_task.get(task_id) or {
-            "task_id": task_id,
-            "status": task["agents"],
-            "completed": task["completed"]
-        }
+        return task is not None and task.finished
+
+    async def get_initial_state(self, task_id: str):
+        return self.event(task_id)
 
     async def listen_for_events(self, task_id: str) -> AsyncGenerator[dict, None]:
 
@@ -290,36 +616,120 @@ class TaskManager:
 
         queue = asyncio.Queue()
         self.sse_queues[task_id].append(queue)
+        sse_subscribers.inc()
 
+        try:
+            initial_state = await self.get_initial_state(task_id)
+            if initial_state:
+                yield initial_state
 
-        initial_state = await self.get_initial_state(task_id)
-        if initial_state:
-            yield initial_state
-
-            if initial_state.get("completed"):
-                logger.info(f"Task {task_id} already completed, closing SSE connection.")
-                return
+                if "pipeline" in initial_state:  # 只有结束的任务附带 pipeline 报告
+                    logger.info("Task %s already finished, closing SSE connection.", task_id)
+                    return
 
-        try:
             while True:
                 event = await queue.get()
-                logger.info(f"Event received: {event}")
+                logger.debug("Event received for task %s: %s", task_id, event)
                 if event is None:
-                    logger.info(f"SSE connection for {task_id} closed.")
+                    logger.info("SSE connection for %s closed.", task_id)
                     break
                 yield event
         except asyncio.CancelledError:
-            logger.info(f"SSE connection for {task_id} cancelled (client disconnected).")
+            logger.info("SSE connection for %s cancelled (client disconnected).", task_id)
         except Exception as e:
-            logger.error(f"Error in SSE stream for {task_id}: {e}")
+            logger.error("Error in SSE stream for %s: %s", task_id, e)
         finally:
+            sse_subscribers.dec()
             if queue in self.sse_queues[task_id]:
                 self.sse_queues[task_id].remove(queue)
 
+    def followers(self, task_id: str, task: TaskRecord) -> List[UserStream]:
+        return [stream for stream in self.user_streams.get(task.user_id, ()) if stream.owns(task) and stream.follows(task_id)]
+
+    def open_stream(self, user_id: str, task_ids: Optional[Iterable[str]] = None,
+                    tenant_id: Optional[str] = None) -> UserStream:
+        """
+        打开一个用户级复用流：task_ids 为 None 时跟随该用户在 tenant_id 下的全部任务（先推送仍在进行的任务的当前状态），
+        否则只订阅给定的任务，之后可通过 subscribe / unsubscribe 增减。tenant_id 缺省为 user_id，与 create_task 一致。
+        """
+        stream = UserStream(user_id, follow_all=task_ids is None, tenant_id=tenant_id)
+        self.user_streams[user_id].append(stream)
+        self.streams[stream.stream_id] = stream
+        if task_ids is None:
+            for task_id in self.by_user.get(user_id, ()):
+                task = self.tasks[task_id]
+                if stream.owns(task) and not task.finished:
+                    stream.push(task_id, self.event(task_id))
+        else:
+            self.subscribe(stream, task_ids)
+        return stream
+
+    def subscribe(self, stream: UserStream, task_ids: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        订阅该用户的任务并立即推送其当前状态；返回 (已订阅, 被拒绝)，不存在或不属于该用户 / 租户的任务被拒绝。
+        """
+        accepted, rejected = [], []
+        for task_id in task_ids:
+            task = self.tasks.get(task_id)
+            if task is None or not stream.owns(task):
+                rejected.append(task_id)
+                continue
+            stream.excluded.discard(task_id)
+            if not task.finished and not stream.follow_all:
+                stream.task_ids.add(task_id)
+            stream.push(task_id, self.event(task_id))
+            accepted.append(task_id)
+        return accepted, rejected
+
+    def unsubscribe(self, stream: UserStream, task_ids: Iterable[str]) -> List[str]:
+        removed = []
+        for task_id in task_ids:
+            if not stream.follows(task_id):
+                continue
+            if stream.follow_all:
+                task = self.tasks.get(task_id)
+                if task is None or not stream.owns(task):
+                    continue
+                stream.excluded.add(task_id)
+            stream.task_ids.discard(task_id)
+            stream.pending.pop(task_id, None)
+            removed.append(task_id)
+        return removed
+
+    def close_stream(self, stream: UserStream):
+        stream.close()
+        self.streams.pop(stream.stream_id, None)
+        streams = self.user_streams.get(stream.user_id)
+        if streams is not None:
+            if stream in streams:
+                streams.remove(stream)
+            if not streams:
+                del self.user_streams[stream.user_id]
+
+    async def listen_for_user(self, stream: UserStream) -> AsyncGenerator[dict, None]:
+        try:
+            while True:
+                batch = await stream.next_batch()
+                if not batch:
+                    break
+                for event in batch:
+                    yield event
+        except asyncio.CancelledError:
+            logger.info("User stream %s of %s cancelled (client disconnected).", stream.stream_id, stream.user_id)
+        finally:
+            self.close_stream(stream)
+
     async def cleanup_task(self, task_id: str):
         async with self.lock:
-            if task_id in self.tasks:
-                del self.tasks[task_id]
+            task = self.tasks.pop(task_id, None)
+            self.inputs.pop(task_id, None)
+            if task is not None:
+                # 列表发生变化，用户版本前进；等待该任务的长轮询随之返回
+                tasks = self.by_user[task.user_id]
+                tasks.pop(task_id, None)
+                if not tasks:
+                    del self.by_user[task.user_id]
+                self._touch(task_id, task)
 
             if task_id in self.sse_queues:
                 queues = self.sse_queues.pop(task_id)
@@ -329,26 +739,32 @@ class TaskManager:
                     except asyncio.QueueFull:
                         pass
                     except Exception as e:
-                        logger.warning(f"Error putting end signal into queue: {e}")
-
-            if task_id in self.last_event_per_task:
-                del self.last_event_per_task[task_id]
-
-            if task_id in self.completed_flags:
-                del self.completed_flags[task_id]
-
-            logger.info(f"Task {task_id} has been cleaned up.")
-
-    def get_user_tasks(self, user_id: str) -> List[dict]:
-        result = []
-        for task_id, task in self.tasks.items():
-            if task["user_id"] == user_id:
-                result.append({
-                    "task_id": task_id,
-                    "status": task["agents"],
-                    "completed": task["completed"],
-                    "input_data": task["input_data"]
-                })
-        return result
+                        logger.warning("Error putting end signal into queue: %s", e)
+
+            logger.info("Task %s has been cleaned up.", task_id)
+
+    def get_user_tasks(self, user_id: str, summary: bool = False, tenant_id: Optional[str] = None) -> List[dict]:
+        """
+        summary 为轻量投影：只有状态与版本，不带 input_data 与 pipeline 报告。给定 tenant_id 时只返回该租户下的任务。
+        """
+        return [self.task_view(task_id, summary) for task_id in self.by_user.get(user_id, ())
+                if tenant_id is None or self.tasks[task_id].tenant_id == tenant_id]
+
+    def task_view(self, task_id: str, summary: bool = False) -> Optional[dict]:
+        task = self.tasks.get(task_id)
+        if not task:
+            return None
+        item = {
+            "task_id": task_id,
+            "status": task.status_dict(),
+            "completed": task.completed,
+            "priority": task.priority,
+            "cancelled": task.cancelled,
+            "version": task.version
+        }
+        if not summary:
+            item["input_data"] = self.inputs.get(task_id)
+            item["pipeline"] = self.pipeline_report(task_id)
+        return item
 
 task_manager = TaskManager()
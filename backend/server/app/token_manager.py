@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import jwt, JWTError
 from jose.exceptions import ExpiredSignatureError
 from dotenv import load_dotenv
@@ -14,7 +15,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 一周有效期
 
 # 设置日志
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 # 创建访问令牌
@@ -26,7 +26,7 @@ def create_access_token(task_id: str, user_id: str) -> str:
         "exp": expire
     }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    logger.debug(f"Generated token for task {task_id} and user {user_id}")
+    logger.debug("Generated token for task %s and user %s", task_id, user_id)
     return encoded_jwt
 
 
@@ -40,10 +40,10 @@ def verify_token(token: str, expected_user_id: str, expected_task_id: str) -> bo
 
         # 如果用户ID或任务ID不匹配，返回校验失败
         if user_id != expected_user_id or task_id != expected_task_id:
-            logger.warning(f"Token verification failed: UserID or TaskID mismatch.")
+            logger.warning("Token verification failed: UserID or TaskID mismatch.")
             return False
 
-        logger.info(f"Token verified successfully for TaskID: {task_id} and UserID: {user_id}")
+        logger.debug("Token verified successfully for TaskID: %s and UserID: %s", task_id, user_id)
         return True
 
     except ExpiredSignatureError:
@@ -51,10 +51,41 @@ def verify_token(token: str, expected_user_id: str, expected_task_id: str) -> bo
         return False
 
     except JWTError as e:
-        logger.error(f"Token validation error: {str(e)}")
+        logger.error("Token validation error: %s", str(e))
         return False
 
 
+# 用户级令牌：只用于按用户复用的事件流（/api/stream），不能代替任务令牌。
+# user_id 来自请求体，不可信；令牌绑定创建任务的租户，只能看到该租户下的任务
+def create_stream_token(user_id: str, tenant_id: str) -> str:
+    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {
+        "user_id": user_id,
+        "tenant_id": tenant_id,
+        "scope": "stream",
+        "exp": expire
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def verify_stream_token(token: str, expected_user_id: str) -> Optional[str]:
+    """
+    校验用户级令牌，返回其绑定的租户；校验失败返回 None。
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except ExpiredSignatureError:
+        logger.error("Stream token has expired.")
+        return None
+    except JWTError as e:
+        logger.error("Stream token validation error: %s", str(e))
+        return None
+    if payload.get("scope") != "stream" or payload.get("user_id") != expected_user_id or not payload.get("tenant_id"):
+        logger.warning("Stream token verification failed: scope, UserID or tenant mismatch.")
+        return None
+    return payload["tenant_id"]
+
+
 # 自定义Token异常类型
 class TokenVerificationError(Exception):
     pass
@@ -0,0 +1,75 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.server.app import router as router_module
+from backend.server.app import token_manager
+
+CALLS = []
+
+
+async def outline(payload):
+    CALLS.append(("outline", payload["upstream"]))
+    return {"status": "completed", "file_url": "artifact://outline", "result": {"sections": 3}}
+
+
+def chapter(payload):
+    CALLS.append(("chapter", payload["upstream"]))
+    return {"file_url": "artifact://chapter"}
+
+
+def broken(payload):
+    raise RuntimeError("boom")
+
+
+def make_client(monkeypatch, agent_urls):
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    app = FastAPI()
+    router_module.register_routes(app)
+    app.dependency_overrides[router_module.get_agent_urls_dependency] = lambda: agent_urls
+    monkeypatch.setattr(router_module, "AGENT_URLS", agent_urls)
+    return TestClient(app)
+
+
+def wait_for_tasks(client, user_id, predicate):
+    for _ in range(100):
+        tasks = client.get(f"/api/tasks/{user_id}", params={"token": token_manager.create_stream_token(user_id, user_id)}).json()
+        if tasks and predicate(tasks[0]):
+            return tasks[0]
+        time.sleep(0.01)
+    raise AssertionError(f"task did not settle: {tasks}")
+
+
+def test_local_agents_run_in_process_and_feed_downstream(monkeypatch):
+    CALLS.clear()
+    agent_urls = {
+        "outline": f"python:{__name__}:outline",
+        "chapter": f"python:{__name__}:chapter",
+    }
+    with make_client(monkeypatch, agent_urls) as client:
+        response = client.post("/api/start-task", json={
+            "user_id": "local-user",
+            "input_data": {},
+            "agent_types": ["outline", "chapter"],
+            "dependencies": {"chapter": ["outline"]},
+        })
+        assert response.status_code == 200
+        task = wait_for_tasks(client, "local-user", lambda task: task["completed"])
+
+    assert task["status"]["chapter"]["file_url"] == "artifact://chapter"
+    assert CALLS == [
+        ("outline", {}),
+        ("chapter", {"outline": {"file_url": "artifact://outline", "result": {"sections": 3}}}),
+    ]
+
+
+def test_local_agent_errors_mark_subtask_failed(monkeypatch):
+    with make_client(monkeypatch, {"broken": f"python:{__name__}:broken"}) as client:
+        client.post("/api/start-task", json={"user_id": "broken-user", "input_data": {}, "agent_types": ["broken"]})
+        task = wait_for_tasks(client, "broken-user", lambda task: task["status"]["broken"]["status"] == "failed")
+    assert not task["completed"]
+
+    with make_client(monkeypatch, {"missing": "python:backend.does_not_exist:run"}) as client:
+        response = client.post("/api/start-task", json={"user_id": "u", "input_data": {}, "agent_types": ["missing"]})
+    assert response.status_code == 500
@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+
+import httpx
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+from backend.agents.outbox import CallbackOutbox
+from backend.agents.runtime import AgentService
+
+
+@pytest.mark.asyncio
+async def test_bounded_queue_applies_backpressure(tmp_path):
+    release = asyncio.Event()
+    handled = []
+
+    async def handler(data):
+        await release.wait()
+        handled.append(data["task_id"])
+
+    outbox = CallbackOutbox(str(tmp_path / "outbox.jsonl"))
+    service = AgentService("test", handler, workers=1, queue_size=2, outbox=outbox)
+    transport = ASGITransport(app=service.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        statuses = []
+        for i in range(5):
+            resp = await client.post("/agent", json={"task_id": str(i)})
+            statuses.append(resp.status_code)
+            # 让 worker 取走第一个任务
+            await asyncio.sleep(0)
+
+        # 1 个执行中 + 2 个排队，其余被拒绝
+        assert statuses == [200, 200, 200, 429, 429]
+        stats = (await client.get("/stats")).json()
+        assert stats["in_flight"] == 1 and stats["queue_depth"] == 2 and stats["rejected"] == 2
+
+        release.set()
+        await service.queue.join()
+        assert handled == ["0", "1", "2"]
+        assert (await client.get("/stats")).json()["completed"] == 3
+
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_outbox_coalesces_retries_and_survives_restart(tmp_path):
+    journal = str(tmp_path / "outbox.jsonl")
+    received = []
+    fail = {"remaining": 1}
+
+    def respond(request):
+        if fail["remaining"]:
+            fail["remaining"] -= 1
+            return httpx.Response(503)
+        received.append((request.url.path, request.read()))
+        return httpx.Response(200, json={"status": "ok"})
+
+    # 未启动的发件箱：模拟回调写入 journal 后进程崩溃
+    crashed = CallbackOutbox(journal)
+    crashed.enqueue("http://backend/api/callback/u/t/1?token=x", {"status": "running"})
+    crashed.enqueue("http://backend/api/callback/u/t/1?token=x", {"status": "completed"})
+    crashed.enqueue("http://backend/api/callback/u/t/2?token=x", {"status": "completed"})
+    crashed._journal.close()
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+    outbox = CallbackOutbox(journal, base_delay=0.01, client=client)
+    outbox.start()
+    assert len(outbox.pending) == 2
+
+    await asyncio.wait_for(outbox.flush(), timeout=5)
+    await outbox.stop()
+    await client.aclose()
+
+    assert sorted(path for path, _ in received) == ["/api/callback/u/t/1", "/api/callback/u/t/2"]
+    assert all(b"completed" in body for _, body in received)
+    assert outbox.counters["retried"] == 1
+
+    # 全部确认后重启不再重放
+    replayed = CallbackOutbox(journal)
+    replayed._replay()
+    assert replayed.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_outbox_survives_unsendable_callbacks(tmp_path):
+    journal = str(tmp_path / "outbox.jsonl")
+    received = []
+
+    def respond(request):
+        received.append(request.url.path)
+        return httpx.Response(200)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+    outbox = CallbackOutbox(journal, base_delay=0.01, client=client, flush_interval=0.01)
+    outbox.start()
+    outbox.enqueue("http://backend:port/api/callback/u/t/1", {"status": "completed"})
+    await asyncio.wait_for(outbox.flush(), timeout=5)
+
+    # 投递循环本身出错也不会退出
+    broken = {"remaining": 1}
+    deliver_due = outbox._deliver_due
+
+    async def flaky(force=False):
+        if broken["remaining"]:
+            broken["remaining"] -= 1
+            raise RuntimeError("boom")
+        await deliver_due(force)
+
+    outbox._deliver_due = flaky
+    outbox.enqueue("http://backend/api/callback/u/t/2", {"status": "completed"})
+    def journal_text():
+        if not os.path.exists(journal):
+            return ""
+        with open(journal, encoding="utf-8") as f:
+            return f.read()
+
+    # journal 由后台写入：等到投递成功且 put 已落盘
+    for _ in range(200):
+        if received and "/u/t/2" in journal_text():
+            break
+        await asyncio.sleep(0.01)
+    assert "/u/t/2" in journal_text()
+    await outbox.stop()
+    await client.aclose()
+
+    assert received == ["/api/callback/u/t/2"]
+    assert outbox.counters["dropped"] == 1 and outbox.pending == {}
+    replayed = CallbackOutbox(journal)
+    replayed._replay()
+    assert replayed.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_outbox_gives_up_after_max_attempts_or_age(tmp_path):
+    journal = str(tmp_path / "outbox.jsonl")
+    attempts = []
+
+    def respond(request):
+        attempts.append(request.url.path)
+        return httpx.Response(503)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+    outbox = CallbackOutbox(journal, base_delay=0.01, max_delay=0.01, client=client, max_attempts=3)
+    outbox.start()
+    outbox.enqueue("http://backend/api/callback/u/t/1", {"status": "completed"})
+    await asyncio.wait_for(outbox.flush(), timeout=5)
+    assert attempts == ["/api/callback/u/t/1"] * 3
+    assert outbox.counters["retried"] == 2 and outbox.counters["dropped"] == 1
+
+    await outbox.stop()
+
+    # 年龄按 journal 中的入队时间计算，重启重放后不会重新开始
+    crashed = CallbackOutbox(str(tmp_path / "stale.jsonl"))
+    crashed.enqueue("http://backend/api/callback/u/t/2", {"status": "completed"})
+    crashed.pending["http://backend/api/callback/u/t/2"]["created_at"] -= 3600
+    crashed._compact()
+    crashed._journal = None
+
+    replayed = CallbackOutbox(str(tmp_path / "stale.jsonl"), base_delay=0.01, client=client, max_age=60)
+    replayed.start()
+    await asyncio.wait_for(replayed.flush(), timeout=5)
+    await replayed.stop()
+    await client.aclose()
+
+    assert attempts[3:] == ["/api/callback/u/t/2"]
+    assert replayed.counters["dropped"] == 1 and replayed.counters["retried"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_deadline_stop_jobs(tmp_path):
+    started, stopped = [], []
+
+    async def handler(data):
+        started.append(data["task_id"])
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            stopped.append(data["task_id"])
+            raise
+
+    outbox = CallbackOutbox(str(tmp_path / "outbox.jsonl"))
+    service = AgentService("test", handler, workers=1, queue_size=10, outbox=outbox)
+    transport = ASGITransport(app=service.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.post("/agent", json={"task_id": "running"})
+        await client.post("/agent", json={"task_id": "queued"})
+        await client.post("/agent", json={"task_id": "expiring", "deadline": time.time() + 0.05})
+        await asyncio.sleep(0.01)
+
+        # 执行中的 job 被中断；排队中的 job 出队时跳过
+        assert (await client.post("/cancel", json={"task_id": "running"})).json()["interrupted"] == 1
+        assert (await client.post("/cancel", json={"task_id": "queued"})).json()["interrupted"] == 0
+        await asyncio.wait_for(service.queue.join(), timeout=5)
+
+        stats = (await client.get("/stats")).json()
+        assert stats["cancelled"] == 3 and stats["failed"] == 0
+        assert (await client.post("/cancel", json={})).status_code == 400
+
+    assert started == ["running", "expiring"]
+    assert stopped == ["running", "expiring"]
+    # 取消不回调后端（后端已标记 cancelled）
+    assert outbox.pending == {}
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_failure_callback_uses_service_subtask_id(tmp_path):
+    async def handler(data):
+        raise RuntimeError("boom")
+
+    outbox = CallbackOutbox(str(tmp_path / "outbox.jsonl"))
+    service = AgentService("application_create", handler, subtask_id="1", outbox=outbox)
+    transport = ASGITransport(app=service.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.post("/agent", json={"task_id": "t", "callback_url": "http://backend/api/callback/u/t/1"})
+        assert resp.status_code == 200
+        await service.queue.join()
+
+    [entry] = outbox.pending.values()
+    assert entry["payload"] == {"subtask_id": "1", "status": "failed"}
+    # 回调地址不可达，不等待关闭时的排空
+    outbox.pending.clear()
+    await service.stop()
@@ -0,0 +1,115 @@
+import gzip
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.artifact_store import ArtifactStore
+from backend.server.app import router as router_module
+from backend.server.app import token_manager
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(root=str(tmp_path / "artifacts"), base_url="http://testserver")
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(router_module, "artifact_store", store)
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    app = FastAPI()
+    router_module.register_routes(app)
+    return TestClient(app)
+
+
+def test_identical_content_is_stored_once(store):
+    first = store.put_bytes(b"report body", "report.docx")
+    mtime = os.stat(store.path(first.digest)).st_mtime
+    time.sleep(0.01)
+    second = store.put_chunks(iter([b"report ", b"body"]), "report-v2.docx")
+
+    assert second.digest == first.digest
+    assert second.filename == "report.docx"
+    assert os.stat(store.path(first.digest)).st_mtime > mtime
+    assert os.listdir(os.path.join(store.root, "tmp")) == []
+
+
+def test_compressible_content_gets_gzip_variant(store):
+    text = store.put_bytes(b"line\n" * 1000, "notes.txt")
+    docx = store.put_bytes(b"PK" * 1000, "form.docx")
+
+    with open(store.compressed_path(text.digest), "rb") as f:
+        assert gzip.decompress(f.read()) == b"line\n" * 1000
+    assert store.compressed_path(docx.digest) is None
+
+
+def test_gc_removes_expired_objects(store):
+    old = store.put_bytes(b"old", "old.txt")
+    fresh = store.put_bytes(b"fresh", "fresh.txt")
+    past = time.time() - 3600
+    os.utime(store.path(old.digest), (past, past))
+
+    assert store.gc(retention_seconds=60) == 1
+    assert store.meta(old.digest) is None
+    assert store.meta(fresh.digest) is not None
+
+
+def test_download_supports_etag_range_and_gzip(client, store):
+    artifact = store.put_bytes(b"0123456789" * 200, "data.txt")
+    url = f"/api/artifacts/{artifact.digest}"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    # gzip 与原始字节是不同的表示，强 ETag 不同
+    assert response.headers["etag"] == f'"{artifact.digest}-gzip"'
+    assert response.content == b"0123456789" * 200
+    identity = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert identity.headers["etag"] == f'"{artifact.digest}"' and "content-encoding" not in identity.headers
+
+    for etag in (response.headers["etag"], identity.headers["etag"]):
+        cached = client.get(url, headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+        assert cached.status_code == 304 and cached.headers["etag"] == etag
+
+    partial = client.get(url, headers={"Range": "bytes=10-14", "Accept-Encoding": "gzip"})
+    assert partial.status_code == 206
+    assert partial.content == b"01234"
+    assert "content-encoding" not in partial.headers
+
+    assert client.get("/api/artifacts/" + "0" * 64).status_code == 404
+
+
+def test_upload_requires_task_token(client, store):
+    token = token_manager.create_access_token("task-1", "user-1")
+    response = client.post(
+        "/api/artifacts/user-1/task-1",
+        params={"filename": "out.docx", "token": token},
+        content=b"generated",
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["url"] == store.url(body["digest"])
+    assert client.get(f"/api/artifacts/{body['digest']}").content == b"generated"
+
+    forbidden = client.post(
+        "/api/artifacts/user-2/task-1",
+        params={"filename": "out.docx", "token": token},
+        content=b"generated",
+    )
+    assert forbidden.status_code == 403
+
+
+def test_upload_size_is_limited(client, store, monkeypatch):
+    monkeypatch.setattr(router_module, "ARTIFACT_MAX_UPLOAD_BYTES", 8)
+    token = token_manager.create_access_token("task-1", "user-1")
+    params = {"filename": "out.txt", "token": token}
+
+    assert client.post("/api/artifacts/user-1/task-1", params=params, content=b"x" * 9).status_code == 413
+    # 没有 Content-Length 的分块上传在读取过程中被截断
+    chunked = client.post("/api/artifacts/user-1/task-1", params=params, content=iter([b"x" * 5, b"x" * 5]))
+    assert chunked.status_code == 413
+    assert client.post("/api/artifacts/user-1/task-1", params=params, content=b"x" * 8).status_code == 200
+    assert os.listdir(os.path.join(store.root, "tmp")) == []
@@ -0,0 +1,37 @@
+import json
+
+from benchmarks.compare import compare, main
+
+
+def write(path, medians):
+    benchmarks = [{"fullname": f"benchmarks/test_x.py::{name}", "stats": {"median": value, "min": value, "mean": value, "max": value}}
+                  for name, value in medians.items()]
+    path.write_text(json.dumps({"benchmarks": benchmarks}))
+    return str(path)
+
+
+def test_compare_flags_regressions_and_new_benchmarks(tmp_path):
+    baseline = write(tmp_path / "base.json", {"test_calibration": 1.0, "test_a": 1e-5, "test_b": 2e-5})
+    current = write(tmp_path / "cur.json", {"test_calibration": 2.0, "test_a": 2.1e-5, "test_c": 1e-5})
+
+    assert main([current, "--baseline", baseline]) == 1
+    # 换算到同一机器速度后 test_a 只慢 5%
+    assert main([current, "--baseline", baseline, "--normalize"]) == 0
+
+
+def test_compare_statuses():
+    def bench(value):
+        return {"stats": {"median": value}}
+
+    rows, regressions = compare({"a": bench(1.0), "b": bench(1.0), "gone": bench(1.0)},
+                                {"a": bench(1.1), "b": bench(0.5), "new": bench(1.0)}, threshold=0.2)
+    statuses = {row["name"]: row["status"] for row in rows}
+    assert statuses == {"a": "ok", "b": "faster", "gone": "missing", "new": "new"}
+    assert regressions == []
+
+
+def test_first_run_creates_baseline(tmp_path):
+    current = write(tmp_path / "cur.json", {"test_a": 1e-5})
+    baseline = tmp_path / "baselines" / "baseline.json"
+    assert main([current, "--baseline", str(baseline)]) == 0
+    assert json.loads(baseline.read_text())["benchmarks"][0]["fullname"].endswith("test_a")
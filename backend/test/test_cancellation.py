@@ -0,0 +1,95 @@
+import time
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.server.app import router as router_module
+from backend.server.app import token_manager
+from backend.server.app.scheduler import scheduler
+
+EVENTS = []
+
+
+async def slow(payload):
+    EVENTS.append(("started", payload["task_id"], payload["deadline"]))
+    try:
+        await asyncio.sleep(60)
+    except asyncio.CancelledError:
+        EVENTS.append(("cancelled", payload["task_id"]))
+        raise
+    return {"status": "completed"}
+
+
+def make_client(monkeypatch, agent_urls):
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    app = FastAPI()
+    router_module.register_routes(app)
+    app.dependency_overrides[router_module.get_agent_urls_dependency] = lambda: agent_urls
+    monkeypatch.setattr(router_module, "AGENT_URLS", agent_urls)
+    return TestClient(app)
+
+
+def wait_for(client, user_id, predicate):
+    for _ in range(200):
+        tasks = client.get(f"/api/tasks/{user_id}", params={"token": token_manager.create_stream_token(user_id, user_id)}).json()
+        if tasks and predicate(tasks[0]):
+            return tasks[0]
+        time.sleep(0.01)
+    raise AssertionError(f"task did not settle: {tasks}")
+
+
+def test_cancel_stops_running_agent_and_frees_slots(monkeypatch):
+    EVENTS.clear()
+    agent_urls = {"slow": f"python:{__name__}:slow", "after": f"python:{__name__}:slow"}
+    with make_client(monkeypatch, agent_urls) as client:
+        started = client.post("/api/start-task", json={
+            "user_id": "cancel-user",
+            "input_data": {},
+            "agent_types": ["slow", "after"],
+            "dependencies": {"after": ["slow"]},
+        }).json()
+        task_id, token = started["task_id"], started["token"]
+        wait_for(client, "cancel-user", lambda task: EVENTS)
+
+        denied = client.post(f"/api/tasks/cancel-user/{task_id}/cancel", params={"token": "bad"})
+        assert denied.status_code == 403
+
+        response = client.post(f"/api/tasks/cancel-user/{task_id}/cancel", params={"token": token})
+        assert response.json() == {"task_id": task_id, "cancelled": ["slow", "after"]}
+        task = wait_for(client, "cancel-user", lambda task: ("cancelled", task_id) in EVENTS)
+
+        # 迟到的回调不会覆盖 cancelled
+        late = client.post(f"/api/callback/cancel-user/{task_id}/slow", params={"token": token}, json={
+            "subtask_id": "slow", "status": "completed"})
+        assert late.status_code == 200
+        again = client.post(f"/api/tasks/cancel-user/{task_id}/cancel", params={"token": token})
+        assert again.json()["cancelled"] == []
+        final = client.get("/api/tasks/cancel-user", params={"token": started["stream_token"]}).json()[0]
+
+    assert EVENTS[0] == ("started", task_id, None)
+    assert task["cancelled"] == "cancelled"
+    assert {agent["status"] for agent in final["status"].values()} == {"cancelled"}
+    assert "cancel-user" not in scheduler.snapshot()["tenants"]
+
+
+def test_deadline_cancels_task_and_reaches_agent(monkeypatch):
+    EVENTS.clear()
+    with make_client(monkeypatch, {"slow": f"python:{__name__}:slow"}) as client:
+        before = time.time()
+        task_id = client.post("/api/start-task", json={
+            "user_id": "deadline-user",
+            "input_data": {},
+            "agent_types": ["slow"],
+            "deadline_seconds": 0.2,
+        }).json()["task_id"]
+        task = wait_for(client, "deadline-user", lambda task: task["cancelled"])
+        missing = client.post("/api/tasks/deadline-user/missing/cancel",
+                              params={"token": token_manager.create_access_token("missing", "deadline-user")})
+        assert missing.status_code == 404
+
+    assert task["cancelled"] == "deadline_exceeded"
+    assert task["status"]["slow"]["status"] == "cancelled"
+    _, started_id, deadline = EVENTS[0]
+    assert started_id == task_id and before + 0.2 <= deadline <= time.time()
+    assert ("cancelled", task_id) in EVENTS
@@ -0,0 +1,64 @@
+import io
+import zipfile
+from xml.dom import minidom
+
+import pytest
+
+from backend.docx_renderer import DocxTemplate, load_template
+
+DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+    '<w:p><w:r><w:t>申请人：{{company}}</w:t></w:r></w:p>'
+    # Word 把占位符拆到了多个 run 中
+    '<w:p><w:r><w:t>产品：{</w:t></w:r><w:r><w:rPr><w:b/></w:rPr><w:t>{prod</w:t></w:r><w:r><w:t>uct}}</w:t></w:r></w:p>'
+    '<w:p><w:r><w:t xml:space="preserve">{{ notes }}</w:t></w:r></w:p>'
+    '</w:body></w:document>'
+)
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    path = tmp_path / "template.docx"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr("word/document.xml", DOCUMENT)
+        archive.writestr("word/styles.xml", "<w:styles>" + "x" * 10000 + "</w:styles>")
+        archive.writestr("docProps/thumbnail.jpeg", b"\xff\xd8" * 100, compress_type=zipfile.ZIP_STORED)
+    return str(path)
+
+
+def test_render_fills_split_placeholders_and_escapes(template_path):
+    template = DocxTemplate(template_path)
+    assert template.fields == {"company", "product", "notes"}
+
+    rendered = template.render_bytes({"company": "钰兔科技 & <Co>", "product": "激光手术刀", "notes": "第一行\n第二行"})
+
+    archive = zipfile.ZipFile(io.BytesIO(rendered))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["[Content_Types].xml", "word/document.xml", "word/styles.xml", "docProps/thumbnail.jpeg"]
+
+    document = archive.read("word/document.xml").decode("utf-8")
+    minidom.parseString(document)
+    assert "钰兔科技 &amp; &lt;Co&gt;" in document
+    assert "激光手术刀" in document and "{" not in document
+    assert '第一行</w:t><w:br/><w:t xml:space="preserve">第二行' in document
+
+
+def test_render_file_and_stream_match(template_path, tmp_path):
+    template = load_template(template_path)
+    assert load_template(template_path) is template
+
+    values = {"company": "A", "product": "B", "notes": "C"}
+    out = io.BytesIO()
+    written = template.render_to(out, values)
+    path = template.render_file(str(tmp_path / "out" / "result.docx"), values)
+
+    assert written == len(out.getvalue())
+    with open(path, "rb") as f:
+        assert f.read() == out.getvalue()
+
+
+def test_strict_mode_reports_missing_fields(template_path):
+    with pytest.raises(KeyError):
+        DocxTemplate(template_path).render_bytes({"company": "A"}, strict=True)
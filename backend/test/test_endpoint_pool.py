@@ -0,0 +1,134 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from backend.health import CircuitState
+from backend.server.app.endpoint_pool import AgentEndpoints, EndpointPool, health_url
+
+A = "http://a:8001/agent"
+B = "http://b:8001/agent"
+
+
+def make_endpoints(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AgentEndpoints(probe_interval=0, client=client)
+
+
+def test_health_url_points_at_agent_service():
+    assert health_url(A) == "http://a:8001/health"
+
+
+def test_least_outstanding_prefers_idle_replica():
+    pool = EndpointPool("1", [A, B])
+    pool.endpoints[0].outstanding = 3
+    assert pool.choose().url == B
+
+    pool = EndpointPool("1", [A, B, "http://c:8001/agent"], strategy="p2c", rng=random.Random(3))
+    pool.endpoints[0].outstanding = 5
+    picks = {pool.choose().url for _ in range(50)}
+    assert A not in picks
+
+
+def test_failing_replica_is_deprioritised_and_traffic_fails_over():
+    hits = []
+
+    def handler(request):
+        hits.append(request.url.host)
+        if request.url.host == "a":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"status": "accepted"})
+
+    async def scenario():
+        endpoints = make_endpoints(handler)
+        for _ in range(5):
+            response = await endpoints.post("1", [A, B], {"task_id": "t"})
+            assert response.status_code == 200
+        return endpoints.pools["1"].endpoints[0].health
+
+    health = asyncio.run(scenario())
+    assert hits.count("a") == 1
+    assert hits.count("b") == 5
+    assert health.consecutive_failures == 1
+
+
+def test_saturated_replica_is_skipped_without_ejection():
+    def handler(request):
+        if request.url.host == "a":
+            return httpx.Response(429, json={"status": "rejected"})
+        return httpx.Response(200)
+
+    async def scenario():
+        endpoints = make_endpoints(handler)
+        await endpoints.post("1", [A, B], {})
+        return endpoints.pools["1"].endpoints[0].health
+
+    health = asyncio.run(scenario())
+    assert health.state is CircuitState.closed
+    assert health.consecutive_failures == 0
+
+
+def test_all_replicas_down_raises_and_probe_restores():
+    state = {"up": False}
+
+    def handler(request):
+        if not state["up"]:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"status": "ok"})
+
+    async def scenario():
+        endpoints = make_endpoints(handler)
+        for _ in range(3):
+            with pytest.raises(httpx.RequestError):
+                await endpoints.post("1", A, {})
+        endpoint = endpoints.pools["1"].endpoints[0]
+        assert endpoint.health.state is CircuitState.open
+
+        state["up"] = True
+        await endpoints.probe()
+        assert endpoint.health.state is CircuitState.closed
+        assert (await endpoints.post("1", A, {})).status_code == 200
+
+    asyncio.run(scenario())
+
+
+def test_accepted_subtask_stays_outstanding_until_released():
+    hits = []
+
+    def handler(request):
+        hits.append(request.url.host)
+        return httpx.Response(200, json={"status": "accepted"})
+
+    async def scenario():
+        endpoints = make_endpoints(handler)
+        await endpoints.post("1", [A, B], {"task_id": "t1"})
+        await endpoints.post("1", [A, B], {"task_id": "t2"})
+        a, b = endpoints.pools["1"].endpoints
+        # 两个副本各在执行一个子任务
+        assert (a.outstanding, b.outstanding) == (1, 1)
+
+        assert endpoints.release("t1", "1")
+        assert not endpoints.release("t1", "1")
+        await endpoints.post("1", [A, B], {"task_id": "t3"})
+        assert (a.outstanding, b.outstanding) == (1, 1)
+
+        # 没有 task_id 的请求只在请求期间计入
+        await endpoints.post("1", [A, B], {})
+        assert a.outstanding + b.outstanding == 2
+
+    asyncio.run(scenario())
+    assert hits[:3] == ["a", "b", "a"]
+
+
+def test_close_stops_probe_and_client():
+    async def scenario():
+        endpoints = AgentEndpoints(probe_interval=60)
+        endpoints._ensure_started()
+        probe, client = endpoints._probe_task, endpoints.client
+        await endpoints.close()
+        return probe, client, endpoints
+
+    probe, client, endpoints = asyncio.run(scenario())
+    assert probe.cancelled() and client.is_closed
+    assert endpoints.client is None and endpoints._probe_task is None
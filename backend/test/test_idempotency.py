@@ -0,0 +1,176 @@
+import asyncio
+import functools
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from tenacity import wait_none
+
+from backend.server.app import accept, router as router_module, token_manager
+from backend.server.app.idempotency import IdempotencyStore, IdempotencyConflict
+
+CALLS = []
+
+
+async def counted(payload):
+    CALLS.append(payload["task_id"])
+    return {"status": "completed"}
+
+
+def test_concurrent_duplicates_share_one_execution():
+    async def scenario():
+        store = IdempotencyStore(ttl_seconds=60, max_keys=10)
+        runs = []
+
+        async def create():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return {"task_id": "t1"}
+
+        results = await asyncio.gather(*(store.run("k", "fp", create) for _ in range(5)))
+        with pytest.raises(IdempotencyConflict):
+            await store.run("k", "other", create)
+        return runs, results
+
+    runs, results = asyncio.run(scenario())
+    assert runs == [1]
+    assert [replayed for _, replayed in results] == [False, True, True, True, True]
+    assert all(result == {"task_id": "t1"} for result, _ in results)
+
+
+def test_failures_are_not_remembered_and_keys_are_bounded():
+    async def scenario():
+        store = IdempotencyStore(ttl_seconds=60, max_keys=2)
+
+        async def broken():
+            raise ValueError("invalid pipeline")
+
+        with pytest.raises(ValueError):
+            await store.run("bad", "fp", broken)
+        retried = await store.run("bad", "fp", lambda: asyncio.sleep(0, "ok"))
+        for key in ("a", "b"):
+            await store.run(key, "fp", lambda: asyncio.sleep(0, key))
+
+        expiring = IdempotencyStore(ttl_seconds=0.01, max_keys=10)
+        await expiring.run("k", "fp", lambda: asyncio.sleep(0, 1))
+        await asyncio.sleep(0.02)
+        again = await expiring.run("k", "fp", lambda: asyncio.sleep(0, 2))
+        return retried, list(store._entries), again
+
+    retried, keys, again = asyncio.run(scenario())
+    assert retried == ("ok", False)
+    assert keys == ["a", "b"]
+    assert again == (2, False)
+
+
+def test_in_flight_keys_survive_eviction_and_cancelled_firsts_rerun():
+    async def scenario():
+        store = IdempotencyStore(ttl_seconds=60, max_keys=1)
+        release = asyncio.Event()
+        runs = []
+
+        async def slow():
+            runs.append(1)
+            await release.wait()
+            return {"task_id": len(runs)}
+
+        first = asyncio.create_task(store.run("slow", "fp", slow))
+        await asyncio.sleep(0)
+        # 超出上限，但进行中的 key 不会被淘汰，重复请求仍等待同一次执行
+        await store.run("a", "fp", lambda: asyncio.sleep(0, "a"))
+        duplicate = asyncio.create_task(store.run("slow", "fp", slow))
+        await asyncio.sleep(0)
+        kept = "slow" in store._entries
+
+        # 首次请求被取消时，等待中的重复请求重新执行而不是收到 CancelledError
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return kept, runs, await duplicate, first.cancelled()
+
+    kept, runs, result, first_cancelled = asyncio.run(scenario())
+    assert kept and first_cancelled
+    assert runs == [1, 1] and result == ({"task_id": 2}, False)
+
+
+def make_client(monkeypatch):
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    agent_urls = {"counted": f"python:{__name__}:counted"}
+    app = FastAPI()
+    router_module.register_routes(app)
+    app.dependency_overrides[router_module.get_agent_urls_dependency] = lambda: agent_urls
+    monkeypatch.setattr(router_module, "AGENT_URLS", agent_urls)
+    return app
+
+
+def test_start_task_replays_original_task(monkeypatch):
+    CALLS.clear()
+    body = {"user_id": "idem-user", "input_data": {"q": 1}, "agent_types": ["counted"]}
+    with TestClient(make_client(monkeypatch)) as client:
+        headers = {"Idempotency-Key": "submit-1"}
+        first = client.post("/api/start-task", json=body, headers=headers)
+        second = client.post("/api/start-task", json=body, headers=headers)
+        conflict = client.post("/api/start-task", json={**body, "input_data": {"q": 2}}, headers=headers)
+        other_user = client.post("/api/start-task", json={**body, "user_id": "someone-else"}, headers=headers)
+        unkeyed = [client.post("/api/start-task", json=body).json()["task_id"] for _ in range(2)]
+
+    assert second.json() == first.json() and second.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert conflict.status_code == 422
+    assert other_user.json()["task_id"] != first.json()["task_id"]
+    assert len(set(unkeyed)) == 2
+    # 重放不会再次派发给 agent
+    assert CALLS.count(first.json()["task_id"]) == 1
+
+
+def test_accept_forwards_key_and_reuses_it_for_its_own_retries(monkeypatch):
+    backend = make_client(monkeypatch)
+    monkeypatch.setattr(accept.limiter, "enabled", False)
+    monkeypatch.setattr(accept, "BACKEND_API_URL", "http://backend/api/start-task")
+    monkeypatch.setattr(accept.httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=httpx.ASGITransport(app=backend)))
+    body = {"user_id": "gateway-user", "input_data": {}, "agent_types": ["counted"]}
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=accept.app), base_url="http://gateway") as client:
+            headers = {"X-API-Key": accept.API_KEYS[0], "Idempotency-Key": "retry-me"}
+            first = (await client.post("/accept", json=body, headers=headers)).json()
+            second = (await client.post("/accept", json=body, headers=headers)).json()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["task_id"] == second["task_id"] and first["token"] == second["token"]
+    assert (first["replayed"], second["replayed"]) == (False, True)
+
+
+def test_accept_retries_network_errors_and_server_errors(monkeypatch):
+    monkeypatch.setattr(accept.limiter, "enabled", False)
+    monkeypatch.setattr(accept.forward.retry, "wait", wait_none())
+    monkeypatch.setattr(accept, "BACKEND_API_URL", "http://backend/api/start-task")
+    keys = []
+
+    def backend(request):
+        keys.append(request.headers["idempotency-key"])
+        if len(keys) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        if len(keys) == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"task_id": "t1", "token": "x", "stream_token": "y"})
+
+    monkeypatch.setattr(accept.httpx, "AsyncClient", functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(backend)))
+    body = {"user_id": "gateway-user", "input_data": {}, "agent_types": ["counted"]}
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=accept.app), base_url="http://gateway") as client:
+            return await client.post("/accept", json=body, headers={"X-API-Key": accept.API_KEYS[0]})
+
+    response = asyncio.run(post())
+    assert response.status_code == 200 and response.json()["task_id"] == "t1"
+    # 三次转发带同一个生成的 key，后端据此去重
+    assert len(keys) == 3 and len(set(keys)) == 1
+
+    keys.clear()
+    monkeypatch.setattr(accept.httpx, "AsyncClient", functools.partial(
+        httpx.AsyncClient, transport=httpx.MockTransport(lambda request: keys.append(1) or httpx.Response(500))))
+    response = asyncio.run(post())
+    assert response.status_code == 502 and len(keys) == accept.RETRY_MAX_ATTEMPTS
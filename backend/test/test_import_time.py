@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# agent worker 冷启动预算（秒），留足 CI 机器的波动余量
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET_SECONDS", "1.0"))
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import backend.llm, backend.baseagent, backend.agents.charpter_1.application_create.process as process
+elapsed = time.perf_counter() - started
+print(elapsed, "openai" in sys.modules, "tiktoken" in sys.modules, "jinja2" in sys.modules)
+"""
+
+
+def test_agent_worker_import_is_lazy_and_within_budget():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": ROOT},
+    ).stdout.split()
+    elapsed, openai_loaded, tiktoken_loaded, jinja_loaded = float(output[0]), *output[1:]
+
+    assert (openai_loaded, tiktoken_loaded, jinja_loaded) == ("False", "False", "False")
+    assert elapsed < IMPORT_BUDGET, f"agent worker import took {elapsed:.3f}s (budget {IMPORT_BUDGET}s)"
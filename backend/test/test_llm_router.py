@@ -0,0 +1,155 @@
+import asyncio
+import random
+import importlib.util
+
+from backend.health import EndpointHealth, CircuitState
+from backend import llm_router
+from backend.llm_router import LLMRouter, Provider
+from backend.types import ChunkType, StreamChunk
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class FakeLLM:
+    model_type = "fake"
+    stream = False
+
+    def __init__(self, fail):
+        # True 为可重试的连接错误，也可以直接给出要抛出的异常
+        self.fail = ConnectionError("boom") if fail is True else fail
+        self.calls = 0
+
+    async def ask_once(self, messages, timeout=None, **kwargs):
+        return self.ask_sync_once(messages, timeout, **kwargs)
+
+    def ask_sync_once(self, messages, timeout=None, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise self.fail
+        return {"text": "ok"}
+
+    def open_stream(self, messages, timeout=None, **kwargs):
+        self.calls += 1
+        return FakeStream(self.fail)
+
+
+class FakeStream:
+    def __init__(self, fail: bool):
+        self.fail = fail
+        self._result = None
+
+    def __iter__(self):
+        if self.fail:
+            raise ConnectionError("boom")
+        yield StreamChunk(type=ChunkType.text, text="o")
+        yield StreamChunk(type=ChunkType.text, text="k")
+        self._result = {"text": "ok"}
+
+
+def make_router(**fails):
+    router = LLMRouter.__new__(LLMRouter)
+    router.providers = [
+        Provider(name, FakeLLM(fail), 1.0, EndpointHealth(cooldown=60))
+        for name, fail in fails.items()
+    ]
+    return router
+
+
+def test_circuit_breaker_trips_and_half_opens():
+    health = EndpointHealth(max_consecutive_failures=2, cooldown=10)
+    health.record_failure(0.1, now=0)
+    assert health.available(now=0)
+    health.record_failure(0.1, now=0)
+    assert health.state is CircuitState.open
+    assert not health.available(now=5)
+
+    assert health.acquire(now=11)
+    assert health.state is CircuitState.half_open
+    assert not health.acquire(now=11)
+
+    health.record_success(0.05)
+    assert health.state is CircuitState.closed
+    assert health.available()
+
+
+def test_router_fails_over_and_ejects_bad_provider(monkeypatch):
+    # 固定种子的独立随机源，保证故障供应商在熔断前被选中足够多次
+    monkeypatch.setattr(llm_router, "random", random.Random(7))
+    router = make_router(bad=True, good=False)
+    for _ in range(50):
+        result = asyncio.run(router.ask([{"role": "user", "content": "hi"}]))
+        assert result["text"] == "ok"
+        assert result["provider"] == "good"
+
+    bad = router.providers[0]
+    assert bad.health.state is CircuitState.open
+    # 熔断后不再把流量打到故障供应商
+    assert bad.llm.calls == bad.health.max_consecutive_failures
+
+
+def test_router_returns_last_error_when_all_fail():
+    router = make_router(a=True, b=True)
+    result = router.ask_sync([{"role": "user", "content": "hi"}])
+    assert "error" in result
+
+
+def test_request_errors_are_returned_without_failover_or_tripping():
+    router = make_router(a=BadRequest("invalid model"), b=BadRequest("invalid model"))
+    for _ in range(5):
+        result = router.ask_sync([{"role": "user", "content": "hi"}])
+        assert result["error"] == "invalid model"
+    # 每次只调用一个供应商，熔断状态不受影响
+    assert sum(provider.llm.calls for provider in router.providers) == 5
+    assert all(provider.health.state is CircuitState.closed and provider.health.samples == 0
+               for provider in router.providers)
+
+
+def test_providers_without_their_sdk_are_skipped(tmp_path):
+    config = tmp_path / "config.toml"
+    config.write_text('[router]\nproviders = ["mock", "qwen"]\n'
+                      '[mock]\nmodel = "m"\napi_key = "k"\nbase_url = "http://mock/v1"\n'
+                      '[qwen]\nmodel = "q"\napi_key = "k"\nbase_url = "http://qwen/v1"\n')
+    router = LLMRouter(config_path=str(config))
+    expected = ["mock"] if importlib.util.find_spec("qwen_api") is None else ["mock", "qwen"]
+    assert [provider.name for provider in router.providers] == expected
+
+
+def test_ask_many_keeps_order_and_isolates_errors():
+    router = make_router(a=False)
+
+    async def ask(messages, timeout=None, **kwargs):
+        content = messages[0]["content"]
+        await asyncio.sleep(0.001 * (5 - int(content)))
+        if content == "2":
+            raise RuntimeError("bad item")
+        return {"text": content}
+
+    router.ask = ask
+    batch = [[{"role": "user", "content": str(i)}] for i in range(5)]
+    results = asyncio.run(router.ask_many(batch, concurrency=3))
+
+    assert [r.get("text") for r in results] == ["0", "1", "异步调用失败", "3", "4"]
+    assert results[2]["error"] == "bad item"
+
+
+def test_stream_fails_over_before_first_chunk():
+    router = make_router(bad=True, good=False)
+    # 让故障供应商排在首位
+    router._candidates = lambda: list(router.providers)
+    stream = router.open_stream([{"role": "user", "content": "hi"}])
+    assert stream.result() == {"text": "ok", "provider": "good"}
+    assert "".join(router.stream_sync([{"role": "user", "content": "hi"}])) == "ok"
+
+    bad, good = router.providers
+    assert bad.health.consecutive_failures == 2 and good.health.samples == 2
+
+
+def test_all_tripped_providers_are_still_tried_in_fallback_order():
+    router = make_router(a=True, b=False)
+    for provider in router.providers:
+        provider.health._trip(now=0)
+    result = router.ask_sync([{"role": "user", "content": "hi"}])
+    assert result == {"text": "ok", "provider": "b"}
+    assert router.providers[1].health.state is CircuitState.closed
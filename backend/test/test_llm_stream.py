@@ -0,0 +1,215 @@
+import time
+import asyncio
+
+import pytest
+import tiktoken
+from openai.types.chat import ChatCompletionChunk
+
+from backend.llm import LLM
+from backend.types import ChunkType
+
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+def make_chunk(content=None, tool_call=None, finish_reason=None, usage=None):
+    delta = {}
+    if content is not None:
+        delta["content"] = content
+    if tool_call is not None:
+        delta["tool_calls"] = [tool_call]
+    choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if (delta or finish_reason) else []
+    data = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": choices}
+    if usage:
+        data["usage"] = usage
+    return ChatCompletionChunk.model_validate(data)
+
+
+RAW_CHUNKS = [
+    make_chunk("Hello"),
+    make_chunk(" world"),
+    make_chunk(tool_call={"index": 0, "id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": '{"q":'}}),
+    make_chunk(tool_call={"index": 0, "function": {"arguments": '"x"}'}}),
+    make_chunk(finish_reason="tool_calls"),
+    make_chunk(usage={"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8}),
+]
+
+
+class FakeCompletions:
+    def __init__(self, is_async):
+        self.is_async = is_async
+        self.requests = []
+
+    def create(self, **request):
+        self.requests.append(request)
+        if not self.is_async:
+            return iter(RAW_CHUNKS)
+
+        async def agen():
+            for chunk in RAW_CHUNKS:
+                yield chunk
+
+        async def opened():
+            return agen()
+        return opened()
+
+
+class FakeClient:
+    def __init__(self, is_async):
+        self.chat = type("Chat", (), {})()
+        self.chat.completions = FakeCompletions(is_async)
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: WordEncoding())
+    config = tmp_path / "config.toml"
+    config.write_text('[openai]\nmodel = "gpt-4"\napi_key = "k"\nbase_url = "http://localhost:1/v1"\n')
+    instance = LLM(model_type="openai", config_path=str(config))
+    instance.client = FakeClient(is_async=False)
+    instance.async_client = FakeClient(is_async=True)
+    instance.enable_function_calling([{"type": "function", "function": {"name": "lookup"}}])
+    return instance
+
+
+def test_sync_stream_yields_typed_chunks_and_aggregate(llm):
+    stream = llm.open_stream([{"role": "user", "content": "hi"}])
+    first = next(iter(stream))
+    assert first.type is ChunkType.text and first.text == "Hello"
+    assert not stream.done
+
+    result = stream.result()
+    assert stream.done
+    assert result["text"] == "Hello world"
+    assert result["tool_calls"] == [{"id": "call_1", "name": "lookup", "arguments": '{"q":"x"}'}]
+    assert result["finish_reason"] == "tool_calls"
+
+    request = llm.client.chat.completions.requests[0]
+    assert request["stream"] is True
+    assert request["tools"] and request["tool_choice"] == "auto"
+
+
+def test_async_stream_and_stream_async_text_only(llm):
+    async def run():
+        types = [chunk.type async for chunk in llm.open_stream([{"role": "user", "content": "hi"}])]
+        texts = [text async for text in llm.stream_async([{"role": "user", "content": "hi"}])]
+        return types, texts
+
+    types, texts = asyncio.run(run())
+    assert ChunkType.tool_call in types and ChunkType.usage in types
+    assert texts == ["Hello", " world"]
+
+
+def test_ask_with_stream_uses_aggregate(llm):
+    llm.stream = True
+    result = asyncio.run(llm.ask([{"role": "user", "content": "hi"}]))
+    assert result["text"] == "Hello world"
+    assert "error" not in result
+
+
+def test_provider_usage_skips_local_tokenizer(llm, monkeypatch):
+    def fail(text):
+        raise AssertionError("post-response path must not tokenize")
+
+    llm.usage_aggregator.reset()
+    stream = llm.open_stream([{"role": "user", "content": "hi"}])
+    assert stream.request["stream_options"] == {"include_usage": True}
+
+    monkeypatch.setattr(llm, "count_tokens", fail)
+    result = stream.result()
+    assert (result["input_tokens"], result["output_tokens"]) == (3, 5)
+
+    [totals] = llm.usage_aggregator.snapshot()
+    assert totals["calls"] == 1 and totals["output_tokens"] == 5 and totals["local_fallbacks"] == 0
+
+
+def test_stream_span_records_time_to_first_token(llm, monkeypatch):
+    from backend.tracing import tracer
+
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    tracer.clear()
+    with tracer.span("agent.job") as parent:
+        llm.open_stream([{"role": "user", "content": "hi"}]).result()
+
+    [span] = [span for span in tracer.export(parent.trace_id) if span["name"] == "llm.stream"]
+    assert span["parent_id"] == parent.span_id
+    assert 0 <= span["attributes"]["ttft_ms"] <= span["duration_ms"]
+    assert span["attributes"]["output_tokens"] == 5
+
+
+class HangingStream:
+    """
+    产出一块后一直等待的流，记录是否被关闭。
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        yield RAW_CHUNKS[0]
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_deadline_cancels_stream_and_bounds_request_timeout(llm):
+    from backend.deadline import deadline_scope
+
+    response = HangingStream()
+
+    async def create(**request):
+        llm.async_client.chat.completions.requests.append(request)
+        return response
+
+    llm.async_client.chat.completions.create = create
+    received = []
+
+    async def run():
+        with pytest.raises(TimeoutError):
+            async with deadline_scope(time.time() + 0.05):
+                async for chunk in llm.open_stream([{"role": "user", "content": "hi"}], timeout=600):
+                    received.append(chunk.text)
+
+    asyncio.run(run())
+    assert received == ["Hello"]
+    # 超过截止时间后连接被关闭，请求超时也不会超过剩余时间
+    assert response.closed
+    assert llm.async_client.chat.completions.requests[0]["timeout"] <= 0.05
+
+
+def test_offline_batch_latency_covers_submission_to_completion(llm):
+    import json
+    from types import SimpleNamespace
+
+    states = iter(["in_progress", "completed"])
+    output = json.dumps({"custom_id": "req-0", "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"content": "done"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}}})
+
+    async def create_file(**kwargs):
+        return SimpleNamespace(id="file-1")
+
+    async def create_batch(**kwargs):
+        return SimpleNamespace(id="batch-1")
+
+    async def retrieve(batch_id):
+        return SimpleNamespace(status=next(states), output_file_id="out-1", error_file_id=None)
+
+    async def content(file_id):
+        return SimpleNamespace(text=output)
+
+    llm.async_client.files = SimpleNamespace(create=create_file, content=content)
+    llm.async_client.batches = SimpleNamespace(create=create_batch, retrieve=retrieve)
+    recorded = []
+    llm.usage_aggregator = SimpleNamespace(record=lambda *args, **kwargs: recorded.append(args[4]))
+
+    results = asyncio.run(llm.ask_many([[{"role": "user", "content": "hi"}]], offline=True, poll_interval=0.05))
+    assert results[0]["text"] == "done"
+    # 耗时从提交算起，而不是取结果那一刻
+    assert recorded[0] >= 0.05
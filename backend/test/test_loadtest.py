@@ -0,0 +1,36 @@
+import asyncio
+
+from benchmarks import loadtest
+from backend.server.app import accept, router as router_module, token_manager
+
+
+def test_percentiles():
+    stats = loadtest.percentiles([0.001 * i for i in range(1, 101)])
+    assert stats["count"] == 100
+    assert stats["p50"] == 51.0
+    assert stats["p99"] == 100.0
+    assert loadtest.percentiles([])["p50"] is None
+
+
+def test_short_run_against_local_stack(monkeypatch):
+    # Stack 会改写这些模块级配置，先登记原值以便测试结束后还原
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    monkeypatch.setattr(router_module, "CALLBACK_PATH", router_module.CALLBACK_PATH)
+    monkeypatch.setattr(router_module, "AGENT_URLS", router_module.AGENT_URLS)
+    monkeypatch.setattr(accept, "BACKEND_API_URL", accept.BACKEND_API_URL)
+    monkeypatch.setattr(accept.limiter, "enabled", accept.limiter.enabled)
+
+    args = loadtest.build_parser().parse_args([
+        "--rate", "20", "--duration", "0.5", "--arrival", "constant", "--subscribers", "5",
+        "--agents", "2", "--chain", "--agent-mode", "local", "--agent-delay", "0.01", "0.02",
+        "--drain-timeout", "10", "--seed", "1",
+    ])
+    report = asyncio.run(loadtest.run(args))
+
+    assert report["counts"]["submitted"] in (10, 11)
+    assert report["counts"]["accepted"] == report["counts"]["submitted"]
+    assert report["errors"] == {}
+    assert report["counts"]["completed"] == report["counts"]["subscribed"] > 0
+    assert report["time_to_completion_ms"]["p50"] > 0
+    assert report["resources"]["rss_peak_bytes"] > 0
+    assert loadtest.check_thresholds(report, args) == []
@@ -0,0 +1,78 @@
+import io
+import json
+import queue
+import logging
+
+import pytest
+
+from backend import logging_setup
+from backend.logging_setup import LazyQueueHandler, SiteRateLimitFilter, configure_logging, shutdown_logging
+from backend.tracing import Tracer
+
+
+@pytest.fixture
+def log_stream():
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stream = io.StringIO()
+    yield stream
+    shutdown_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in saved_handlers:
+        root.addHandler(handler)
+    root.setLevel(saved_level)
+
+
+def _flush():
+    # 停掉监听线程即把队列中剩余的记录全部写出
+    shutdown_logging()
+
+
+def test_rate_limit_suppresses_hot_site():
+    limiter = SiteRateLimitFilter(rate=0.0001, burst=3)
+    record = lambda level=logging.INFO: logging.LogRecord("x", level, "hot.py", 10, "msg", (), None)
+
+    passed = [limiter.filter(record()) for _ in range(10)]
+    assert passed.count(True) == 3
+    # 告警级别不受限流影响
+    assert limiter.filter(record(logging.WARNING))
+
+    limiter._sites[("hot.py", 10)][0] = 1.0
+    released = record()
+    assert limiter.filter(released)
+    assert released.suppressed == 7
+
+
+def test_json_output_carries_trace_context(log_stream):
+    configure_logging(level="INFO", json_output=True, stream=log_stream, force=True)
+    tracer = Tracer(sample_rate=1.0)
+    logger = logging.getLogger("test.logging")
+    with tracer.span("work") as span:
+        logger.info("handled %s", "task-1", extra={"task_id": "task-1"})
+    _flush()
+
+    entry = json.loads(log_stream.getvalue().strip().splitlines()[-1])
+    assert entry["message"] == "handled task-1"
+    assert entry["trace_id"] == span.trace_id
+    assert entry["task_id"] == "task-1"
+
+
+def test_mutable_args_are_rendered_on_the_calling_thread(log_stream):
+    configure_logging(level="INFO", json_output=False, stream=log_stream, force=True)
+    state = {"step": 1}
+    logging.getLogger("test.logging").info("state=%s count=%d", state, 3)
+    state["step"] = 2
+    _flush()
+    assert "state={'step': 1} count=3" in log_stream.getvalue()
+
+    # 只含不可变参数的记录仍留到监听线程格式化
+    handler = LazyQueueHandler(queue.SimpleQueue())
+    record = logging.LogRecord("x", logging.INFO, "p.py", 1, "id=%s n=%d", ("a", 1), None)
+    assert handler.prepare(record).args == ("a", 1)
+
+
+def test_configure_is_idempotent(log_stream):
+    first = configure_logging(stream=log_stream, force=True)
+    assert configure_logging() is first
+    assert logging_setup._listener is first
@@ -0,0 +1,103 @@
+import pytest
+
+from backend.memory import ConversationMemory, MemoryPolicy, MemoryStore
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join(["w"] * words)}
+
+
+def test_sliding_window_stays_within_budget():
+    memory = ConversationMemory(token_budget=10, policy=MemoryPolicy.sliding_window, count_tokens=count_words)
+    for _ in range(100):
+        memory.append(message("user", 3))
+    assert memory.total_tokens <= 10
+    assert len(memory) == 3
+
+
+def test_pinned_system_prompt_survives_eviction():
+    memory = ConversationMemory(token_budget=10, policy=MemoryPolicy.pin_system, count_tokens=count_words)
+    system = message("system", 4)
+    memory.append(system)
+    memory.extend([message("user", 3) for _ in range(10)])
+    # 重复的 system prompt 不会被反复累加
+    memory.append(dict(system))
+
+    assert memory.messages[0] == system
+    assert memory.total_tokens <= 10
+    assert len(memory) == 3
+
+
+def test_summarize_hook_compacts_evicted_messages():
+    seen = []
+
+    def summarizer(messages):
+        seen.append(len(messages))
+        return "short"
+
+    memory = ConversationMemory(token_budget=12, policy=MemoryPolicy.summarize, count_tokens=count_words, summarizer=summarizer)
+    memory.extend([message("user", 3) for _ in range(5)])
+
+    assert seen
+    assert memory.messages[0]["content"].endswith("short")
+    assert memory.total_tokens <= 12
+
+
+def test_memory_store_scopes_and_bounds_sessions():
+    store = MemoryStore(lambda: ConversationMemory(token_budget=100, count_tokens=count_words), max_sessions=2)
+    store.get("a").append(message("user", 1))
+    store.get("b").append(message("user", 2))
+    assert store.get("a").total_tokens == 1
+    store.get("c")
+    assert len(store) == 2
+    # "b" 最久未使用，被淘汰
+    assert store.get("b").total_tokens == 0
+
+
+def test_pinned_messages_count_against_hard_budget():
+    memory = ConversationMemory(token_budget=10, policy=MemoryPolicy.pin_system, count_tokens=count_words)
+    with pytest.raises(ValueError):
+        memory.append(message("system", 11))
+    first, second = message("system", 6), message("system", 5)
+    memory.extend([first, message("user", 3), second])
+    # 普通消息淘汰完仍超预算时，淘汰最早的 system 消息
+    assert memory.messages == [second]
+    assert memory.total_tokens <= 10
+
+
+def test_calls_without_session_do_not_share_memory(tmp_path, monkeypatch):
+    import asyncio
+    import tiktoken
+    from backend.baseagent import PromptAgent
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: None)
+    config = tmp_path / "config.toml"
+    config.write_text('[openai]\nmodel = "gpt-4"\napi_key = "k"\nbase_url = "http://localhost:1/v1"\n')
+    agent = PromptAgent(config_path=str(config), debug=False)
+    seen = []
+
+    async def ask(messages, **kwargs):
+        await asyncio.sleep(0.01)
+        seen.append([m["content"] for m in agent.memory_for().messages])
+        return {"text": f"reply to {messages[-1]['content']}"}
+
+    agent.llm.ask = ask
+
+    async def scenario():
+        await asyncio.gather(agent.arun("a"), agent.arun("b"))
+
+    asyncio.run(scenario())
+    assert sorted(seen) == [["a"], ["b"]]
+    assert len(agent.sessions) == 0
+    # 调用之外、没有会话时没有可写的记忆
+    with pytest.raises(ValueError):
+        agent.remember("user", "orphan")
+
+    agent.llm.open_stream = lambda messages, **kwargs: messages
+    agent.open_stream("streamed")
+    agent.open_stream("kept", session_id="s")
+    assert [m["content"] for m in agent.memory_for("s").messages] == ["kept"] and len(agent.sessions) == 1
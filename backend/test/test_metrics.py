@@ -0,0 +1,62 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.metrics import MetricsMiddleware, MetricsRegistry, metrics_endpoint, registry
+
+
+def test_render_prometheus_text():
+    metrics = MetricsRegistry()
+    requests = metrics.counter("demo_requests_total", "Demo requests", ("route",))
+    depth = metrics.gauge("demo_queue_depth", "Demo queue depth")
+    latency = metrics.histogram("demo_latency_seconds", "Demo latency", buckets=(0.1, 1.0))
+
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    depth.set_function(lambda: 7)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    text = metrics.render()
+    assert "# TYPE demo_requests_total counter" in text
+    assert 'demo_requests_total{route="/a"} 3' in text
+    assert "demo_queue_depth 7" in text
+    assert 'demo_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{le="1"} 2' in text
+    assert 'demo_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "demo_latency_seconds_count 3" in text
+
+
+def test_registry_returns_existing_metric():
+    metrics = MetricsRegistry()
+    assert metrics.counter("x_total", "x") is metrics.counter("x_total", "x")
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    text = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in text
+
+
+def test_observation_overhead_is_small():
+    child = registry.histogram("bench_latency_seconds", "Benchmark").labels()
+    counter = registry.counter("bench_total", "Benchmark").labels()
+    n = 100_000
+    started = time.perf_counter()
+    for _ in range(n):
+        child.observe(0.02)
+        counter.inc()
+    per_observation = (time.perf_counter() - started) / (2 * n)
+    # 正常约 0.1-0.3µs；放宽上限避免在繁忙的 CI 机器上抖动
+    assert per_observation < 5e-6
@@ -0,0 +1,127 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+import tiktoken
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI, OpenAI
+from tenacity import wait_none
+
+from backend.llm import LLM, llm_retries
+from backend.mock_llm_server import MockLLM, MockSettings, create_app, tokenize
+
+MESSAGES = [{"role": "user", "content": "hello mock world"}]
+TOOLS = [{"type": "function", "function": {
+    "name": "lookup",
+    "parameters": {"type": "object", "properties": {"q": {"type": "string"}, "n": {"type": "integer"}}, "required": ["q", "n"]},
+}}]
+
+
+class WordEncoding:
+    def encode(self, text):
+        return text.split()
+
+
+def make_llm(tmp_path, monkeypatch, settings=None, stream=False):
+    monkeypatch.setattr(tiktoken, "encoding_for_model", lambda model: WordEncoding())
+    config = tmp_path / "config.toml"
+    config.write_text(f'[mock]\nmodel = "mock-1"\napi_key = "mock"\nbase_url = "http://testserver/v1"\nstream = {str(stream).lower()}\n')
+    app = create_app(settings or MockSettings())
+    instance = LLM(model_type="mock", config_path=str(config))
+    instance.client = OpenAI(api_key="mock", base_url="http://testserver/v1", http_client=TestClient(app), max_retries=0)
+    instance.async_client = AsyncOpenAI(api_key="mock", base_url="http://testserver/v1", max_retries=0,
+                                        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://testserver"))
+    return instance, app
+
+
+def test_tokenize_round_trips():
+    text = "你好 world  foo。bar"
+    assert "".join(tokenize(text)) == text
+    assert tokenize("你好")[:2] == ["你", "好"]
+
+
+def test_ask_sync_echo_with_usage(tmp_path, monkeypatch):
+    llm, _ = make_llm(tmp_path, monkeypatch)
+    result = llm.ask_sync(list(MESSAGES))
+    assert result["text"] == "echo: hello mock world"
+    assert result["input_tokens"] == 3
+    assert result["output_tokens"] == 4
+
+
+def test_stream_sync_and_async_match_non_streaming(tmp_path, monkeypatch):
+    llm, _ = make_llm(tmp_path, monkeypatch, MockSettings(response="canned", canned_text="one two three"))
+    assert "".join(llm.stream_sync(list(MESSAGES))) == "one two three"
+
+    async def collect():
+        return await llm.open_stream(list(MESSAGES)).aresult()
+
+    result = asyncio.run(collect())
+    assert result["text"] == "one two three"
+    assert result["output_tokens"] == 3
+    assert result["finish_reason"] == "stop"
+
+
+def test_tool_call_then_text_after_tool_result(tmp_path, monkeypatch):
+    llm, _ = make_llm(tmp_path, monkeypatch, stream=True)
+    llm.enable_function_calling(TOOLS, tool_choice="lookup")
+    result = llm.open_stream(list(MESSAGES)).result()
+    assert result["finish_reason"] == "tool_calls"
+    assert result["tool_calls"][0]["name"] == "lookup"
+    assert result["tool_calls"][0]["arguments"] == '{"q": "mock", "n": 1}'
+
+    follow_up = list(MESSAGES) + [{"role": "tool", "tool_call_id": result["tool_calls"][0]["id"], "content": "done"}]
+    assert llm.open_stream(follow_up).result()["text"] == "echo: hello mock world"
+
+
+def test_error_and_rate_limit_injection(tmp_path, monkeypatch):
+    llm, app = make_llm(tmp_path, monkeypatch, MockSettings(rate_limit_rate=1.0, retry_after=2))
+    client = TestClient(app)
+    response = client.post("/v1/chat/completions", json={"model": "mock-1", "messages": MESSAGES})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert response.json()["error"]["type"] == "rate_limit_error"
+
+    forced = client.post("/v1/chat/completions", json={"model": "mock-1", "messages": MESSAGES}, headers={"X-Mock-Status": "503"})
+    assert forced.status_code == 503
+    assert "error" in llm.ask_sync(list(MESSAGES))
+    assert client.get("/stats").json()["rate_limited"] == 2
+
+
+def test_ask_retries_rate_limits_but_not_client_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(LLM._ask.retry, "wait", wait_none())
+    llm, app = make_llm(tmp_path, monkeypatch, MockSettings(rate_limit_rate=1.0))
+    retries = llm_retries.labels("mock")
+    before = retries.value
+
+    result = asyncio.run(llm.ask(list(MESSAGES)))
+    assert "error" in result
+    # 5 次尝试，中间 4 次重试
+    assert retries.value - before == 4
+    assert TestClient(app).get("/stats").json()["rate_limited"] == 5
+
+    before = retries.value
+    result = asyncio.run(llm.ask(list(MESSAGES), extra_headers={"X-Mock-Status": "400"}))
+    assert "error" in result and retries.value == before
+
+
+def test_latency_and_token_rate(tmp_path, monkeypatch):
+    llm, _ = make_llm(tmp_path, monkeypatch, MockSettings(latency_ms=50, tokens_per_second=100, response="canned", canned_text="a b c d e"))
+
+    async def timed():
+        stream = llm.open_stream(list(MESSAGES))
+        await stream.aresult()
+        return stream.first_chunk_at - stream.started, time.perf_counter() - stream.started
+
+    ttft, total = asyncio.run(timed())
+    assert ttft >= 0.05
+    # 5 个 token，每个间隔 10ms
+    assert total >= 0.05 + 0.04
+
+
+def test_seeded_latency_is_reproducible():
+    first = MockLLM(MockSettings(latency_ms=100, latency_jitter=0.5, seed=7))
+    second = MockLLM(MockSettings(latency_ms=100, latency_jitter=0.5, seed=7))
+    assert [first.sample_latency() for _ in range(5)] == [second.sample_latency() for _ in range(5)]
+    with pytest.raises(ValueError):
+        MockSettings(response="random")
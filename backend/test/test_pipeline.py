@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from backend.server.app.pipeline import PipelineError, build_graph, critical_path
+from backend.server.app.task_manager import TaskManager
+
+
+def test_build_graph_rejects_invalid_pipelines():
+    assert build_graph(["1", "2"]) == {"1": [], "2": []}
+    with pytest.raises(PipelineError):
+        build_graph(["1", "2"], {"2": ["3"]})
+    with pytest.raises(PipelineError):
+        build_graph(["1", "2", "3"], {"1": ["3"], "2": ["1"], "3": ["2"]})
+
+
+def test_critical_path_follows_longest_branch():
+    graph = build_graph(["a", "b", "c", "d"], {"b": ["a"], "c": ["a"], "d": ["b", "c"]})
+    length, path = critical_path(graph, {"a": 1.0, "b": 5.0, "c": 2.0, "d": 1.0})
+    assert length == 7.0
+    assert path == ["a", "b", "d"]
+
+
+def test_task_manager_dispatches_nodes_when_inputs_complete():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("t", "u", {}, ["1", "2", "3", "4"], {"3": ["1", "2"], "4": ["3"]})
+
+        assert sorted(await manager.claim_ready("t")) == ["1", "2"]
+        assert await manager.claim_ready("t") == []
+
+        await manager.update_subtask_status("t", "1", "completed", file_url="f1", result={"pages": 3})
+        assert await manager.claim_ready("t") == []
+        await manager.update_subtask_status("t", "2", "completed", file_url="f2")
+        assert await manager.claim_ready("t") == ["3"]
+        assert manager.upstream_outputs("t", "3") == {
+            "1": {"file_url": "f1", "result": {"pages": 3}},
+            "2": {"file_url": "f2", "result": None},
+        }
+
+        await manager.update_subtask_status("t", "3", "completed")
+        assert await manager.claim_ready("t") == ["4"]
+        await manager.update_subtask_status("t", "4", "completed")
+
+        event = await manager.get_initial_state("t")
+        assert event["completed"]
+        report = event["pipeline"]
+        assert report["critical_path"][-2:] == ["3", "4"]
+        assert set(report["nodes"]) == {"1", "2", "3", "4"}
+
+    asyncio.run(scenario())
+
+
+def test_failure_propagates_downstream():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("t", "u", {}, ["1", "2", "3"], {"2": ["1"], "3": ["2"]})
+        await manager.claim_ready("t")
+        await manager.update_subtask_status("t", "1", "failed")
+
+        status = (await manager.get_initial_state("t"))["status"]
+        assert [status[node]["status"] for node in ("1", "2", "3")] == ["failed"] * 3
+        assert await manager.claim_ready("t") == []
+
+    asyncio.run(scenario())
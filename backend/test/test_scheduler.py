@@ -0,0 +1,211 @@
+import random
+import asyncio
+
+import pytest
+
+from backend.server.app import scheduler as scheduler_module
+from backend.server.app.scheduler import Job, PriorityClass, Scheduler
+
+
+class Recorder:
+    """
+    记录派发顺序；派发后名额一直占用，直到测试显式 release，模拟 agent 回调。
+    """
+
+    def __init__(self, scheduler: Scheduler):
+        self.scheduler = scheduler
+        self.order = []
+        self.running = []
+
+    def job(self, task_id: str, agent_type: str = "1"):
+        async def dispatch():
+            self.order.append(task_id)
+            self.running.append((task_id, agent_type))
+        return dispatch
+
+    def submit(self, task_id: str, tenant: str, priority: str = "standard"):
+        self.scheduler.submit(task_id, "1", tenant, priority, self.job(task_id))
+
+    async def complete_one(self):
+        await asyncio.sleep(0)
+        task_id, agent_type = self.running.pop(0)
+        assert self.scheduler.release(task_id, agent_type)
+        await asyncio.sleep(0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_round_robin_between_tenants():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, tenant_max_in_flight=10, weights={}, tenant_limits={})
+        recorder = Recorder(scheduler)
+        for i in range(20):
+            recorder.submit(f"bulk-{i}", "bulk")
+        for i in range(3):
+            recorder.submit(f"user-{i}", "interactive-user")
+        for _ in range(8):
+            await recorder.complete_one()
+        return recorder.order
+
+    order = run(scenario())
+    # 大批量租户先占了名额，但之后两个租户交替派发
+    assert order[:7] == ["bulk-0", "bulk-1", "user-0", "bulk-2", "user-1", "bulk-3", "user-2"]
+
+
+def test_weights_share_capacity_proportionally():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, tenant_max_in_flight=10, weights={"heavy": 3}, tenant_limits={})
+        recorder = Recorder(scheduler)
+        for i in range(40):
+            recorder.submit(f"heavy-{i}", "heavy")
+            recorder.submit(f"light-{i}", "light")
+        for _ in range(40):
+            await recorder.complete_one()
+        return recorder.order[:40]
+
+    order = run(scenario())
+    heavy = sum(1 for task_id in order if task_id.startswith("heavy"))
+    assert 28 <= heavy <= 32
+
+
+def test_higher_priority_jumps_the_queue():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, tenant_max_in_flight=10, weights={}, tenant_limits={})
+        recorder = Recorder(scheduler)
+        for i in range(10):
+            recorder.submit(f"batch-{i}", "a", "batch")
+        recorder.submit("urgent", "b", "interactive")
+        await recorder.complete_one()
+        return recorder.order, scheduler.snapshot()
+
+    order, snapshot = run(scenario())
+    assert order == ["batch-0", "urgent"]
+    assert snapshot["queued"] == {"interactive": 0, "standard": 0, "batch": 9}
+
+
+def test_tenant_in_flight_cap_leaves_capacity_to_others():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=10, tenant_max_in_flight=2, weights={}, tenant_limits={"vip": 4})
+        recorder = Recorder(scheduler)
+        for i in range(10):
+            recorder.submit(f"a-{i}", "a")
+            recorder.submit(f"vip-{i}", "vip")
+        await asyncio.sleep(0)
+        return scheduler.snapshot()
+
+    snapshot = run(scenario())
+    assert snapshot["tenants"]["a"]["in_flight"] == 2
+    assert snapshot["tenants"]["vip"]["in_flight"] == 4
+    assert snapshot["in_flight"] == 6
+
+
+def test_lease_expiry_and_dispatch_errors_release_slots():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=1, tenant_max_in_flight=1, lease_seconds=0.01, weights={}, tenant_limits={})
+        recorder = Recorder(scheduler)
+        released = []
+        scheduler.on_release = lambda task_id, agent_type: released.append(task_id)
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        scheduler.submit("broken", "1", "t", "standard", broken)
+        recorder.submit("next", "t")
+        recorder.submit("after-lease", "t")
+        await asyncio.sleep(0.05)
+        return recorder.order, scheduler.snapshot(), released
+
+    order, snapshot, released = run(scenario())
+    assert order == ["next", "after-lease"]
+    assert released == ["broken", "next", "after-lease"]
+    # 两个名额都在租约到期后归还
+    assert snapshot["in_flight"] == 0
+
+
+def test_unknown_priority_is_rejected():
+    scheduler = Scheduler(weights={}, tenant_limits={})
+    with pytest.raises(ValueError):
+        scheduler.submit("t", "1", "tenant", "urgent", None)
+
+
+def test_non_positive_weights_and_quantum_are_rejected(monkeypatch):
+    with pytest.raises(ValueError):
+        Scheduler(quantum=0, weights={}, tenant_limits={})
+    with pytest.raises(ValueError):
+        Scheduler(weights={"a": 0}, tenant_limits={})
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_TENANT_WEIGHTS", "a=2,b=-1")
+    with pytest.raises(ValueError):
+        Scheduler(tenant_limits={})
+    scheduler = Scheduler(weights={}, tenant_limits={})
+    with pytest.raises(ValueError):
+        scheduler.configure_tenant("a", weight=0)
+    assert scheduler.weight("a") == 1.0
+
+
+def stepwise_pop(priority_class, quantum, weight, eligible):
+    """
+    逐个租户轮转的原始 DRR 实现，作为 PriorityClass.pop 的参照。
+    """
+    if not any(eligible(tenant) for tenant in priority_class.active):
+        return None
+    while True:
+        tenant = priority_class.active[0]
+        if not eligible(tenant):
+            priority_class.active.rotate(-1)
+            continue
+        queue = priority_class.queues[tenant]
+        if priority_class.deficit[tenant] < queue[0].cost:
+            priority_class.deficit[tenant] += quantum * weight(tenant)
+            priority_class.active.rotate(-1)
+            continue
+        job = queue.popleft()
+        priority_class.deficit[tenant] -= job.cost
+        priority_class.size -= 1
+        if not queue:
+            del priority_class.queues[tenant], priority_class.deficit[tenant]
+            priority_class.active.popleft()
+        return job
+
+
+def test_pop_matches_stepwise_round_robin_with_large_costs():
+    rng = random.Random(3)
+    weights = {"a": 1.0, "b": 0.25, "c": 3.0, "d": 0.5}
+    blocked = {"d"}
+    computed, stepwise = PriorityClass(), PriorityClass()
+    for i in range(200):
+        tenant, cost = rng.choice("abcd"), rng.choice((0.5, 1.0, 4.0, 40.0))
+        for priority_class in (computed, stepwise):
+            priority_class.push(Job(f"t{i}", "1", tenant, "standard", None, cost))
+
+    eligible = lambda tenant: tenant not in blocked
+    computed_order = []
+    while True:
+        job = computed.pop(0.5, weights.get, eligible)
+        if job is None:
+            break
+        computed_order.append(job.task_id)
+        expected = stepwise_pop(stepwise, 0.5, weights.get, eligible)
+        assert expected.task_id == job.task_id
+    assert stepwise_pop(stepwise, 0.5, weights.get, eligible) is None
+    assert list(computed.active) == ["d"] and len(computed_order) == 200 - computed.size
+
+
+def test_cancel_task_drops_queue_and_releases_slots():
+    async def scenario():
+        scheduler = Scheduler(max_in_flight=2, tenant_max_in_flight=10, weights={}, tenant_limits={})
+        recorder = Recorder(scheduler)
+        for i in range(3):
+            scheduler.submit("doomed", str(i), "a", "standard", recorder.job("doomed", str(i)))
+        recorder.submit("other", "b")
+        await asyncio.sleep(0)
+        released = scheduler.cancel_task("doomed")
+        await asyncio.sleep(0)
+        return released, recorder.order, scheduler.snapshot()
+
+    released, order, snapshot = run(scenario())
+    assert released == ["0", "1"]
+    # 排队中的第三个子任务被丢弃，空出的名额交给其他任务
+    assert order == ["doomed", "doomed", "other"]
+    assert snapshot["queued"]["standard"] == 0 and snapshot["in_flight"] == 1
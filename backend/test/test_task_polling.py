@@ -0,0 +1,121 @@
+import time
+import asyncio
+import threading
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.server.app import router as router_module
+from backend.server.app import token_manager
+from backend.server.app.task_manager import TaskManager, task_manager
+
+RELEASE = threading.Event()
+
+
+async def gated(payload):
+    while not RELEASE.is_set():
+        await asyncio.sleep(0.01)
+    return {"status": "completed", "file_url": f"artifact://{payload['task_id']}"}
+
+
+def test_versions_advance_per_task_and_user():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("a", "u", {"big": "x" * 100}, ["1"])
+        await manager.create_task("b", "u", {}, ["1"])
+        a_before, user_before = manager.task_version("a"), manager.user_version("u")
+        await manager.update_subtask_status("b", "1", "running")
+        await asyncio.sleep(0)
+        summary = manager.get_user_tasks("u", summary=True)
+
+        waiter = asyncio.create_task(manager.wait_for_change(("task", "a"), a_before, 1))
+        idle = await manager.wait_for_change(("task", "b"), manager.task_version("b"), 0.01)
+        await manager.update_subtask_status("a", "1", "completed")
+        woke = await waiter
+        await manager.cleanup_task("a")
+        return a_before, user_before, manager, summary, idle, woke
+
+    a_before, user_before, manager, summary, idle, woke = asyncio.run(scenario())
+    assert manager.user_version("u") > user_before > a_before
+    assert [item["task_id"] for item in summary] == ["a", "b"]
+    assert all("input_data" not in item and "pipeline" not in item for item in summary)
+    assert not idle and woke
+    assert manager.by_user["u"] == {"b": None} and manager.waiters == {}
+
+
+def make_client(monkeypatch):
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    agent_urls = {"gated": f"python:{__name__}:gated"}
+    app = FastAPI()
+    router_module.register_routes(app)
+    app.dependency_overrides[router_module.get_agent_urls_dependency] = lambda: agent_urls
+    monkeypatch.setattr(router_module, "AGENT_URLS", agent_urls)
+    return TestClient(app)
+
+
+def test_conditional_get_returns_304_until_task_changes(monkeypatch):
+    RELEASE.clear()
+    with make_client(monkeypatch) as client:
+        started = client.post("/api/start-task", json={"user_id": "poll-user", "input_data": {"q": 1}, "agent_types": ["gated"]}).json()
+        url = f"/api/tasks/poll-user/{started['task_id']}"
+        params = {"token": started["token"]}
+        time.sleep(0.05)
+
+        first = client.get(url, params=params)
+        etag, version = first.headers["etag"], int(first.headers["x-version"])
+        assert first.json()["input_data"] == {"q": 1}
+        assert client.get(url, params=params, headers={"If-None-Match": etag}).status_code == 304
+        summary = client.get(url, params={**params, "view": "summary"}, headers={"If-None-Match": etag})
+        assert summary.status_code == 200 and "input_data" not in summary.json()
+        assert client.get(url, params={**params, "since": version}).status_code == 304
+
+        # 长轮询挂起直到任务变化，而不是立即返回
+        timer = threading.Timer(0.2, RELEASE.set)
+        timer.start()
+        began = time.monotonic()
+        changed = client.get(url, params={**params, "since": version, "wait": 5})
+        elapsed = time.monotonic() - began
+        timer.join()
+
+        assert 0.15 <= elapsed < 5
+        assert changed.status_code == 200 and int(changed.headers["x-version"]) > version
+        assert client.get(url, params={"token": "bad"}).status_code == 403
+        assert client.get(url, params={"token": started["stream_token"]}).status_code == 200
+        assert client.get("/api/tasks/someone-else/" + started["task_id"], params=params).status_code == 403
+
+
+def test_user_versions_are_scoped_to_the_tenant():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("a", "u", {}, ["1"], tenant_id="key-a")
+        before = manager.user_version("u", "key-a")
+        waiter = asyncio.create_task(manager.wait_for_change(("user", "u", "key-a"), before, 0.05))
+        await asyncio.sleep(0)
+        # 同名用户在另一个租户下的变化不影响 key-a 的版本，也不唤醒其长轮询
+        await manager.create_task("b", "u", {}, ["1"], tenant_id="key-b")
+        woke = await waiter
+        return manager, before, woke
+
+    manager, before, woke = asyncio.run(scenario())
+    assert manager.user_version("u", "key-a") == before and not woke
+    assert manager.user_version("u", "key-b") > before
+    assert manager.user_version("u") == 0
+
+
+def test_user_list_long_poll_times_out_with_304(monkeypatch):
+    with make_client(monkeypatch) as client:
+        token = token_manager.create_stream_token("idle-user", "idle-user")
+        # 没有用户级令牌时既不渲染也不挂起
+        assert client.get("/api/tasks/idle-user", params={"since": 0, "wait": 30}).status_code == 403
+        wrong_user = token_manager.create_stream_token("someone-else", "someone-else")
+        assert client.get("/api/tasks/idle-user", params={"token": wrong_user}).status_code == 403
+        assert ("user", "idle-user", "idle-user") not in task_manager.waiters
+
+        listing = client.get("/api/tasks/idle-user", params={"view": "summary", "token": token})
+        version = int(listing.headers["x-version"])
+        assert listing.json() == [] and listing.headers["cache-control"] == "no-cache"
+        monkeypatch.setattr(router_module, "TASK_POLL_MAX_WAIT", 0.05)
+        began = time.monotonic()
+        response = client.get("/api/tasks/idle-user", params={"since": version, "wait": 30, "token": token})
+        assert response.status_code == 304 and time.monotonic() - began < 1
+        assert ("user", "idle-user", "idle-user") not in task_manager.waiters
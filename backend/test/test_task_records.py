@@ -0,0 +1,67 @@
+import asyncio
+
+from backend.types import AgentState
+from backend.server.app.task_manager import Status, TaskManager, TaskRecord
+
+
+def test_completed_count_tracks_transitions():
+    task = TaskRecord("u", {"1": [], "2": ["1"]}, "u", "standard", None)
+    first, second = task.agents["1"], task.agents["2"]
+    assert not task.completed and second.upstream == ("1",)
+
+    task.set_status(first, Status.completed)
+    task.set_status(first, Status.completed)
+    assert task.completed_count == 1
+    task.set_status(second, Status.parse(AgentState.processing))
+    assert second.status is Status.running
+    task.set_status(second, Status.parse("completed"))
+    assert task.completed
+
+    # 回退状态时计数同步减少
+    task.set_status(first, Status.failed)
+    assert task.completed_count == 1 and not task.completed
+    # 失败同样是结束状态：全部子任务结束即 finished
+    assert task.terminal_count == 2 and task.finished
+    task.set_status(first, Status.running)
+    assert task.terminal_count == 1 and not task.finished
+
+
+def test_input_data_lives_outside_the_record():
+    async def scenario():
+        manager = TaskManager()
+        payload = {"document": "x" * 1000}
+        await manager.create_task("t", "u", payload, ["1"])
+        record = manager.tasks["t"]
+        assert not hasattr(record, "__dict__")
+        assert manager.input_data("t") is payload
+        assert manager.get_user_tasks("u")[0]["input_data"] is payload
+
+        await manager.cleanup_task("t")
+        return manager
+
+    manager = asyncio.run(scenario())
+    assert manager.tasks == {} and manager.inputs == {}
+
+
+def test_sse_listener_ends_when_a_subtask_fails():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("t", "u", {}, ["1", "2"], dependencies={"2": ["1"]})
+        events = []
+
+        async def listen():
+            async for event in manager.listen_for_events("t"):
+                events.append(event)
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0)
+        await manager.update_subtask_status("t", "1", "failed")
+        async with asyncio.timeout(1):
+            await listener
+        return manager, events
+
+    manager, events = asyncio.run(scenario())
+    final = events[-1]
+    assert final["status"] == {"1": {"status": "failed", "file_url": ""}, "2": {"status": "failed", "file_url": ""}}
+    assert not final["completed"] and "pipeline" in final
+    assert manager.sse_queues["t"] == [] and manager.broadcasts == set()
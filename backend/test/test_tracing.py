@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from backend.agents.outbox import CallbackOutbox
+from backend.agents.runtime import AgentService
+from backend.tracing import SpanContext, Tracer, tracer, with_traceparent
+
+
+def test_traceparent_round_trip_and_url_injection():
+    context = SpanContext("a" * 32, "b" * 16, True)
+    parsed = SpanContext.parse(context.traceparent)
+    assert (parsed.trace_id, parsed.span_id, parsed.sampled) == ("a" * 32, "b" * 16, True)
+    assert SpanContext.parse("garbage") is None
+
+    url = with_traceparent("http://h/api/callback/u/t/1?token=x", context.traceparent)
+    assert url == f"http://h/api/callback/u/t/1?token=x&traceparent={context.traceparent}"
+    assert with_traceparent(url, context.traceparent).count("traceparent") == 1
+
+
+def test_tail_sampling_keeps_slow_and_failed_traces():
+    local = Tracer(sample_rate=0.0, slow_seconds=60.0)
+    with local.span("fast"):
+        with local.span("child"):
+            pass
+    assert local.export() == []
+    assert local.counters["dropped"] == 2
+
+    with pytest.raises(RuntimeError):
+        with local.span("root"):
+            with local.span("child"):
+                raise RuntimeError("boom")
+    names = [span["name"] for span in local.export()]
+    assert names == ["child", "root"]
+
+    local.slow_seconds = 0.0
+    with local.span("slow"):
+        pass
+    assert local.traces(limit=1)[0]["slowest"]["name"] == "slow"
+
+
+def test_remote_parent_continues_trace():
+    local = Tracer(sample_rate=0.0)
+    with local.span("router.dispatch") as upstream:
+        pass
+    remote = SpanContext(upstream.trace_id, upstream.span_id, True)
+    with local.span("agent.job", parent=remote.traceparent) as job:
+        pass
+    assert job.trace_id == upstream.trace_id and job.parent_id == upstream.span_id
+    # 上游已头部采样，下游跟随保留
+    assert [span["name"] for span in local.export()] == ["agent.job"]
+
+
+@pytest.mark.asyncio
+async def test_agent_job_joins_trace_and_tags_callback(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracer, "sample_rate", 0.0)
+    tracer.clear()
+    done = asyncio.Event()
+
+    async def handler(data):
+        service.report(data, {"subtask_id": "1", "status": "completed"})
+        done.set()
+
+    service = AgentService("traced", handler, outbox=CallbackOutbox(str(tmp_path / "outbox.jsonl")))
+    upstream = SpanContext("c" * 32, "d" * 16, True)
+    service.submit({
+        "task_id": "t",
+        "callback_url": "http://backend/api/callback/u/t/1",
+        "token": "tok",
+        "traceparent": upstream.traceparent,
+    })
+    await asyncio.wait_for(done.wait(), 1)
+    await asyncio.sleep(0)
+
+    [job] = tracer.export(upstream.trace_id)
+    assert job["name"] == "agent.job" and job["parent_id"] == "d" * 16 and job["service"] == "traced"
+    [entry] = service.outbox.pending.values()
+    assert entry["url"].startswith("http://backend/api/callback/u/t/1?token=tok&traceparent=00-" + "c" * 32)
+    assert job["span_id"] in entry["url"]
+    service.outbox.pending.clear()
+    await service.stop()
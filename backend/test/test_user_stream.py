@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from backend.server.app import router as router_module
+from backend.server.app import token_manager
+from backend.server.app.task_manager import TaskManager, task_manager
+
+
+async def quick(payload):
+    await asyncio.sleep(0.02)
+    return {"status": "completed", "file_url": f"artifact://{payload['task_id']}"}
+
+
+def test_stream_follows_user_tasks_and_coalesces_updates():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("old", "u", {}, ["1"])
+        await manager.create_task("other", "someone-else", {}, ["1"])
+        stream = manager.open_stream("u")
+        await manager.create_task("new", "u", {}, ["1"])
+        first = await stream.next_batch()
+
+        # 消费方没有及时读取时，同一任务只保留最新快照
+        await manager.update_subtask_status("new", "1", "running")
+        await manager.update_subtask_status("old", "1", "running")
+        await manager.update_subtask_status("new", "1", "completed")
+        await asyncio.sleep(0)
+        second = await stream.next_batch()
+
+        assert manager.unsubscribe(stream, ["old", "other"]) == ["old"]
+        await manager.update_subtask_status("old", "1", "completed")
+        await manager.update_subtask_status("other", "1", "completed")
+        await asyncio.sleep(0)
+        assert not stream.pending
+
+        manager.close_stream(stream)
+        assert await stream.next_batch() == [] and manager.streams == {}
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [event["task_id"] for event in first] == ["old", "new"]
+    assert {event["task_id"]: event["status"]["1"]["status"] for event in second} == {"new": "completed", "old": "running"}
+
+
+def test_explicit_subscriptions_only_accept_own_tasks():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("a", "u", {}, ["1"])
+        await manager.create_task("b", "u", {}, ["1"])
+        await manager.create_task("x", "intruder", {}, ["1"])
+        stream = manager.open_stream("u", ["a"])
+        accepted = manager.subscribe(stream, ["b", "x", "missing"])
+        await stream.next_batch()
+        await manager.update_subtask_status("x", "1", "running")
+        await manager.update_subtask_status("b", "1", "completed")
+        await asyncio.sleep(0)
+        return accepted, await stream.next_batch(), stream.task_ids
+
+    accepted, batch, remaining = asyncio.run(scenario())
+    assert accepted == (["b"], ["x", "missing"])
+    assert [event["task_id"] for event in batch] == ["b"]
+    # 已结束的任务自动移出订阅
+    assert remaining == {"a"}
+
+
+def test_streams_only_see_their_tenant():
+    async def scenario():
+        manager = TaskManager()
+        await manager.create_task("mine", "u", {}, ["1"], tenant_id="key-a")
+        await manager.create_task("theirs", "u", {}, ["1"], tenant_id="key-b")
+        stream = manager.open_stream("u", tenant_id="key-a")
+        first = await stream.next_batch()
+        await manager.update_subtask_status("theirs", "1", "running")
+        await asyncio.sleep(0)
+        return first, dict(stream.pending), manager.subscribe(manager.open_stream("u", [], "key-a"), ["theirs"])
+
+    first, pending, subscribed = asyncio.run(scenario())
+    assert [event["task_id"] for event in first] == ["mine"]
+    assert pending == {} and subscribed == ([], ["theirs"])
+
+
+def make_client(monkeypatch):
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "test-secret")
+    agent_urls = {"quick": f"python:{__name__}:quick"}
+    app = FastAPI()
+    router_module.register_routes(app)
+    app.dependency_overrides[router_module.get_agent_urls_dependency] = lambda: agent_urls
+    monkeypatch.setattr(router_module, "AGENT_URLS", agent_urls)
+    return TestClient(app)
+
+
+def test_websocket_multiplexes_tasks_with_dynamic_subscription(monkeypatch):
+    with make_client(monkeypatch) as client:
+        started = [client.post("/api/start-task", json={"user_id": "ws-user", "input_data": {}, "agent_types": ["quick"]}).json()
+                   for _ in range(2)]
+        first, second = (item["task_id"] for item in started)
+        stream_token = started[0]["stream_token"]
+
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect(f"/api/ws/ws-user?token={started[0]['token']}") as websocket:
+                websocket.receive_json()
+
+        with client.websocket_connect(f"/api/ws/ws-user?token={stream_token}&tasks={first}") as websocket:
+            hello = websocket.receive_json()
+            assert hello["type"] == "stream"
+            websocket.send_json({"action": "subscribe", "task_ids": [second, "not-mine"]})
+
+            completed = set()
+            replies = []
+            while completed != {first, second}:
+                message = websocket.receive_json()
+                if "type" in message:
+                    replies.append(message)
+                elif message["completed"]:
+                    completed.add(message["task_id"])
+
+        assert replies == [{"type": "subscribed", "task_ids": [second], "rejected": ["not-mine"]}]
+        assert hello["stream_id"] not in task_manager.streams
+
+
+def test_subscribe_endpoints_require_stream_token(monkeypatch):
+    with make_client(monkeypatch) as client:
+        started = client.post("/api/start-task", json={"user_id": "sse-user", "input_data": {}, "agent_types": ["quick"]}).json()
+        stream = task_manager.open_stream("sse-user", [])
+        try:
+            url = f"/api/stream/sse-user/{stream.stream_id}"
+            denied = client.post(f"{url}/subscribe", params={"token": started["token"]}, json={"task_ids": [started["task_id"]]})
+            assert denied.status_code == 403
+            params = {"token": started["stream_token"]}
+            response = client.post(f"{url}/subscribe", params=params, json={"task_ids": [started["task_id"]]})
+            assert response.json() == {"subscribed": [started["task_id"]], "rejected": []}
+            assert client.post(f"{url}/unsubscribe", params=params, json={"task_ids": [started["task_id"]]}).status_code == 200
+            missing = client.post("/api/stream/sse-user/unknown/subscribe", params=params, json={"task_ids": []})
+            assert missing.status_code == 404
+
+            # 同名用户在另一个租户下提交：拿到的用户级令牌看不到前一个租户的任务
+            other = client.post("/api/start-task", json={"user_id": "sse-user", "input_data": {}, "agent_types": ["quick"],
+                                                         "tenant_id": "key-other"}).json()
+            other_params = {"token": other["stream_token"]}
+            assert client.get(f"/api/tasks/sse-user/{started['task_id']}", params=other_params).status_code == 404
+            assert client.get(f"/api/tasks/sse-user/{other['task_id']}", params=other_params).status_code == 200
+            listing = client.get("/api/tasks/sse-user", params=other_params).json()
+            assert [task["task_id"] for task in listing] == [other["task_id"]]
+            assert client.post(f"{url}/subscribe", params=other_params, json={"task_ids": []}).status_code == 404
+            legacy = token_manager.jwt.encode({"user_id": "sse-user", "scope": "stream"}, "test-secret", algorithm="HS256")
+            assert client.get(f"/api/tasks/sse-user/{started['task_id']}", params={"token": legacy}).status_code == 403
+        finally:
+            task_manager.close_stream(stream)
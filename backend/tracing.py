@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "1.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "4096"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "backend")
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> Optional["SpanContext"]:
+        match = TRACEPARENT.match(value.strip().lower()) if value else None
+        if not match:
+            return None
+        trace_id, span_id, flags = match.groups()
+        return cls(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+class Span(SpanContext):
+    """
+    一段计时区间。同一进程内的一棵子树（本地根 span 及其后代）结束时统一做尾部采样决策。
+    """
+
+    __slots__ = ("tracer", "parent_id", "name", "service", "start", "duration", "attributes", "error", "root",
+                 "_children", "_kept", "_has_error")
+
+    def __init__(self, tracer: "Tracer", name: str, service: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 root: Optional["Span"], attributes: Dict[str, Any]):
+        super().__init__(trace_id, f"{random.getrandbits(64):016x}", sampled)
+        self.tracer = tracer
+        self.parent_id = parent_id
+        self.name = name
+        self.service = service
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.root = root or self
+        self._children: List["Span"] = []
+        self._kept: Optional[bool] = None
+        self._has_error = False
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: Optional[str] = None):
+        if self.duration is not None:
+            return
+        if error:
+            self.error = error
+        self.duration = time.time() - self.start
+        self.tracer._on_end(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.service,
+            "start": self.start,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    进程内追踪：W3C traceparent 在 HTTP payload / 回调 URL 中传递，span 记录在固定容量的环形缓冲区里。
+    头部采样在新 trace 开始时按 sample_rate 决定；未被头部采样的子树在本地根结束时，
+    若耗时超过 slow_seconds 或包含错误仍会保留（尾部采样），以便定位 p99 的慢请求。
+    """
+
+    def __init__(self, service: str = TRACE_SERVICE_NAME, sample_rate: float = TRACE_SAMPLE_RATE,
+                 slow_seconds: float = TRACE_SLOW_SECONDS, buffer_size: int = TRACE_BUFFER_SIZE):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.spans: Deque[Span] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self.counters = {"kept": 0, "dropped": 0}
+
+    def start_span(self, name: str, parent: Union[None, str, SpanContext] = None, service: Optional[str] = None,
+                   **attributes) -> Span:
+        """
+        创建（但不激活）一个 span。parent 可以是 traceparent 字符串或 SpanContext，缺省为当前激活的 span。
+        """
+        if isinstance(parent, str):
+            parent = SpanContext.parse(parent)
+        if parent is None:
+            parent = _current.get()
+
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            return Span(self, name, service or self.service, trace_id, None, random.random() < self.sample_rate, None, attributes)
+        # 远端传入的上下文在本进程内开启一棵新的子树
+        root = parent.root if isinstance(parent, Span) else None
+        return Span(self, name, service or self.service, parent.trace_id, parent.span_id, parent.sampled, root, attributes)
+
+    @contextmanager
+    def span(self, name: str, parent: Union[None, str, SpanContext] = None, service: Optional[str] = None,
+             **attributes) -> Iterator[Span]:
+        current = self.start_span(name, parent, service, **attributes)
+        token = _current.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            current.end()
+
+    def _on_end(self, span: Span):
+        root = span.root
+        if span.error:
+            root._has_error = True
+        if span is not root:
+            if root._kept is None:
+                root._children.append(span)
+            elif root._kept or span.error or span.duration >= self.slow_seconds:
+                # 本地根已结束（后台任务中的晚到 span）：跟随根的决策，慢或出错的单独保留
+                self._keep([span])
+            return
+
+        keep = root.sampled or root._has_error or root.duration >= self.slow_seconds
+        root._kept = keep
+        if keep:
+            self._keep(root._children + [root])
+        else:
+            self.counters["dropped"] += 1 + len(root._children)
+        root._children = []
+
+    def _keep(self, spans: List[Span]):
+        with self._lock:
+            self.spans.extend(spans)
+            self.counters["kept"] += len(spans)
+
+    def export(self, trace_id: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self.spans)
+        if trace_id:
+            spans = [span for span in spans if span.trace_id == trace_id]
+        return [span.to_dict() for span in spans[-limit:]]
+
+    def traces(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        按 trace 汇总缓冲区中的 span，最近的在前，附带总耗时与耗时最长的 span。
+        """
+        with self._lock:
+            spans = list(self.spans)
+        grouped: Dict[str, List[Span]] = {}
+        for span in spans:
+            grouped.setdefault(span.trace_id, []).append(span)
+        summaries = []
+        for trace_id, items in grouped.items():
+            start = min(span.start for span in items)
+            end = max(span.start + (span.duration or 0.0) for span in items)
+            slowest = max(items, key=lambda span: span.duration or 0.0)
+            summaries.append({
+                "trace_id": trace_id,
+                "start": start,
+                "duration_ms": round((end - start) * 1000, 3),
+                "spans": len(items),
+                "slowest": {"name": slowest.name, "service": slowest.service, "duration_ms": round((slowest.duration or 0.0) * 1000, 3)},
+                "error": any(span.error for span in items),
+            })
+        summaries.sort(key=lambda summary: summary["start"], reverse=True)
+        return summaries[:limit]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current.get()
+    return span.traceparent if span is not None else None
+
+
+def with_traceparent(url: str, traceparent: Optional[str] = None) -> str:
+    """
+    在 URL query 中写入（或替换）traceparent，用于回调地址。
+    """
+    traceparent = traceparent or current_traceparent()
+    if not traceparent:
+        return url
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != "traceparent"]
+    query.append(("traceparent", traceparent))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+tracer = Tracer()
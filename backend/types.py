@@ -1,22 +1,37 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from enum import Enum
 
+class Priority(str, Enum):
+    interactive = "interactive"
+    standard = "standard"
+    batch = "batch"
+
 class StartTaskRequest(BaseModel):
     user_id: str
     input_data: Dict[str, Any]
     agent_types: List[str]
+    # {agent_type: [上游 agent_type, ...]}，上游全部完成后才派发；不填则所有 agent 并行
+    dependencies: Optional[Dict[str, List[str]]] = None
+    # 调度优先级与公平排队的租户（网关填入 API key 的摘要），不填租户时按 user_id 排队
+    priority: Priority = Priority.standard
+    tenant_id: Optional[str] = None
+    # 任务总时限（秒，从创建时起算）：到期后未完成的子任务被取消，agent 端据此中止进行中的 LLM 调用
+    deadline_seconds: Optional[float] = Field(None, gt=0)
 
 class AgentState(str, Enum):
     pending = "pending",
     processing = "running",
     completed = "completed",
     failed = "failed"
+    cancelled = "cancelled"
 
 class CallbackData(BaseModel):
     subtask_id: str
     status: AgentState
     file_url: Optional[str] = None
+    # 结构化产出，会随 file_url 一起传给下游 agent
+    result: Optional[Dict[str, Any]] = None
 
 class ToolChoice(str, Enum):
 
@@ -24,6 +39,19 @@ class ToolChoice(str, Enum):
     Auto = "auto",
     REQUIRED = "required"
 
+class ChunkType(str, Enum):
+    text = "text"
+    tool_call = "tool_call"
+    usage = "usage"
+
+class StreamChunk(BaseModel):
+    type: ChunkType
+    text: str = ""
+    # tool_call 增量: {"index", "id", "name", "arguments"}，arguments 为本次追加的片段
+    tool_call: Optional[Dict[str, Any]] = None
+    usage: Optional[Dict[str, int]] = None
+    finish_reason: Optional[str] = None
+
 if __name__ == "__main__":
     start_task = StartTaskRequest(user_id="user1", input_data={"1":2},agent_types=["agent1", "agent2"])
     print(start_task.model_dump_json())
\ No newline at end of file
@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class UsageRecord:
+    __slots__ = ("timestamp", "model_type", "model", "input_tokens", "output_tokens", "latency", "provider_reported")
+
+    def __init__(self, model_type: str, model: str, input_tokens: int, output_tokens: int, latency: float, provider_reported: bool):
+        self.timestamp = time.time()
+        self.model_type = model_type
+        self.model = model
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.latency = latency
+        self.provider_reported = provider_reported
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class UsageAggregator:
+    """
+    LLM 调用用量汇总：按 (model_type, model) 累加调用数 / token / 耗时，
+    并保留最近若干条记录用于计算吞吐，供成本与吞吐看板读取。
+    """
+
+    def __init__(self, recent: int = 4096):
+        self._lock = threading.Lock()
+        # [calls, input_tokens, output_tokens, latency_total, local_fallbacks]
+        self._totals: Dict[Tuple[str, str], List[float]] = {}
+        self._recent: Deque[UsageRecord] = deque(maxlen=recent)
+
+    def record(self, model_type: str, model: str, input_tokens: int, output_tokens: int, latency: float, provider_reported: bool = True) -> UsageRecord:
+        record = UsageRecord(model_type, model, input_tokens, output_tokens, latency, provider_reported)
+        with self._lock:
+            totals = self._totals.get((model_type, model))
+            if totals is None:
+                totals = self._totals[(model_type, model)] = [0, 0, 0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+            totals[3] += latency
+            if not provider_reported:
+                totals[4] += 1
+            self._recent.append(record)
+        return record
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = [(key, list(values)) for key, values in self._totals.items()]
+        return [
+            {
+                "model_type": model_type,
+                "model": model,
+                "calls": calls,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "avg_latency": latency_total / calls if calls else 0.0,
+                "local_fallbacks": local_fallbacks,
+            }
+            for (model_type, model), (calls, input_tokens, output_tokens, latency_total, local_fallbacks) in items
+        ]
+
+    def throughput(self, window: float = 60.0, now: Optional[float] = None) -> Dict[str, float]:
+        now = time.time() if now is None else now
+        since = now - window
+        calls = input_tokens = output_tokens = 0
+        with self._lock:
+            for record in reversed(self._recent):
+                if record.timestamp < since:
+                    break
+                calls += 1
+                input_tokens += record.input_tokens
+                output_tokens += record.output_tokens
+        return {
+            "calls_per_second": calls / window,
+            "input_tokens_per_second": input_tokens / window,
+            "output_tokens_per_second": output_tokens / window,
+        }
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            records = list(self._recent)[-limit:]
+        return [record.to_dict() for record in records]
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+
+usage_aggregator = UsageAggregator()
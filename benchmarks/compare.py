@@ -0,0 +1,132 @@
+"""
+比较 pytest-benchmark 的 JSON 结果与基线，任一基准的统计量变慢超过阈值时以非零码退出。
+
+    python -m benchmarks.compare --run                        # 运行基准并与基线比较
+    python -m benchmarks.compare --run --update               # 运行并把结果写为新基线
+    python -m benchmarks.compare --run -- -k sse              # "--" 之后的参数传给 pytest
+    python -m benchmarks.compare current.json                 # 只比较已有结果
+    python -m benchmarks.compare current.json --baseline other.json --threshold 0.1 --stat min
+
+--normalize 以 calibration 基准（纯 Python 循环）的耗时比例换算，减小不同机器之间的差异。
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import importlib.util
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baselines", "baseline.json")
+DEFAULT_RESULT = os.path.join(BENCHMARK_DIR, "results", "current.json")
+CALIBRATION = "test_calibration"
+
+
+def load(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {bench["fullname"]: bench for bench in data.get("benchmarks", [])}
+
+
+def _calibration(benchmarks: Dict[str, Dict[str, Any]], stat: str) -> Optional[float]:
+    for name, bench in benchmarks.items():
+        if name.rsplit("::", 1)[-1] == CALIBRATION:
+            return bench["stats"][stat]
+    return None
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], stat: str = "median",
+            threshold: float = 0.2, normalize: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    返回 (逐项对比行, 回归列表)。ratio = 当前 / 基线，大于 1 + threshold 视为回归；
+    只在一侧出现的基准单独列出，不算回归。
+    """
+    scale = 1.0
+    if normalize:
+        base_cal, cur_cal = _calibration(baseline, stat), _calibration(current, stat)
+        if base_cal and cur_cal:
+            scale = base_cal / cur_cal
+
+    rows, regressions = [], []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current or name not in baseline:
+            rows.append({"name": name, "baseline": baseline.get(name, {}).get("stats", {}).get(stat),
+                         "current": current.get(name, {}).get("stats", {}).get(stat), "ratio": None,
+                         "status": "new" if name in current else "missing"})
+            continue
+        before = baseline[name]["stats"][stat]
+        after = current[name]["stats"][stat] * scale
+        ratio = after / before if before else float("inf")
+        status = "ok"
+        if ratio > 1 + threshold:
+            status = "slower"
+            regressions.append(f"{name}: {stat} {before * 1e6:.2f}µs -> {after * 1e6:.2f}µs ({ratio:.2f}x)")
+        elif ratio < 1 - threshold:
+            status = "faster"
+        rows.append({"name": name, "baseline": before, "current": after, "ratio": ratio, "status": status})
+    return rows, regressions
+
+
+def format_table(rows: List[Dict[str, Any]], stat: str) -> str:
+    def cell(value: Optional[float]) -> str:
+        return f"{value * 1e6:12.2f}" if value is not None else f"{'-':>12}"
+
+    width = max([len(row["name"]) for row in rows] + [9])
+    lines = [f"{'benchmark':<{width}}  {'base µs':>12}  {'curr µs':>12}  {'ratio':>6}  status   ({stat})"]
+    for row in rows:
+        ratio = f"{row['ratio']:6.2f}" if row["ratio"] is not None else f"{'-':>6}"
+        lines.append(f"{row['name']:<{width}}  {cell(row['baseline'])}  {cell(row['current'])}  {ratio}  {row['status']}")
+    return "\n".join(lines)
+
+
+def run_benchmarks(output: str, pytest_args: List[str]) -> int:
+    if importlib.util.find_spec("pytest_benchmark") is None:
+        print("pytest-benchmark is not installed: pip install pytest-benchmark", file=sys.stderr)
+        return 2
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    env = dict(os.environ, RUN_BENCHMARKS="1")
+    command = [sys.executable, "-m", "pytest", BENCHMARK_DIR, "-q", f"--benchmark-json={output}", *pytest_args]
+    return subprocess.call(command, env=env)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare pytest-benchmark JSON results against a stored baseline.")
+    parser.add_argument("current", nargs="?", default=DEFAULT_RESULT, help="pytest-benchmark JSON to check")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--stat", default="median", choices=("min", "median", "mean", "max"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--normalize", action="store_true", help="scale by the calibration benchmark")
+    parser.add_argument("--run", action="store_true", help="run the benchmark suite first")
+    parser.add_argument("--update", action="store_true", help="store the current results as the new baseline")
+    # "--" 之后的参数原样传给 pytest，例如 --run -- -k sse --benchmark-min-rounds=20
+    argv = list(sys.argv[1:] if argv is None else argv)
+    pytest_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    if args.run:
+        code = run_benchmarks(args.current, pytest_args)
+        if code != 0:
+            print(f"benchmark run failed with exit code {code}", file=sys.stderr)
+            return code
+
+    if not os.path.exists(args.current):
+        print(f"no benchmark results at {args.current}", file=sys.stderr)
+        return 2
+
+    if args.update or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        shutil.copyfile(args.current, args.baseline)
+        print(f"baseline {'updated' if args.update else 'created'}: {args.baseline}")
+        return 0
+
+    rows, regressions = compare(load(args.baseline), load(args.current), args.stat, args.threshold, args.normalize)
+    print(format_table(rows, args.stat))
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+微基准（pytest-benchmark）。默认跳过，避免拖慢普通测试：
+
+    RUN_BENCHMARKS=1 pytest benchmarks --benchmark-json=benchmarks/results/current.json
+    python -m benchmarks.compare --run            # 运行并与 benchmarks/baselines/baseline.json 比较
+    python -m benchmarks.compare --run --update   # 接受当前结果为新基线
+
+未安装 pytest-benchmark 时各基准文件整体跳过（pip install pytest-benchmark）。
+"""
+import os
+import asyncio
+
+import pytest
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_BENCHMARKS") == "1":
+        return
+    skip = pytest.mark.skip(reason="benchmarks run only with RUN_BENCHMARKS=1")
+    for item in items:
+        if str(item.fspath).startswith(BENCHMARK_DIR):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def secret_key(monkeypatch):
+    from backend.server.app import token_manager
+
+    monkeypatch.setattr(token_manager, "SECRET_KEY", "benchmark-secret")
@@ -0,0 +1,417 @@
+"""
+本地压测：在同一进程里启动网关（accept）、后端（router）和替身 agent，按设定的到达率持续提交 /accept，
+同时保持最多 N 个 SSE 订阅，统计吞吐、延迟分位数、任务完成耗时、内存与文件描述符，输出 JSON 报告。
+
+    python -m benchmarks.loadtest --rate 20 --duration 30 --subscribers 50 --agents 3 --output report.json
+
+--accept-url 指向已部署的网关时只施压、不启动本地服务（SSE 地址取 --backend-url）。
+任务完成耗时与 completed_per_second 只统计拿到 SSE 订阅名额的任务。
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import importlib
+import resource
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from backend.logging_setup import configure_logging
+
+# 替身 agent 的处理耗时与失败率，由 main 根据命令行设置（进程内 agent 也读取这里）
+STUB_DELAY = (0.05, 0.2)
+STUB_FAILURE_RATE = 0.0
+
+
+async def stub_agent(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    进程内替身 agent（"python:benchmarks.loadtest:stub_agent"）：等待随机耗时后返回结果。
+    """
+    await asyncio.sleep(random.uniform(*STUB_DELAY))
+    if random.random() < STUB_FAILURE_RATE:
+        return {"status": "failed"}
+    return {"status": "completed", "file_url": f"stub://{payload['task_id']}", "result": {"stub": True}}
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # 非 Linux 退化为峰值 RSS（macOS 单位为字节，Linux 为 KiB）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_fds() -> Optional[int]:
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+def _free_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+class LocalServer:
+    """
+    在当前事件循环里运行一个 uvicorn 实例，监听随机端口。
+    """
+
+    def __init__(self, app, name: str):
+        self.name = name
+        self.socket = _free_socket()
+        self.port = self.socket.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, log_config=None, access_log=False, lifespan="on", timeout_keep_alive=30)
+        self.server = uvicorn.Server(config)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self.server.serve(sockets=[self.socket]))
+        while not self.server.started:
+            if self._task.done():
+                raise RuntimeError(f"{self.name} failed to start: {self._task.exception()}")
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        self.server.should_exit = True
+        if self._task:
+            await self._task
+        self.socket.close()
+
+
+class Stack:
+    """
+    本地网关 + 后端 + 替身 agent。模块级配置（回调地址、agent 地址、网关转发地址）在启动时改写指向随机端口。
+    """
+
+    def __init__(self, agents: int, agent_mode: str, journal_dir: str):
+        from backend.agents.outbox import CallbackOutbox
+        from backend.agents.runtime import AgentService
+        from backend.server.app import accept, router, token_manager
+
+        self.accept, self.router = accept, router
+        if not token_manager.SECRET_KEY:
+            token_manager.SECRET_KEY = os.urandom(16).hex()
+        # 网关默认每 IP 100 次/分钟，压测时全部请求来自同一地址
+        accept.limiter.enabled = False
+
+        backend = FastAPI()
+        router.register_routes(backend)
+        self.backend = LocalServer(backend, "backend")
+        self.gateway = LocalServer(accept.app, "gateway")
+
+        self.agent_types = [str(i + 1) for i in range(agents)]
+        self.agent_servers: List[LocalServer] = []
+        if agent_mode == "http":
+            for agent_type in self.agent_types:
+                service = AgentService(f"stub-{agent_type}", None,
+                                       outbox=CallbackOutbox(os.path.join(journal_dir, f"stub-{agent_type}.jsonl")))
+                service.handler = self._http_handler(service, agent_type)
+                self.agent_servers.append(LocalServer(service.app, f"agent {agent_type}"))
+            self.agent_urls = {t: f"{s.url}/agent" for t, s in zip(self.agent_types, self.agent_servers)}
+        else:
+            self.agent_urls = {t: "python:benchmarks.loadtest:stub_agent" for t in self.agent_types}
+
+    @staticmethod
+    def _http_handler(service, agent_type: str):
+        async def handler(data):
+            service.report(data, {"subtask_id": agent_type, **await stub_agent(data)})
+        return handler
+
+    async def start(self):
+        for server in self.agent_servers + [self.backend, self.gateway]:
+            await server.start()
+        self.router.CALLBACK_PATH = f"{self.backend.url}/api/callback"
+        self.router.AGENT_URLS = self.agent_urls
+        self.backend.server.config.app.dependency_overrides[self.router.get_agent_urls_dependency] = lambda: self.agent_urls
+        self.accept.BACKEND_API_URL = f"{self.backend.url}/api/start-task"
+
+    async def stop(self):
+        for server in [self.gateway, self.backend] + self.agent_servers:
+            await server.stop()
+
+
+class LoadRun:
+    def __init__(self, args: argparse.Namespace, accept_url: str, backend_url: str, agent_types: List[str]):
+        self.args = args
+        self.accept_url = accept_url
+        self.backend_url = backend_url
+        self.agent_types = agent_types
+        self.accept_latency: List[float] = []
+        self.completion: List[float] = []
+        self.first_event: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.counts = {"submitted": 0, "accepted": 0, "subscribed": 0, "completed": 0, "failed": 0, "timed_out": 0}
+        self.samples: List[Dict[str, Any]] = []
+        self.subscriber_slots = asyncio.Semaphore(args.subscribers)
+        self.open_subscribers = 0
+        self.peak_subscribers = 0
+        self._pending: set = set()
+
+    def _error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def submit(self, client: httpx.AsyncClient, index: int):
+        self.counts["submitted"] += 1
+        body = {
+            "user_id": f"load-{index % self.args.users}",
+            "input_data": {"seq": index, "padding": "x" * self.args.payload_bytes},
+            "agent_types": self.agent_types,
+            "priority": self.args.priority,
+        }
+        if self.args.chain:
+            body["dependencies"] = {t: [self.agent_types[i - 1]] for i, t in enumerate(self.agent_types) if i}
+        started = time.perf_counter()
+        try:
+            response = await client.post(self.accept_url, json=body, headers={"X-API-Key": self.args.api_key})
+        except httpx.HTTPError as e:
+            self._error(type(e).__name__)
+            return
+        self.accept_latency.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            self._error(f"http_{response.status_code}")
+            return
+        self.counts["accepted"] += 1
+        data = response.json()
+        # 订阅名额用满时不再订阅，只统计提交延迟
+        if self.subscriber_slots.locked():
+            return
+        async with self.subscriber_slots:
+            await self.subscribe(client, data["user_id"] or body["user_id"], data["task_id"], data["token"], started)
+
+    async def subscribe(self, client: httpx.AsyncClient, user_id: str, task_id: str, token: str, submitted_at: float):
+        self.counts["subscribed"] += 1
+        self.open_subscribers += 1
+        self.peak_subscribers = max(self.peak_subscribers, self.open_subscribers)
+        url = f"{self.backend_url}/api/sse/{user_id}/{task_id}"
+        first = True
+        try:
+            async with asyncio.timeout(self.args.task_timeout):
+                async with client.stream("GET", url, params={"token": token}, timeout=None) as response:
+                    if response.status_code != 200:
+                        self._error(f"sse_{response.status_code}")
+                        return
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[6:])
+                        if first:
+                            self.first_event.append(time.perf_counter() - submitted_at)
+                            first = False
+                        statuses = [agent["status"] for agent in event["status"].values()]
+                        if event.get("completed"):
+                            self.counts["completed"] += 1
+                            self.completion.append(time.perf_counter() - submitted_at)
+                            return
+                        # 有子任务失败时任务永远不会 completed，所有节点进入终态即结束订阅
+                        if all(status in ("completed", "failed") for status in statuses):
+                            self.counts["failed"] += 1
+                            return
+        except TimeoutError:
+            self.counts["timed_out"] += 1
+        except httpx.HTTPError as e:
+            self._error(f"sse_{type(e).__name__}")
+        finally:
+            self.open_subscribers -= 1
+
+    async def sample_resources(self, started: float):
+        while True:
+            self.samples.append({
+                "t": round(time.perf_counter() - started, 3),
+                "rss_bytes": rss_bytes(),
+                "open_fds": open_fds(),
+                "sse_subscribers": self.open_subscribers,
+                "pending_requests": len(self._pending),
+            })
+            await asyncio.sleep(self.args.sample_interval)
+
+    async def run(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.args.subscribers + 100)
+        async with httpx.AsyncClient(timeout=self.args.request_timeout, limits=limits) as client:
+            started = time.perf_counter()
+            sampler = asyncio.create_task(self.sample_resources(started))
+            index = 0
+            next_at = started
+            # 开环到达：按计划时刻提交，不等待前一个请求返回，服务变慢时排队会体现在延迟上
+            while next_at - started < self.args.duration:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(self.submit(client, index))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+                index += 1
+                gap = 1.0 / self.args.rate
+                next_at += random.expovariate(1.0 / gap) if self.args.arrival == "poisson" else gap
+            submit_seconds = time.perf_counter() - started
+
+            if self._pending:
+                await asyncio.wait(set(self._pending), timeout=self.args.drain_timeout)
+            for task in self._pending:
+                task.cancel()
+            elapsed = time.perf_counter() - started
+            sampler.cancel()
+            self.samples.append({"t": round(elapsed, 3), "rss_bytes": rss_bytes(), "open_fds": open_fds(),
+                                 "sse_subscribers": self.open_subscribers, "pending_requests": len(self._pending)})
+
+        fds = [sample["open_fds"] for sample in self.samples if sample["open_fds"] is not None]
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("api_key", "output")},
+            "elapsed_seconds": round(elapsed, 3),
+            "counts": self.counts,
+            "errors": self.errors,
+            "throughput": {
+                "offered_per_second": round(self.counts["submitted"] / submit_seconds, 3),
+                "accepted_per_second": round(self.counts["accepted"] / submit_seconds, 3),
+                "completed_per_second": round(self.counts["completed"] / elapsed, 3),
+            },
+            "accept_latency_ms": percentiles(self.accept_latency),
+            "first_event_ms": percentiles(self.first_event),
+            "time_to_completion_ms": percentiles(self.completion),
+            "sse": {"peak_subscribers": self.peak_subscribers},
+            "resources": {
+                "rss_start_bytes": self.samples[0]["rss_bytes"],
+                "rss_peak_bytes": max(sample["rss_bytes"] for sample in self.samples),
+                "rss_end_bytes": self.samples[-1]["rss_bytes"],
+                "fds_start": fds[0] if fds else None,
+                "fds_peak": max(fds) if fds else None,
+                "fds_end": fds[-1] if fds else None,
+            },
+            "samples": self.samples if self.args.samples else None,
+        }
+
+
+def check_thresholds(report: Dict[str, Any], args: argparse.Namespace) -> List[str]:
+    """
+    回归门槛：任一不满足时返回失败原因，main 以非零码退出，便于在 CI 中比较。
+    """
+    failures = []
+    p99 = report["accept_latency_ms"]["p99"]
+    if args.max_accept_p99_ms is not None and (p99 is None or p99 > args.max_accept_p99_ms):
+        failures.append(f"accept p99 {p99} ms > {args.max_accept_p99_ms} ms")
+    p99 = report["time_to_completion_ms"]["p99"]
+    if args.max_completion_p99_ms is not None and (p99 is None or p99 > args.max_completion_p99_ms):
+        failures.append(f"completion p99 {p99} ms > {args.max_completion_p99_ms} ms")
+    accepted = report["throughput"]["accepted_per_second"]
+    if args.min_throughput is not None and accepted < args.min_throughput:
+        failures.append(f"accepted {accepted}/s < {args.min_throughput}/s")
+    if args.max_error_rate is not None and report["counts"]["submitted"]:
+        rate = sum(report["errors"].values()) / report["counts"]["submitted"]
+        if rate > args.max_error_rate:
+            failures.append(f"error rate {rate:.3f} > {args.max_error_rate}")
+    return failures
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test the accept -> router -> agent -> SSE pipeline.")
+    parser.add_argument("--rate", type=float, default=10.0, help="task submissions per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of submissions")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--subscribers", type=int, default=20, help="max concurrent SSE subscribers")
+    parser.add_argument("--users", type=int, default=10, help="distinct user ids")
+    parser.add_argument("--agents", type=int, default=3, help="agent types per task")
+    parser.add_argument("--chain", action="store_true", help="run the agents as a linear dependency chain")
+    parser.add_argument("--priority", choices=("interactive", "standard", "batch"), default="standard")
+    parser.add_argument("--payload-bytes", type=int, default=256, help="size of input_data padding")
+    parser.add_argument("--agent-mode", choices=("http", "local"), default="http",
+                        help="stand-in agents as HTTP services or in-process python: entries")
+    parser.add_argument("--agent-delay", type=float, nargs=2, default=list(STUB_DELAY), metavar=("MIN", "MAX"),
+                        help="stand-in agent processing time range in seconds")
+    parser.add_argument("--agent-failure-rate", type=float, default=0.0)
+    parser.add_argument("--accept-url", help="target an already running gateway instead of starting one")
+    parser.add_argument("--backend-url", default="http://localhost:8000", help="backend for SSE with --accept-url")
+    parser.add_argument("--api-key", default=os.getenv("ALLOWED_API_KEYS", "secret123").split(",")[0])
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--task-timeout", type=float, default=60.0, help="max seconds to wait for one task over SSE")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="max seconds to wait after the last submission")
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--samples", action="store_true", help="include the resource time series in the report")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--max-accept-p99-ms", type=float)
+    parser.add_argument("--max-completion-p99-ms", type=float)
+    parser.add_argument("--min-throughput", type=float)
+    parser.add_argument("--max-error-rate", type=float)
+    return parser
+
+
+def configure_stub(delay, failure_rate: float):
+    # python -m 运行时本文件是 __main__，进程内 agent 导入的是 benchmarks.loadtest，两份都要设置
+    for module in {sys.modules[__name__], importlib.import_module("benchmarks.loadtest")}:
+        module.STUB_DELAY = tuple(delay)
+        module.STUB_FAILURE_RATE = failure_rate
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    configure_stub(args.agent_delay, args.agent_failure_rate)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.accept_url:
+        agent_types = [str(i + 1) for i in range(args.agents)]
+        return await LoadRun(args, args.accept_url, args.backend_url, agent_types).run()
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as journal_dir:
+        stack = Stack(args.agents, args.agent_mode, journal_dir)
+        await stack.start()
+        try:
+            report = await LoadRun(args, f"{stack.gateway.url}/accept", stack.backend.url, stack.agent_types).run()
+        finally:
+            await stack.stop()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    configure_logging(level=args.log_level)
+    report = asyncio.run(run(args))
+    failures = check_thresholds(report, args)
+    report["threshold_failures"] = failures
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_calibration(benchmark):
+    # 纯 Python 循环，作为机器速度参照（compare --normalize）
+    benchmark(lambda: sum(i * i for i in range(10_000)))
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+tiktoken = pytest.importorskip("tiktoken")
+
+from backend.llm import LLM
+
+HISTORY_SIZES = [10, 100, 1_000]
+SENTENCE = "医疗器械注册申报资料需要包含产品技术要求、风险分析与临床评价。 The device description covers intended use and materials. "
+
+
+@pytest.fixture(scope="module")
+def llm(tmp_path_factory):
+    try:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+    config = tmp_path_factory.mktemp("llm") / "config.toml"
+    config.write_text('[mock]\nmodel = "mock-1"\napi_key = "mock"\nbase_url = "http://127.0.0.1:8900/v1"\n')
+    instance = LLM(model_type="mock", config_path=str(config))
+    instance.tokenizer = encoding
+    return instance
+
+
+def history(size: int):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}: {SENTENCE * 3}"} for i in range(size)]
+
+
+@pytest.mark.parametrize("size", HISTORY_SIZES)
+def test_count_tokens_history(benchmark, llm, size):
+    messages = history(size)
+    total = benchmark(lambda: sum(llm.count_tokens(m["content"]) for m in messages))
+    assert total > size
+
+
+@pytest.mark.parametrize("size", HISTORY_SIZES)
+def test_check_token_limit_within_limit(benchmark, llm, size):
+    messages = history(size)
+    llm.token_limit = 10 ** 9
+    result = benchmark(lambda: llm._check_token_limit(list(messages)))
+    assert len(result) == size
+
+
+@pytest.mark.parametrize("size", HISTORY_SIZES)
+def test_check_token_limit_truncating(benchmark, llm, size):
+    # 只保留最近约 8k token，长历史需要逐条弹出
+    messages = history(size)
+    llm.token_limit = 8192
+    result = benchmark(lambda: llm._check_token_limit(list(messages)))
+    assert len(result) <= size
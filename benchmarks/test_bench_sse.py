@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.server.app.router import encode_sse
+from backend.server.app.task_manager import TaskManager
+
+
+def make_event(agents: int) -> dict:
+    status = {str(i): {"status": "completed", "file_url": f"http://127.0.0.1:8000/api/artifacts/{'ab' * 32}"} for i in range(agents)}
+    return {
+        "task_id": "6f1c2f4e-7d0a-4b55-9a3e-1d2c3b4a5f60",
+        "status": status,
+        "completed": True,
+        "pipeline": {
+            "nodes": {name: {"status": "completed", "queued_seconds": 0.012, "duration_seconds": 1.234} for name in status},
+            "critical_path": list(status),
+            "critical_path_seconds": 3.702,
+            "elapsed_seconds": 3.75,
+        },
+    }
+
+
+@pytest.mark.parametrize("agents", [3, 20])
+def test_encode_sse(benchmark, agents):
+    event = make_event(agents)
+    frame = benchmark(encode_sse, event)
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+
+
+@pytest.mark.parametrize("agents", [3, 20])
+def test_encode_sse_stdlib_json(benchmark, agents):
+    # 对照组：标准库 json 编码同一事件
+    event = make_event(agents)
+    benchmark(lambda: b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+
+
+@pytest.mark.parametrize("subscribers", [1, 100, 10_000])
+def test_broadcast_event(benchmark, loop, subscribers):
+    manager = TaskManager()
+    loop.run_until_complete(manager.create_task("task", "user", {}, ["1", "2", "3"]))
+    queues = [asyncio.Queue() for _ in range(subscribers)]
+    manager.sse_queues["task"] = queues
+
+    def drain():
+        for queue in queues:
+            while not queue.empty():
+                queue.get_nowait()
+
+    benchmark.pedantic(lambda: loop.run_until_complete(manager.broadcast_event("task")), setup=drain,
+                       rounds=50 if subscribers >= 10_000 else 200, warmup_rounds=1)
+    assert queues[-1].qsize() == 1
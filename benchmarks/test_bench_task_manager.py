@@ -0,0 +1,92 @@
+import gc
+import asyncio
+import itertools
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.server.app.task_manager import TaskManager
+
+AGENT_TYPES = ["1", "2", "3"]
+SIZES = [100, 1_000, 10_000, 100_000]
+USERS = 100
+BATCH = 100
+_ids = itertools.count()
+_filled = {}
+
+
+def filled_manager(loop, size: int) -> TaskManager:
+    """
+    预先装入 size 个任务（分属 USERS 个用户）；同一规模在模块内复用，10⁵ 规模只构建一次。
+    """
+    if size not in _filled:
+        manager = TaskManager()
+
+        async def fill():
+            for i in range(size):
+                await manager.create_task(f"seed-{i}", f"user-{i % USERS}", {"seq": i}, AGENT_TYPES)
+
+        loop.run_until_complete(fill())
+        _filled[size] = manager
+    return _filled[size]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_create_task(benchmark, loop, size):
+    manager = filled_manager(loop, size)
+
+    async def batch():
+        for _ in range(BATCH):
+            await manager.create_task(f"bench-{next(_ids)}", "user-0", {"seq": 0}, AGENT_TYPES)
+
+    benchmark.extra_info["ops_per_round"] = BATCH
+    benchmark(lambda: loop.run_until_complete(batch()))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_update_subtask_status(benchmark, loop, size):
+    manager = filled_manager(loop, size)
+    task_ids = [f"seed-{i}" for i in range(0, size, max(1, size // BATCH))][:BATCH]
+
+    async def batch():
+        for task_id in task_ids:
+            await manager.update_subtask_status(task_id, "1", "running")
+        # 让 update 派生的 broadcast 任务执行完，计入本轮耗时
+        await asyncio.sleep(0)
+
+    benchmark.extra_info["ops_per_round"] = len(task_ids)
+    benchmark(lambda: loop.run_until_complete(batch()))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_get_user_tasks(benchmark, loop, size):
+    manager = filled_manager(loop, size)
+    result = benchmark(manager.get_user_tasks, "user-1")
+    assert len(result) >= size // USERS
+
+
+def test_memory_per_task(benchmark, loop):
+    """
+    常驻内存中每个任务（含 input_data 与索引）占用的字节数，记录在 extra_info 中便于与基线对比。
+    """
+    count = 10_000
+
+    def measure():
+        manager = TaskManager()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            async def fill():
+                for i in range(count):
+                    await manager.create_task(f"mem-{i}", f"user-{i % USERS}", {"seq": i}, AGENT_TYPES)
+
+            loop.run_until_complete(fill())
+            return tracemalloc.get_traced_memory()[0] / count
+        finally:
+            tracemalloc.stop()
+
+    per_task = benchmark.pedantic(measure, rounds=3, iterations=1)
+    benchmark.extra_info["bytes_per_task"] = round(per_task)
+    assert per_task < 2048
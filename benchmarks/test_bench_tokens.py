@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.server.app.token_manager import create_access_token, verify_token
+
+
+def test_create_access_token(benchmark, secret_key):
+    token = benchmark(create_access_token, "task-1", "user-1")
+    assert token
+
+
+def test_verify_token(benchmark, secret_key):
+    token = create_access_token("task-1", "user-1")
+    assert benchmark(verify_token, token, "user-1", "task-1")
+
+
+def test_verify_token_mismatch(benchmark, secret_key):
+    token = create_access_token("task-1", "user-1")
+    assert not benchmark(verify_token, token, "user-2", "task-1")